@@ -9,3 +9,68 @@ class Config:
     MQTT_BROKER_PORT = int(os.getenv("MQTT_BROKER_PORT"))
     MQTT_TOPIC = os.getenv("MQTT_TOPIC")
     MONGODB_URI = os.getenv("MONGODB_URI")
+
+    # MQTT client mode: "thread" runs paho on its own network thread, "asyncio" runs it inside the app's event loop
+    MQTT_CLIENT_MODE = os.getenv("MQTT_CLIENT_MODE", "thread").lower()
+    # Maximum number of undelivered messages buffered per async message consumer; with this many messages
+    # waiting for the database, the async client pauses reading from the broker
+    MQTT_ASYNC_QUEUE_SIZE = int(os.getenv("MQTT_ASYNC_QUEUE_SIZE", "1000"))
+    # Comma separated "host:port" brokers tried in turn after MQTT_BROKER_URL fails
+    MQTT_FAILOVER_BROKERS = os.getenv("MQTT_FAILOVER_BROKERS", "")
+    # Jittered exponential backoff between connection attempts
+    MQTT_RECONNECT_MIN_DELAY_SECONDS = float(os.getenv("MQTT_RECONNECT_MIN_DELAY_SECONDS", "0.5"))
+    MQTT_RECONNECT_MAX_DELAY_SECONDS = float(os.getenv("MQTT_RECONNECT_MAX_DELAY_SECONDS", "30"))
+    # Publishes buffered while disconnected and flushed on reconnect, the oldest are dropped when full
+    MQTT_OFFLINE_QUEUE_SIZE = int(os.getenv("MQTT_OFFLINE_QUEUE_SIZE", "1000"))
+
+    # Simulated energy sessions published to the broker. Disable in production so no simulator runs at all.
+    SIMULATOR_ENABLED = os.getenv("SIMULATOR_ENABLED", "true").lower() == "true"
+    SIMULATOR_SESSIONS = int(os.getenv("SIMULATOR_SESSIONS", "1"))
+    SIMULATOR_INTERVAL_SECONDS = float(os.getenv("SIMULATOR_INTERVAL_SECONDS", "60"))
+    SIMULATOR_JITTER_SECONDS = float(os.getenv("SIMULATOR_JITTER_SECONDS", "0"))
+    # Missed publishes replayed per session after a stall; older missed ticks are skipped
+    SIMULATOR_MAX_CATCH_UP = int(os.getenv("SIMULATOR_MAX_CATCH_UP", "1"))
+    # Topic for each simulated session, "{session_id}" is substituted. Defaults to MQTT_TOPIC.
+    SIMULATOR_TOPIC_TEMPLATE = os.getenv("SIMULATOR_TOPIC_TEMPLATE")
+
+    # Bulk HTTP ingestion: documents per insert_many call, item size limit and how many item errors are reported
+    BATCH_WRITE_SIZE = int(os.getenv("BATCH_WRITE_SIZE", "1000"))
+    BATCH_MAX_ITEM_BYTES = int(os.getenv("BATCH_MAX_ITEM_BYTES", str(64 * 1024)))
+    BATCH_MAX_REPORTED_ERRORS = int(os.getenv("BATCH_MAX_REPORTED_ERRORS", "100"))
+
+    # Logging goes through a background queue. LOG_FORMAT is "json" or "text".
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # 0 writes synchronously
+    # Per-message ingest logs: level, fraction kept (0-1) and maximum per second (0 = unlimited)
+    LOG_MESSAGE_LEVEL = os.getenv("LOG_MESSAGE_LEVEL", "INFO").upper()
+    LOG_MESSAGE_SAMPLE_RATE = float(os.getenv("LOG_MESSAGE_SAMPLE_RATE", "1.0"))
+    LOG_MESSAGE_RATE_LIMIT = float(os.getenv("LOG_MESSAGE_RATE_LIMIT", "0"))
+
+    # Ingest profiler: per-stage timings, a flight recorder of messages slower than the threshold,
+    # and an on-demand sampling CPU profiler limited to PROFILER_CPU_MAX_SECONDS
+    PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "true").lower() == "true"
+    PROFILER_SLOW_THRESHOLD_MS = float(os.getenv("PROFILER_SLOW_THRESHOLD_MS", "50"))
+    PROFILER_FLIGHT_RECORDER_SIZE = int(os.getenv("PROFILER_FLIGHT_RECORDER_SIZE", "100"))
+    PROFILER_CPU_MAX_SECONDS = float(os.getenv("PROFILER_CPU_MAX_SECONDS", "60"))
+    PROFILER_CPU_INTERVAL_MS = float(os.getenv("PROFILER_CPU_INTERVAL_MS", "5"))
+
+    # Maximum number of entries returned by one incremental sync request
+    SYNC_MAX_LIMIT = int(os.getenv("SYNC_MAX_LIMIT", "10000"))
+
+    # Per-session derivation of interval deltas and power. Up to DERIVATION_REORDER_WINDOW messages per session
+    # are held back (about DERIVATION_MAX_DELAY_SECONDS, checked every second) to restore their order; 0 stores
+    # every message at once and flags out-of-order ones as late. A duration drop starts a new segment when the
+    # counters restarted from zero or the next message continues from the dropped one.
+    DERIVATION_REORDER_WINDOW = int(os.getenv("DERIVATION_REORDER_WINDOW", "0"))
+    DERIVATION_MAX_DELAY_SECONDS = float(os.getenv("DERIVATION_MAX_DELAY_SECONDS", "5"))
+    DERIVATION_SESSION_TTL_SECONDS = float(os.getenv("DERIVATION_SESSION_TTL_SECONDS", "3600"))
+
+    # Message storage partitioning: "none" (single messages collection), "charger", "month" or "charger_month".
+    # Month partitions can be dropped with DatabaseClient.drop_partitions_before.
+    PARTITION_STRATEGY = os.getenv("PARTITION_STRATEGY", "none").lower()
+
+    # Record every received MQTT message to this append-only capture file for replay (unset to disable),
+    # recording stops once the file reaches CAPTURE_MAX_BYTES (0 for no limit)
+    CAPTURE_PATH = os.getenv("CAPTURE_PATH")
+    CAPTURE_MAX_BYTES = int(os.getenv("CAPTURE_MAX_BYTES", str(1024 ** 3)))
@@ -0,0 +1,238 @@
+import atexit
+import logging
+import queue
+import random
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+import orjson
+from app.config import Config
+
+# Logger for the per-message logs on the ingest hot path, sampled and rate limited separately from everything else
+MESSAGE_LOGGER_NAME = "app.ingest.messages"
+
+# Attributes every LogRecord has, anything else on a record was passed through `extra`
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def _extra_fields(record: logging.LogRecord) -> Dict[str, Any]:
+    return {key: value for key, value in record.__dict__.items() if key not in _RECORD_ATTRIBUTES}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line, including any fields passed through `extra`.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._cached_second: Optional[int] = None
+        self._cached_time: str = ""
+
+    def formatTime(self, record: logging.LogRecord, datefmt: Optional[str] = None) -> str:
+        # strftime is the most expensive part of formatting, only redo it when the second changes
+        second = int(record.created)
+        if second != self._cached_second:
+            self._cached_second = second
+            self._cached_time = time.strftime("%Y-%m-%dT%H:%M:%S", self.converter(record.created))
+        return f"{self._cached_time}.{int(record.msecs):03d}"
+
+    def format(self, record: logging.LogRecord) -> str:
+        document = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **_extra_fields(record),
+        }
+        if record.exc_info:
+            document["exception"] = self.formatException(record.exc_info)
+        return orjson.dumps(document, default=str).decode()
+
+
+class TextFormatter(logging.Formatter):
+    """
+    The standard text format, with any fields passed through `extra` appended as JSON.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        extra = _extra_fields(record)
+        if extra:
+            text = f"{text} {orjson.dumps(extra, default=str).decode()}"
+        return text
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    A QueueHandler that leaves all formatting to the listener thread.
+
+    The standard QueueHandler formats the message on the calling thread so records can be pickled, which is
+    not needed for an in-process queue. When the queue is full records are dropped and counted rather than
+    blocking the caller.
+    """
+
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self.dropped: int = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BatchingQueueListener(QueueListener):
+    """
+    A QueueListener that drains the queue in batches, pausing `flush_interval` seconds between batches.
+
+    The standard listener wakes up for every record, and under load that constant hand-off of the GIL
+    between the ingest thread and the listener costs more than the formatting itself.
+    """
+
+    def __init__(self, log_queue: queue.Queue, *handlers: logging.Handler, flush_interval: float = 0.05) -> None:
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.flush_interval = flush_interval
+
+    def enqueue_sentinel(self) -> None:
+        # The queue is bounded, wait for room instead of failing when it's full at shutdown
+        self.queue.put(self._sentinel)
+
+    def _monitor(self) -> None:
+        while True:
+            record = self.dequeue(True)
+            while record is not self._sentinel:
+                self.handle(record)
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if record is self._sentinel:
+                return
+            time.sleep(self.flush_interval)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a random `sample_rate` fraction of records, and at most `max_per_second` of those per second.
+
+    The token bucket is not locked; a race between threads can at worst let an extra record through.
+    """
+
+    def __init__(self, sample_rate: float = 1.0, max_per_second: float = 0.0) -> None:
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.max_per_second = max_per_second
+        self._tokens = max_per_second
+        self._last_refill = time.monotonic()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return self.allow()
+
+    def allow(self) -> bool:
+        """
+        Decides whether the next record should be kept, without needing the record itself.
+        """
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        if self.max_per_second <= 0:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self.max_per_second, self._tokens + (now - self._last_refill) * self.max_per_second)
+        self._last_refill = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+_listener: Optional[QueueListener] = None
+_handler: Optional[logging.Handler] = None
+_lock = threading.Lock()
+_message_logger = logging.getLogger(MESSAGE_LOGGER_NAME)
+_message_sampler = SamplingFilter()
+
+
+def message_log_enabled() -> bool:
+    """
+    Checks the level, sampling and rate limit for one per-message log before any record is created.
+    Per-message call sites use this as their guard, so dropped logs cost no record or formatting work.
+    """
+    return _message_logger.isEnabledFor(logging.INFO) and _message_sampler.allow()
+
+
+def dropped_log_records() -> int:
+    """
+    Returns how many records were dropped because the log queue was full since logging was last configured.
+    """
+    return _handler.dropped if isinstance(_handler, DeferredQueueHandler) else 0
+
+
+def _stop_listener() -> None:
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    dropped = dropped_log_records()
+    if dropped:
+        # The queue is no longer drained, hand the warning straight to the output handlers
+        _listener.handle(logging.getLogger(__name__).makeRecord(
+            __name__, logging.WARNING, __file__, 0, "%d log records were dropped because the log queue was full",
+            (dropped,), None))
+    _listener = None
+
+
+def configure_logging(stream=None) -> Optional[BatchingQueueListener]:
+    """
+    Routes all logging through a bounded queue drained by a background listener thread, so callers
+    only pay for creating the record. Per-message ingest logs are sampled and rate limited.
+    With LOG_QUEUE_SIZE=0 records are written synchronously instead.
+
+    Safe to call more than once; the previous listener is stopped and replaced.
+
+    :param stream: Stream the logs are written to, defaults to the process's original stderr.
+    :return: The running listener, or None when logging synchronously.
+    """
+    global _listener, _handler, _message_sampler
+    with _lock:
+        _stop_listener()
+
+        output = logging.StreamHandler(stream or sys.__stderr__)
+        if Config.LOG_FORMAT == "json":
+            output.setFormatter(JsonFormatter())
+        else:
+            output.setFormatter(TextFormatter("%(levelname)s:%(name)s:%(message)s"))
+
+        root = logging.getLogger()
+        if _handler is not None:
+            root.removeHandler(_handler)
+        if Config.LOG_QUEUE_SIZE > 0:
+            log_queue: queue.Queue = queue.Queue(maxsize=Config.LOG_QUEUE_SIZE)
+            _handler = DeferredQueueHandler(log_queue)
+            _listener = BatchingQueueListener(log_queue, output)
+            _listener.start()
+        else:
+            _handler = output
+        root.addHandler(_handler)
+        root.setLevel(Config.LOG_LEVEL)
+
+        _message_logger.setLevel(Config.LOG_MESSAGE_LEVEL)
+        _message_sampler = SamplingFilter(Config.LOG_MESSAGE_SAMPLE_RATE, Config.LOG_MESSAGE_RATE_LIMIT)
+        return _listener
+
+
+def shutdown_logging() -> None:
+    """
+    Stops the listener after writing out any queued records, and a warning if any records were dropped.
+    """
+    with _lock:
+        _stop_listener()
+
+
+atexit.register(shutdown_logging)
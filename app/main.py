@@ -4,13 +4,16 @@ import os
 import logging
 from fastapi import FastAPI, HTTPException
 from app.config import Config
+from app.logging_config import configure_logging
 from contextlib import asynccontextmanager
 from .services.mqtt_client import MQTTClient
+from .services.async_mqtt_client import AsyncMQTTClient
 from .routes.v1.api import router as v1_router
 from .routes.v1.health_check import router as health_router
+from .routes.v1.debug import router as debug_router
 
-# Configure the logging
-logging.basicConfig(level=logging.INFO)
+# Configure the logging, records are written out by a background listener thread
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Retrieve MQTT broker configuration
@@ -18,9 +21,11 @@ mqtt_broker_url = Config.MQTT_BROKER_URL
 mqtt_broker_port = Config.MQTT_BROKER_PORT
 mqtt_topic = Config.MQTT_TOPIC
 
-# Initialize and configure the MQTT client
-mqtt_client = MQTTClient(broker=mqtt_broker_url,
-                         port=mqtt_broker_port, topic=mqtt_topic)
+# Initialize and configure the MQTT client, either on its own network thread or inside the app's event loop
+async_mqtt_mode = Config.MQTT_CLIENT_MODE == "asyncio"
+mqtt_client_class = AsyncMQTTClient if async_mqtt_mode else MQTTClient
+mqtt_client = mqtt_client_class(broker=mqtt_broker_url,
+                                port=mqtt_broker_port, topic=mqtt_topic)
 
 
 @asynccontextmanager
@@ -34,7 +39,10 @@ async def lifespan(app: FastAPI):
     """
     try:
         logger.info("Starting MQTT client...")
-        mqtt_client.start()
+        if async_mqtt_mode:
+            await mqtt_client.start()
+        else:
+            mqtt_client.start()
 
         yield
 
@@ -47,7 +55,10 @@ async def lifespan(app: FastAPI):
     finally:
         # Clean up and release the resources on app shutdown
         logger.info("Shutting down MQTT client...")
-        mqtt_client.stop()
+        if async_mqtt_mode:
+            await mqtt_client.stop()
+        else:
+            mqtt_client.stop()
 
 app = FastAPI(
     lifespan=lifespan,
@@ -91,3 +102,4 @@ app = FastAPI(
 # Include routers for different endpoints
 app.include_router(v1_router, prefix="/api/v1")
 app.include_router(health_router, prefix="/api/v1")
+app.include_router(debug_router, prefix="/api/v1")
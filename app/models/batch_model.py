@@ -0,0 +1,41 @@
+from typing import List
+from pydantic import BaseModel
+
+
+class BatchItemError(BaseModel):
+    """
+    Model representing a rejected item of a batch ingestion request:
+    index: Zero-based position of the item in the request body.
+    error: Human readable description of why the item was rejected.
+    """
+    index: int
+    error: str
+
+
+class BatchIngestResponse(BaseModel):
+    """
+    Model representing the outcome of a batch ingestion request:
+    received: Number of items read from the request body.
+    accepted: Number of items validated and stored.
+    rejected: Number of items that failed validation.
+    errors: Per-item errors, limited to the first BATCH_MAX_REPORTED_ERRORS rejected items.
+    errors_truncated: True if more items were rejected than are listed in errors.
+    """
+    received: int = 0
+    accepted: int = 0
+    rejected: int = 0
+    errors: List[BatchItemError] = []
+    errors_truncated: bool = False
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "received": 3,
+                "accepted": 2,
+                "rejected": 1,
+                "errors": [
+                    {"index": 1, "error": "payload.energy_delivered_in_kWh: Input should be a valid number"}
+                ],
+                "errors_truncated": False
+            }
+        }
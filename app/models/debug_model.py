@@ -0,0 +1,82 @@
+from typing import Dict, List, Optional
+from pydantic import BaseModel
+
+
+class StageStats(BaseModel):
+    """
+    Latency statistics for one ingest stage, in microseconds. Percentiles are accurate to within 25%.
+    """
+    count: int
+    mean_us: float
+    p50_us: float
+    p90_us: float
+    p99_us: float
+    max_us: float
+
+
+class SlowMessage(BaseModel):
+    """
+    A message recorded by the flight recorder with the time spent in each ingest stage.
+    """
+    topic: str
+    received_at: str
+    total_us: float
+    stages: Dict[str, float]
+
+
+class StackSample(BaseModel):
+    """
+    A collapsed call stack ("module:function:line;...", outermost first) and how often it was sampled.
+    """
+    stack: str
+    samples: int
+
+
+class CpuProfile(BaseModel):
+    """
+    State and results of the sampling CPU profiler.
+    """
+    running: bool
+    started_at: Optional[str] = None
+    seconds: float = 0
+    samples: int = 0
+    stacks: List[StackSample] = []
+
+
+class IngestProfileResponse(BaseModel):
+    """
+    Snapshot of the ingest profiler:
+    enabled: Whether per-stage timing is active.
+    stages: Latency statistics per ingest stage, plus the total.
+    slowest: Recent messages slower than PROFILER_SLOW_THRESHOLD_MS, slowest first.
+    cpu_profile: The most recent sampling CPU profile.
+    dropped_log_records: Log records dropped because the log queue was full.
+    """
+    enabled: bool
+    stages: Dict[str, StageStats]
+    slowest: List[SlowMessage]
+    cpu_profile: CpuProfile
+    dropped_log_records: int = 0
+
+
+class ConnectivityResponse(BaseModel):
+    """
+    Connection state and recovery metrics of the MQTT client:
+    connected, broker: Whether the client is connected and to which broker ("host:port").
+    connects, reconnects, disconnects, connect_failures: Event counts since startup.
+    disconnected_seconds: How long the current outage has lasted, if disconnected.
+    last_reconnect_seconds, max_reconnect_seconds: Time from losing a connection to the next CONNACK.
+    offline_queued, offline_dropped, offline_flushed: Publishes buffered while disconnected.
+    """
+    connected: bool
+    broker: Optional[str] = None
+    connects: int
+    reconnects: int
+    disconnects: int
+    connect_failures: int
+    disconnected_seconds: Optional[float] = None
+    last_reconnect_seconds: Optional[float] = None
+    max_reconnect_seconds: Optional[float] = None
+    offline_queued: int
+    offline_dropped: int
+    offline_flushed: int
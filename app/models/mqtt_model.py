@@ -1,4 +1,5 @@
 from pydantic import BaseModel, Field
+from typing import List
 from bson import ObjectId, Optional
 
 
@@ -16,6 +17,31 @@ class Payload(BaseModel):
     session_cost_in_cents: int
 
 
+class DerivedMetrics(BaseModel):
+    """
+    A model representing the fields derived from consecutive messages of the same session:
+    interval_seconds, interval_energy_kWh, interval_cost_in_cents: Deltas since the previous message.
+    power_kW: Average power over the interval.
+    samples, mean_power_kW, stddev_power_kW, max_power_kW: Running statistics of power_kW for the session.
+    counter_reset: The cumulative counters restarted, deltas are taken from zero.
+    regression: Energy or cost decreased without a reset.
+    late: Older than a message already stored, no deltas are computed.
+    reordered: Arrived after a newer message of the same session.
+    """
+    interval_seconds: Optional[int] = None
+    interval_energy_kWh: Optional[float] = None
+    interval_cost_in_cents: Optional[int] = None
+    power_kW: Optional[float] = None
+    samples: Optional[int] = None
+    mean_power_kW: Optional[float] = None
+    stddev_power_kW: Optional[float] = None
+    max_power_kW: Optional[float] = None
+    counter_reset: bool = False
+    regression: bool = False
+    late: bool = False
+    reordered: bool = False
+
+
 class PyObjectId(ObjectId):
     """
     Custom type for handling BSON ObjectId for Pydantic models.
@@ -48,11 +74,13 @@ class LogEntry(BaseModel):
     timestamp: String representing the timestamp of the log entry.
     topic: String representing the log topic.
     payload: Payload object representing the log payload.
+    derived: DerivedMetrics object with the per-session derived fields, set when the entry is stored.
     """
     id: Optional[PyObjectId] = Field(None, alias="_id")
     timestamp: str
     topic: str
     payload: Payload
+    derived: Optional[DerivedMetrics] = None
 
     class Config:
         arbitrary_types_allowed = True
@@ -70,6 +98,41 @@ class LogEntry(BaseModel):
                     "energy_delivered_in_kWh": 30.12,
                     "duration_in_seconds": 45,
                     "session_cost_in_cents": 70
+                },
+                "derived": {
+                    "interval_seconds": 15,
+                    "interval_energy_kWh": 0.05,
+                    "interval_cost_in_cents": 2,
+                    "power_kW": 12.0,
+                    "samples": 3,
+                    "mean_power_kW": 11.5,
+                    "stddev_power_kW": 0.41,
+                    "max_power_kW": 12.0,
+                    "counter_reset": False,
+                    "regression": False,
+                    "late": False,
+                    "reordered": False
                 }
             }
         }
+
+
+class MessageChanges(BaseModel):
+    """
+    Model representing one page of the incremental sync feed:
+    entries: Log entries stored after the requested watermark, oldest first.
+    watermark: The _id to pass as `since` on the next request.
+    has_more: True if more entries are available right away.
+    """
+    entries: List[LogEntry]
+    watermark: Optional[str] = None
+    has_more: bool
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "entries": [LogEntry.Config.schema_extra["example"]],
+                "watermark": "6585fdf275bc18953fe35770",
+                "has_more": False
+            }
+        }
@@ -1,13 +1,42 @@
 import logging
-from typing import List
-from fastapi import APIRouter, HTTPException, status
-from ...services.database_client import DatabaseClient
-from ...models.mqtt_model import LogEntry
+import orjson
+from typing import List, Optional
+from bson import ObjectId
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response, status
+from ...config import Config
+from ...services.database_client import DatabaseClient, DatabaseError
+from ...services.ingest import BatchIngestor, MalformedBodyError, iter_json_array_items, iter_ndjson_items
+from ...services.change_tracker import change_tracker, etag_matches
+from ...models.mqtt_model import LogEntry, MessageChanges
+from ...models.batch_model import BatchIngestResponse
 
 router = APIRouter()
 db_client = DatabaseClient()
 logger = logging.getLogger(__name__)
 
+# Filters on the stored timestamp accept any prefix of "YYYY-MM-DD HH:MM:SS" down to the month
+TIMESTAMP_PREFIX_PATTERN = r"^\d{4}-\d{2}(-\d{2}( \d{2}(:\d{2}(:\d{2})?)?)?)?$"
+
+
+def trusted_json_response(content, etag: Optional[str] = None) -> Response:
+    """
+    Serializes documents that were already validated at ingest straight to JSON bytes, skipping the
+    LogEntry round trip and FastAPI's response_model validation. ObjectIds are converted with str().
+
+    :param content: Documents read from the database, or a structure containing them.
+    :param etag: ETag of the data the documents were read at.
+    :return: A JSON response with the encoded documents.
+    """
+    headers = {"ETag": etag} if etag else None
+    return Response(content=orjson.dumps(content, default=str), media_type="application/json", headers=headers)
+
+
+def not_modified_response(etag: str) -> Response:
+    """
+    Builds the 304 response for a client whose cached copy is still current.
+    """
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
 
 @router.get(
     "/messages",
@@ -16,7 +45,9 @@ logger = logging.getLogger(__name__)
     description=(
         "Fetches a list of all energy session logs stored in the database. "
         "Each log entry contains details about energy consumption, session duration, and cost. "
-        "Data is simulated and updated every minute, reflecting real-time energy usage by various devices."
+        "Data is simulated and updated every minute, reflecting real-time energy usage by various devices. "
+        "Optionally filter by `charger` id and by a `start` (inclusive) and `end` (exclusive) timestamp or "
+        "timestamp prefix such as 2024-01; with partitioned storage only the matching partitions are queried."
     ),
     responses={
         200: {
@@ -29,6 +60,7 @@ logger = logging.getLogger(__name__)
                 }
             }
         },
+        304: {"description": "Not Modified, nothing was stored since the ETag in If-None-Match"},
         500: {
             "description": "Internal Server Error",
             "content": {
@@ -39,20 +71,200 @@ logger = logging.getLogger(__name__)
         }
     }
 )
-def get_all_messages():
+def get_all_messages(charger: Optional[str] = None,
+                     start: Optional[str] = Query(None, pattern=TIMESTAMP_PREFIX_PATTERN),
+                     end: Optional[str] = Query(None, pattern=TIMESTAMP_PREFIX_PATTERN),
+                     if_none_match: Optional[str] = Header(None)):
     """
     Retrieve a list of all log messages.
 
     Returns:
-        List[LogEntry]: A list of LogEntry objects containing log messages.
+        List[LogEntry]: A list of LogEntry objects containing log messages, or 304 Not Modified if
+        nothing was stored since the ETag sent in If-None-Match.
+
+    Raises:
+        HTTPException:
+            - 500 Internal Server Error: If there is an issue with the database connection.
+    """
+    # Take the ETag before querying, so a write racing the query makes the next poll fetch again
+    etag = change_tracker.etag("messages", charger, start, end)
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag)
+    try:
+        messages = db_client.get_all_messages(charger=charger, start=start, end=end)
+        # Documents are validated before they are stored, so serve them without re-validating
+        return trusted_json_response(messages, etag)
+    except Exception as e:
+        logger.exception(f"Internal Server Error. {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal Server Error. Please try again later.")
+
+
+@router.get(
+    "/messages/changes",
+    response_model=MessageChanges,
+    summary="Retrieve Energy Session Logs Incrementally",
+    description=(
+        "Returns only the log entries stored after the `since` watermark, oldest first, together with the "
+        "watermark to send on the next request. Omit `since` on the first request. Polling clients should also "
+        "send the ETag of their previous response in If-None-Match, which is answered with 304 Not Modified "
+        "without touching the database when nothing was stored in the meantime. Accepts the same `charger`, "
+        "`start` and `end` filters as /messages."
+    ),
+    responses={
+        200: {
+            "description": "Successful Response",
+            "content": {
+                "application/json": {
+                    "example": MessageChanges.Config.schema_extra["example"]
+                }
+            }
+        },
+        304: {"description": "Not Modified, nothing was stored since the ETag in If-None-Match"},
+        400: {
+            "description": "Invalid Watermark",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Invalid watermark, expected the _id of a message."}
+                }
+            }
+        },
+        500: {
+            "description": "Internal Server Error",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Internal Server Error. Please try again later."}
+                }
+            }
+        }
+    }
+)
+def get_message_changes(since: Optional[str] = None,
+                        limit: int = Query(1000, gt=0, le=Config.SYNC_MAX_LIMIT),
+                        charger: Optional[str] = None,
+                        start: Optional[str] = Query(None, pattern=TIMESTAMP_PREFIX_PATTERN),
+                        end: Optional[str] = Query(None, pattern=TIMESTAMP_PREFIX_PATTERN),
+                        if_none_match: Optional[str] = Header(None)):
+    """
+    Retrieve log messages stored after a watermark.
+
+    Returns:
+        MessageChanges: The new entries and the next watermark, or 304 Not Modified if nothing was
+        stored since the ETag sent in If-None-Match.
 
     Raises:
         HTTPException:
+            - 400 Bad Request: If the watermark is not a valid message _id.
             - 500 Internal Server Error: If there is an issue with the database connection.
     """
+    if since is not None and not ObjectId.is_valid(since):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid watermark, expected the _id of a message.")
+
+    # The next page of a has_more response has a new `since`, so it never matches the previous ETag
+    etag = change_tracker.etag("changes", since, limit, charger, start, end)
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag)
     try:
-        messages = db_client.get_all_messages()
-        return [LogEntry(**message).model_dump(by_alias=True) for message in messages]
+        # Stop below any write still in flight so the watermark never moves past an uncommitted entry
+        entries = db_client.get_messages_since(
+            ObjectId(since) if since else None, limit, before=change_tracker.visible_before(),
+            charger=charger, start=start, end=end)
+        watermark = str(entries[-1]["_id"]) if entries else since
+        return trusted_json_response(
+            {"entries": entries, "watermark": watermark, "has_more": len(entries) == limit}, etag)
+    except Exception as e:
+        logger.exception(f"Internal Server Error. {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal Server Error. Please try again later.")
+
+
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/x-jsonlines")
+
+
+@router.post(
+    "/messages/batch",
+    response_model=BatchIngestResponse,
+    summary="Ingest Energy Session Logs in Bulk",
+    description=(
+        "Validates and stores many energy session logs in one request, for HTTP gateways and historical backfills. "
+        "The body is either a JSON array or NDJSON (one object per line) of items with a `topic`, a `payload` and an "
+        "optional `timestamp` formatted as YYYY-MM-DD HH:MM:SS. Items are validated against the same models as "
+        "messages received over MQTT, invalid items are reported individually and valid ones are stored with bulk "
+        "writes. The body is processed as it streams in, so requests with tens of thousands of items are handled in "
+        "constant memory."
+    ),
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "example": [
+                        {
+                            "topic": LogEntry.Config.schema_extra["example"]["topic"],
+                            "payload": LogEntry.Config.schema_extra["example"]["payload"]
+                        }
+                    ]
+                },
+                "application/x-ndjson": {"schema": {"type": "string"}}
+            }
+        }
+    },
+    responses={
+        200: {
+            "description": "Successful Response",
+            "content": {
+                "application/json": {
+                    "example": BatchIngestResponse.Config.schema_extra["example"]
+                }
+            }
+        },
+        400: {
+            "description": "Malformed Request Body",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Malformed request body after 2 stored items. Expected ',' or ']' after item 1"}
+                }
+            }
+        },
+        500: {
+            "description": "Internal Server Error",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Database write failed after 500 stored items. Please try again later."}
+                }
+            }
+        }
+    }
+)
+async def ingest_message_batch(request: Request):
+    """
+    Ingest a batch of log messages sent as a JSON array or NDJSON.
+
+    Returns:
+        BatchIngestResponse: Counts of received, accepted and rejected items plus per-item errors.
+
+    Raises:
+        HTTPException:
+            - 400 Bad Request: If the body can't be parsed. Items before the error are already stored.
+            - 500 Internal Server Error: If there is an issue with the database connection. A failed write
+              reports how many items were stored before it failed.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    parse_items = iter_ndjson_items if content_type in NDJSON_MEDIA_TYPES else iter_json_array_items
+    items = parse_items(request.stream(), Config.BATCH_MAX_ITEM_BYTES)
+    ingestor = BatchIngestor(db_client)
+    try:
+        return await ingestor.ingest(items)
+    except MalformedBodyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Malformed request body after {ingestor.stored} stored items. {str(e)}")
+    except DatabaseError as e:
+        logger.exception(f"Internal Server Error. {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Database write failed after {ingestor.stored} stored items. Please try again later.")
     except Exception as e:
         logger.exception(f"Internal Server Error. {str(e)}")
         raise HTTPException(
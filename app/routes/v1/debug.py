@@ -0,0 +1,102 @@
+from fastapi import APIRouter, HTTPException, Query, status
+from ...config import Config
+from ...logging_config import dropped_log_records
+from ...models.debug_model import ConnectivityResponse, CpuProfile, IngestProfileResponse
+from ...services.connectivity import connectivity_metrics
+from ...services.ingest_profiler import ingest_profiler
+
+router = APIRouter(prefix="/debug")
+
+
+@router.get(
+    "/ingest-profile",
+    response_model=IngestProfileResponse,
+    summary="Ingest Hot-Path Profile",
+    description=(
+        "Returns latency statistics for each stage of MQTT message ingest (UTF-8 decode, JSON parsing, validation, "
+        "document dump, session derivation, database insert and logging), the most recent messages slower than "
+        "PROFILER_SLOW_THRESHOLD_MS with their per-stage breakdown, the latest sampling CPU profile and how many log "
+        "records were dropped because the log queue was full."
+    ),
+)
+def get_ingest_profile():
+    """
+    Retrieve the ingest profiler snapshot.
+
+    Returns:
+        IngestProfileResponse: Stage statistics, slowest recent messages, CPU profile and dropped log records.
+    """
+    return {**ingest_profiler.snapshot(), "dropped_log_records": dropped_log_records()}
+
+
+@router.post(
+    "/ingest-profile/cpu",
+    response_model=CpuProfile,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Start a Sampling CPU Profile",
+    description=(
+        "Starts sampling the stacks of all threads for the given number of seconds, capped at "
+        "PROFILER_CPU_MAX_SECONDS. Results appear in the cpu_profile field of the ingest profile."
+    ),
+    responses={
+        409: {
+            "description": "A CPU profile is already running",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "A CPU profile is already running."}
+                }
+            }
+        }
+    }
+)
+def start_cpu_profile(seconds: float = Query(10, gt=0)):
+    """
+    Start the sampling CPU profiler for a bounded window.
+
+    Returns:
+        CpuProfile: The state of the newly started profile.
+
+    Raises:
+        HTTPException:
+            - 409 Conflict: If a profile is already running.
+    """
+    if not ingest_profiler.cpu_profiler.start(min(seconds, Config.PROFILER_CPU_MAX_SECONDS)):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="A CPU profile is already running.")
+    return ingest_profiler.cpu_profiler.snapshot()
+
+
+@router.delete(
+    "/ingest-profile/cpu",
+    response_model=CpuProfile,
+    summary="Stop the Sampling CPU Profile",
+    description="Stops a running CPU profile early, keeping the samples collected so far.",
+)
+def stop_cpu_profile():
+    """
+    Stop the sampling CPU profiler.
+
+    Returns:
+        CpuProfile: The collected profile.
+    """
+    ingest_profiler.cpu_profiler.stop()
+    return ingest_profiler.cpu_profiler.snapshot()
+
+
+@router.get(
+    "/mqtt-connectivity",
+    response_model=ConnectivityResponse,
+    summary="MQTT Connectivity Metrics",
+    description=(
+        "Returns the MQTT connection state, reconnect and failover counts, how long recovering from the last "
+        "lost connection took, and the publishes buffered, dropped and flushed while disconnected."
+    ),
+)
+def get_mqtt_connectivity():
+    """
+    Retrieve the MQTT connectivity metrics.
+
+    Returns:
+        ConnectivityResponse: Connection state and recovery metrics.
+    """
+    return connectivity_metrics.snapshot()
@@ -0,0 +1,321 @@
+import paho.mqtt.client as mqtt
+import asyncio
+import socket
+from typing import Any, AsyncIterator, Optional, Set
+from .mqtt_client import MQTTClient
+from ..config import Config
+from app.models.mqtt_model import LogEntry
+from .simulator_scheduler import build_simulator_scheduler
+
+# Sentinel pushed to consumer queues to end their iteration on shutdown
+_STOP = object()
+# Queued for the persistence task once a second, to store messages held back for reordering that expired
+_RELEASE_EXPIRED = object()
+
+
+class AsyncMQTTClient(MQTTClient):
+    """
+    An MQTT client that runs paho's socket I/O inside the asyncio event loop instead of a background thread.
+
+    Paho's socket callbacks are used to register the broker socket with the event loop, so reads, writes and
+    keepalive handling all happen on the loop. Validated messages are delivered to any number of consumers
+    through the `messages()` async iterator, and periodic publishing runs as a cancellable task. Reconnects,
+    failover and offline publish buffering work as in MQTTClient, driven by a connection task.
+
+    Persistence has its own queue that never drops: once `queue_size` messages are waiting for the
+    database, reading from the broker pauses until half of them are stored, like the thread client blocking
+    its network loop. Only `messages()` consumers that fall behind lose their oldest messages.
+
+    Attributes:
+        broker (str): The address of the MQTT broker.
+        port (int): The port number of the MQTT broker.
+        topic (str): The MQTT topic to subscribe to and publish messages.
+        queue_size (int): Maximum number of undelivered messages buffered per consumer, and the number of
+            messages waiting for the database at which reading from the broker pauses.
+    """
+
+    def __init__(self, broker: str, port: int, topic: str, queue_size: int = Config.MQTT_ASYNC_QUEUE_SIZE) -> None:
+        """
+        Initialize the asyncio MQTT client with broker details and topic.
+
+        Args:
+            broker (str): The address of the MQTT broker.
+            port (int): The port number of the MQTT broker.
+            topic (str): The MQTT topic to subscribe to.
+            queue_size (int): Maximum number of undelivered messages buffered per consumer.
+        """
+        super().__init__(broker, port, topic)
+        self.queue_size: int = queue_size
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscribers: Set[asyncio.Queue] = set()
+        # Consumer queues that were full on stop(), their iterators end once drained
+        self._closed_subscribers: Set[asyncio.Queue] = set()
+        self._persist_queue: asyncio.Queue = asyncio.Queue()
+        self._persist_task: Optional[asyncio.Task] = None
+        self._reading_paused: bool = False
+        self._tasks: Set[asyncio.Task] = set()
+        self._misc_task: Optional[asyncio.Task] = None
+        self._connection_lost: Optional[asyncio.Event] = None
+
+        # Hand the socket over to the event loop instead of paho's own network thread
+        self.client.on_socket_open = self.on_socket_open
+        self.client.on_socket_close = self.on_socket_close
+        self.client.on_socket_register_write = self.on_socket_register_write
+        self.client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def on_socket_open(self, client: mqtt.Client, userdata: Any, sock: socket.socket) -> None:
+        """
+        Callback for when paho opens the broker socket. Registers it for reading and starts the keepalive task.
+        """
+        def register() -> None:
+            self.loop.add_reader(sock, client.loop_read)
+            self._reading_paused = False
+            self._misc_task = self.loop.create_task(self._misc_loop())
+
+        # connect() may run in an executor thread, so always marshal onto the loop
+        self.loop.call_soon_threadsafe(register)
+
+    def on_socket_close(self, client: mqtt.Client, userdata: Any, sock: socket.socket) -> None:
+        """
+        Callback for when paho closes the broker socket. Unregisters it and stops the keepalive task.
+        """
+        def unregister() -> None:
+            self.loop.remove_reader(sock)
+            self.loop.remove_writer(sock)
+            if self._misc_task is not None:
+                self._misc_task.cancel()
+                self._misc_task = None
+
+        self.loop.call_soon_threadsafe(unregister)
+
+    def on_socket_register_write(self, client: mqtt.Client, userdata: Any, sock: socket.socket) -> None:
+        """
+        Callback for when paho has outgoing data queued. Registers the socket for writing.
+        """
+        self.loop.call_soon_threadsafe(
+            self.loop.add_writer, sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client: mqtt.Client, userdata: Any, sock: socket.socket) -> None:
+        """
+        Callback for when paho's outgoing queue is drained. Unregisters the socket for writing.
+        """
+        self.loop.call_soon_threadsafe(self.loop.remove_writer, sock)
+
+    def on_disconnect(self, client: mqtt.Client, userdata: Any, rc: int) -> None:
+        """
+        Callback for when the connection to the broker is closed. Wakes the connection task to reconnect.
+        """
+        super().on_disconnect(client, userdata, rc)
+        if self.running and self._connection_lost is not None:
+            self.loop.call_soon_threadsafe(self._connection_lost.set)
+
+    async def _misc_loop(self) -> None:
+        """
+        Runs paho's periodic housekeeping (keepalive pings, retries) once per second while the socket is open.
+        """
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+    def on_message(self, client: mqtt.Client, userdata: Any, message: mqtt.MQTTMessage) -> None:
+        """
+        Callback for when a PUBLISH message is received from the broker. Runs on the event loop.
+        Validated entries are queued for persistence and fanned out to every active `messages()` consumer.
+
+        Args:
+            client (mqtt.Client): The client instance for this callback.
+            userdata (Any): The private user data as set in Client() or user_data_set().
+            message (mqtt.MQTTMessage): An instance of MQTTMessage. This is a class with members topic, payload, qos, retain.
+        """
+        if self.recorder is not None:
+            self.record_message(message)
+        # Only the decode, json and validate stages are profiled here, storage happens in persist_messages
+        timer = self.profiler.start(message.topic)
+        try:
+            log_entry = self.parse_message(message, timer)
+            if log_entry is None:
+                return
+
+            self._persist_queue.put_nowait(log_entry)
+            if self._persist_queue.qsize() >= self.queue_size and not self._reading_paused:
+                self._pause_reading()
+            for queue in self._subscribers:
+                self._offer(queue, log_entry)
+        except Exception as e:
+            # Handle any exceptions that might occur during message processing
+            self.logger.exception(f"Error processing message: {str(e)}")
+        finally:
+            timer.finish()
+
+    def _offer(self, queue: asyncio.Queue, item: Any) -> None:
+        """
+        Puts an item on a consumer queue, dropping the oldest buffered item if the consumer has fallen behind.
+        """
+        if queue.full():
+            queue.get_nowait()
+            self.logger.warning("Async MQTT consumer is falling behind, dropping oldest message")
+        queue.put_nowait(item)
+
+    def _pause_reading(self) -> None:
+        """
+        Stops reading from the broker socket, so unread messages wait in the socket buffers instead of memory.
+        """
+        sock = self.client.socket()
+        if self.loop is not None and sock is not None:
+            self.loop.remove_reader(sock)
+            self._reading_paused = True
+            if self.running:
+                self.logger.warning("Database writes are falling behind, pausing reads from the broker")
+
+    def _resume_reading(self) -> None:
+        """
+        Starts reading from the broker socket again once the persistence queue has drained to half its size.
+        """
+        sock = self.client.socket()
+        self._reading_paused = False
+        if sock is not None:
+            self.loop.add_reader(sock, self.client.loop_read)
+
+    async def messages(self) -> AsyncIterator[LogEntry]:
+        """
+        Asynchronously iterates over validated messages as they arrive. Every consumer receives every message.
+        Iteration ends when the client is stopped.
+
+        Yields:
+            LogEntry: The validated log entry for each received message.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        try:
+            while queue not in self._closed_subscribers or not queue.empty():
+                item = await queue.get()
+                if item is _STOP:
+                    return
+                yield item
+        finally:
+            self._subscribers.discard(queue)
+            self._closed_subscribers.discard(queue)
+
+    async def persist_messages(self) -> None:
+        """
+        Consumes the persistence queue, derives the per-session fields and saves each entry to the database
+        without blocking the event loop. Derivation happens here rather than in `on_message`, so `messages()`
+        consumers receive the entries as they arrived. Returns once the queue is drained on shutdown.
+        """
+        while True:
+            log_entry = await self._persist_queue.get()
+            if log_entry is _STOP:
+                return
+            if self._reading_paused and self.running and self._persist_queue.qsize() <= self.queue_size // 2:
+                self._resume_reading()
+            try:
+                if log_entry is _RELEASE_EXPIRED:
+                    documents = self.deriver.release_expired()
+                else:
+                    documents = self.deriver.push(log_entry.model_dump(exclude_none=True))
+                await asyncio.to_thread(self.store_documents, documents)
+                for document in documents:
+                    self.log_received(document)
+            except Exception as e:
+                self.logger.exception(f"Error persisting message: {str(e)}")
+
+    def _spawn(self, coro) -> asyncio.Task:
+        """
+        Creates a task that is tracked so it can be cancelled on shutdown.
+        """
+        task = self.loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def start(self) -> None:
+        """
+        Starts the connection, persistence and publishing tasks in the running event loop.
+        """
+        try:
+            self.running = True
+            self.loop = asyncio.get_running_loop()
+            self._connection_lost = asyncio.Event()
+            self.open_recorder()
+            self._persist_task = self._spawn(self.persist_messages())
+            if self.deriver.reorder_window > 0:
+                self._spawn(self.release_expired_periodically())
+            self._spawn(self.maintain_connection())
+        except Exception as e:
+            # Handle connection-related exceptions and log the error
+            self.logger.exception(f"MQTT Client Error: {str(e)}")
+            return
+        try:
+            # A misconfigured simulator must not keep the client from ingesting
+            self.scheduler = build_simulator_scheduler(self.topic)
+            if self.scheduler is not None:
+                self._spawn(self.publish_message_periodically())
+        except Exception as e:
+            self.logger.exception(f"Simulator Error: {str(e)}")
+
+    async def maintain_connection(self) -> None:
+        """
+        Connects to the broker and reconnects with backoff whenever the connection is lost, failing over to
+        the next broker when one can't be reached or refuses the connection. Unexpected errors are logged and
+        retried after the backoff. Runs until cancelled.
+        """
+        while self.running:
+            self._connection_lost.clear()
+            try:
+                # connect() does a blocking DNS lookup and TCP handshake, so keep it off the loop
+                if await self.loop.run_in_executor(None, self.connect_broker):
+                    await self._connection_lost.wait()
+                    self.connectivity.mark_disconnected()
+                    if not self._acknowledged:
+                        self.next_broker()
+            except Exception as e:
+                self.connectivity.mark_disconnected()
+                self.connectivity.mark_connect_failure()
+                self.logger.exception(f"MQTT connection error: {str(e)}")
+            await asyncio.sleep(self.backoff.next_delay())
+
+    async def release_expired_periodically(self) -> None:
+        """
+        Asks the persistence task once a second to store the messages held back for reordering that have
+        expired. Going through its queue keeps the derivation engine on a single consumer and the writes in order.
+        """
+        while True:
+            await asyncio.sleep(1)
+            self._persist_queue.put_nowait(_RELEASE_EXPIRED)
+
+    async def publish_message_periodically(self) -> None:
+        """
+        Publishes the simulated sessions on their configured schedule. Cancelling the task stops it immediately.
+        """
+        await self.scheduler.run_async(self.publish_simulated_payload)
+
+    async def stop(self) -> None:
+        """
+        Cancels the background tasks, stores every message already received, ends all message iterators and
+        disconnects from the broker.
+        """
+        try:
+            self.running = False
+            self._pause_reading()
+            background = [task for task in self._tasks if task is not self._persist_task]
+            for task in background:
+                task.cancel()
+            await asyncio.gather(*background, return_exceptions=True)
+            # Let the persistence task store everything queued before it, then the messages still held back
+            # by the derivation engine
+            self._persist_queue.put_nowait(_STOP)
+            if self._persist_task is not None:
+                await asyncio.gather(self._persist_task, return_exceptions=True)
+            for queue in list(self._subscribers):
+                # A full queue has no waiting consumer, mark it closed rather than evicting a message
+                if queue.full():
+                    self._closed_subscribers.add(queue)
+                else:
+                    queue.put_nowait(_STOP)
+            await asyncio.to_thread(self.store_documents, self.deriver.flush())
+            self.close_recorder()
+            self.client.disconnect()
+            # Flush the DISCONNECT packet now rather than waiting for the writer callback
+            self.client.loop_write()
+        except Exception as e:
+            # Handle disconnection-related exceptions and log the error
+            self.logger.exception(f"MQTT Disconnect Error: {str(e)}")
@@ -0,0 +1,92 @@
+import hashlib
+import itertools
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+from bson import ObjectId
+
+
+class ChangeTracker:
+    """
+    Tracks writes to the messages collection made by this process, for ETags and incremental sync.
+
+    Every write bumps `version`, so an ETag derived from it changes whenever new data is stored and
+    polling clients can be answered with 304 without querying the database. The ETag also carries a
+    random instance id, so a restart never reuses a previous ETag, and a digest of the query it answers.
+
+    Only writes made through this process are counted. Anything else writing to the same database, such as
+    another API replica or `helpers/replay_capture.py --target ingest`, doesn't change the ETag, so clients
+    keep getting 304 for data that is in fact stale until this process stores something itself.
+
+    Document _ids are generated by pymongo in this process, so they increase monotonically. A write that
+    is still in flight may commit after a later _id is already visible, so readers of the changes feed
+    must stop below `visible_before()` to never skip past it.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._instance = uuid.uuid4().hex[:12]
+        self._tokens = itertools.count()
+        self._in_flight: Dict[int, ObjectId] = {}
+        self.version: int = 0
+
+    @contextmanager
+    def writing(self) -> Iterator[None]:
+        """
+        Marks a write as in flight until the block exits. Any _id generated inside the block is greater
+        than the ObjectId taken here, which is what `visible_before()` reports.
+        """
+        with self._lock:
+            token = next(self._tokens)
+            self._in_flight[token] = ObjectId()
+        try:
+            yield
+        finally:
+            # Bump even on failure, an unordered bulk write may have stored part of the batch
+            with self._lock:
+                del self._in_flight[token]
+                self.version += 1
+
+    def visible_before(self) -> Optional[ObjectId]:
+        """
+        Returns the lowest _id of any write still in flight, or None if there is none.
+        """
+        with self._lock:
+            return min(self._in_flight.values(), default=None)
+
+    def etag(self, *query) -> str:
+        """
+        Returns a weak ETag that changes whenever a write completes.
+
+        :param query: Identifies the representation, e.g. the endpoint and its normalized query parameters,
+            so responses to different queries never share an ETag.
+        """
+        digest = hashlib.blake2b(repr(query).encode(), digest_size=6).hexdigest()
+        return f'W/"{self._instance}-{self.version}-{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Checks an If-None-Match header against an ETag using weak comparison.
+
+    :param if_none_match: The header value, e.g. '"a", W/"b"' or '*'.
+    :param etag: The current ETag.
+    :return: True if the client's cached representation is still current.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+# Shared by every DatabaseClient in the process, since the API and the MQTT client each have their own
+change_tracker = ChangeTracker()
@@ -0,0 +1,162 @@
+import collections
+import random
+import threading
+import time
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from ..config import Config
+
+# (topic, payload, qos, retain) of a publish made while the broker was unreachable
+OfflinePublish = Tuple[str, str, int, bool]
+
+
+def parse_brokers(broker: str, port: int, failover: str = Config.MQTT_FAILOVER_BROKERS) -> List[Tuple[str, int]]:
+    """
+    Builds the list of brokers to connect to: the primary broker first, then the failover brokers.
+
+    :param broker: The primary broker address.
+    :param port: The primary broker port.
+    :param failover: Comma separated "host" or "host:port" entries, the port defaults to the primary port.
+    :return: A list of (host, port) pairs.
+    """
+    brokers = [(broker, port)]
+    for entry in failover.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        host, _, entry_port = entry.rpartition(":") if ":" in entry else (entry, "", "")
+        brokers.append((host, int(entry_port) if entry_port else port))
+    return brokers
+
+
+class ReconnectBackoff:
+    """
+    Exponential backoff with jitter. The first retry after a lost connection comes after about `min_delay`,
+    and each further failure doubles the delay up to `max_delay`. Half of each delay is randomized so a fleet
+    of clients doesn't reconnect in lockstep after a broker restart.
+    """
+
+    def __init__(self, min_delay: float = Config.MQTT_RECONNECT_MIN_DELAY_SECONDS,
+                 max_delay: float = Config.MQTT_RECONNECT_MAX_DELAY_SECONDS,
+                 rng: Optional[random.Random] = None) -> None:
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.rng = rng or random.Random()
+        self.attempts = 0
+
+    def next_delay(self) -> float:
+        """
+        Returns the delay before the next attempt and counts the attempt.
+        """
+        delay = min(self.max_delay, self.min_delay * 2 ** min(self.attempts, 32))
+        self.attempts += 1
+        return delay / 2 + self.rng.uniform(0, delay / 2)
+
+    def reset(self) -> None:
+        self.attempts = 0
+
+
+class ConnectivityMetrics:
+    """
+    Connection state and recovery metrics of the MQTT client.
+
+    Reconnect time is measured from losing an established connection to the broker acknowledging the next
+    one, including any failed attempts and failovers in between.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.connected: bool = False
+        self.broker: Optional[str] = None
+        self.connects: int = 0
+        self.reconnects: int = 0
+        self.disconnects: int = 0
+        self.connect_failures: int = 0
+        self.last_reconnect_seconds: Optional[float] = None
+        self.max_reconnect_seconds: Optional[float] = None
+        self.offline_queued: int = 0
+        self.offline_dropped: int = 0
+        self.offline_flushed: int = 0
+        self._disconnected_at: Optional[float] = None
+
+    def mark_connected(self, broker: str) -> None:
+        with self._lock:
+            if self._disconnected_at is not None:
+                seconds = self.clock() - self._disconnected_at
+                self._disconnected_at = None
+                self.reconnects += 1
+                self.last_reconnect_seconds = round(seconds, 3)
+                self.max_reconnect_seconds = round(max(seconds, self.max_reconnect_seconds or 0), 3)
+            self.connects += 1
+            self.connected = True
+            self.broker = broker
+
+    def mark_disconnected(self) -> None:
+        with self._lock:
+            if self.connected:
+                self.connected = False
+                self.disconnects += 1
+                self._disconnected_at = self.clock()
+
+    def mark_connect_failure(self) -> None:
+        with self._lock:
+            self.connect_failures += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            downtime = self.clock() - self._disconnected_at if self._disconnected_at is not None else None
+            return {
+                "connected": self.connected,
+                "broker": self.broker,
+                "connects": self.connects,
+                "reconnects": self.reconnects,
+                "disconnects": self.disconnects,
+                "connect_failures": self.connect_failures,
+                "disconnected_seconds": round(downtime, 3) if downtime is not None else None,
+                "last_reconnect_seconds": self.last_reconnect_seconds,
+                "max_reconnect_seconds": self.max_reconnect_seconds,
+                "offline_queued": self.offline_queued,
+                "offline_dropped": self.offline_dropped,
+                "offline_flushed": self.offline_flushed,
+            }
+
+
+class OfflinePublishQueue:
+    """
+    A bounded buffer for publishes made while disconnected. When full, the oldest publish is dropped.
+    Not thread safe, callers hold their publish lock.
+    """
+
+    def __init__(self, metrics: ConnectivityMetrics, max_size: int = Config.MQTT_OFFLINE_QUEUE_SIZE) -> None:
+        self.metrics = metrics
+        self._messages: Deque[OfflinePublish] = collections.deque(maxlen=max_size)
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def append(self, message: OfflinePublish) -> None:
+        if len(self._messages) == self._messages.maxlen:
+            self.metrics.offline_dropped += 1
+        self._messages.append(message)
+        self.metrics.offline_queued = len(self._messages)
+
+    def drain(self) -> List[OfflinePublish]:
+        messages = list(self._messages)
+        self._messages.clear()
+        self.metrics.offline_queued = 0
+        return messages
+
+    def requeue(self, messages: List[OfflinePublish]) -> None:
+        """
+        Puts publishes that could not be flushed back at the front, ahead of anything queued since.
+        """
+        overflow = len(self._messages) + len(messages) - self._messages.maxlen
+        if overflow > 0:
+            # extendleft discards from the newest end when the queue is full
+            self.metrics.offline_dropped += overflow
+        self._messages.extendleft(reversed(messages))
+        self.metrics.offline_queued = len(self._messages)
+
+
+# Shared by the MQTT client, which updates it, and the debug API, which reads it
+connectivity_metrics = ConnectivityMetrics()
@@ -1,26 +1,46 @@
 import os
+import heapq
+import itertools
 import logging
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
+from bson import ObjectId
+from typing import Dict, List, Optional
 from ..config import Config
+from .change_tracker import change_tracker
+from .partitioning import PartitionScheme, build_message_filter, parse_month
+
+
+# Fields returned to API clients, _id is included by default
+MESSAGE_PROJECTION = {"timestamp": 1, "topic": 1, "payload": 1, "derived": 1}
 
 
 class DatabaseError(Exception):
-    """Custom exception for database-related errors."""
-    pass
+    """Custom exception for database-related errors. `inserted` counts the messages a failed write still stored."""
+
+    def __init__(self, message: str, inserted: int = 0) -> None:
+        super().__init__(message)
+        self.inserted = inserted
 
 
 class DatabaseClient:
     """
     A database client for performing operations on a MongoDB database.
     It initializes a connection to the database using a URI obtained from environment variables.
+
+    Messages are stored in the 'messages' collection, or in collections partitioned by charger and/or month
+    when PARTITION_STRATEGY is set. Reads then only query the partitions matching their filters and merge
+    the results by _id.
     """
 
-    def __init__(self):
+    def __init__(self, partitions: Optional[PartitionScheme] = None):
         """
         Initializes the database client and connects to the default database specified in MONGODB_URI.
+        :param partitions: The partition scheme, defaults to the configured PARTITION_STRATEGY.
         """
         try:
             self.logger = logging.getLogger(__name__)
+            self.partitions = partitions or PartitionScheme()
             self.client = MongoClient(Config.MONGODB_URI)
             self.db = self.client.get_default_database()
         except Exception as e:
@@ -28,30 +48,149 @@ class DatabaseClient:
             self.logger.exception(f"Database Connection Error: {str(e)}")
             raise ConnectionError(f"Database Connection Error: {str(e)}")
 
+    def _collection(self, name: str):
+        # Equivalent to self.db[name], message collection names never start with an underscore
+        return getattr(self.db, name)
+
+    def _partitions_for(self, charger: Optional[str], start: Optional[str], end: Optional[str]) -> List[str]:
+        names = self.db.list_collection_names() if self.partitions.enabled else []
+        return self.partitions.select(names, charger, start, end)
+
     def save_message(self, message: dict) -> None:
         """
-        Saves a message to the 'messages' collection in the database.
+        Saves a message to its collection in the database.
         :param message: A dictionary representing the message to be saved.
         """
         try:
-            self.db.messages.insert_one(message)
+            with change_tracker.writing():
+                self._collection(self.partitions.collection_for(message)).insert_one(message)
         except Exception as e:
             # Handle insertion-related exceptions and log the error
             self.logger.exception(f"Database Insertion Error: {str(e)}")
             raise DatabaseError(f"Database Insertion Error: {str(e)}")
 
-    def get_all_messages(self) -> list:
+    def save_messages(self, messages: list) -> int:
+        """
+        Saves a batch of messages with one unordered bulk write per target collection.
+        :param messages: A list of dictionaries representing the messages to be saved.
+        :return: The number of messages inserted.
+        :raises DatabaseError: If a bulk write fails, with the number of messages stored before it failed.
         """
-        Retrieves all messages from the 'messages' collection in the database.
+        groups: Dict[str, list] = {}
+        for message in messages:
+            groups.setdefault(self.partitions.collection_for(message), []).append(message)
+        inserted = 0
+        try:
+            with change_tracker.writing():
+                for name, group in groups.items():
+                    try:
+                        inserted += len(self._collection(name).insert_many(group, ordered=False).inserted_ids)
+                    except BulkWriteError as e:
+                        # An unordered bulk write keeps inserting past a failed document
+                        inserted += e.details.get("nInserted", 0)
+                        raise
+            return inserted
+        except Exception as e:
+            # Handle insertion-related exceptions and log the error
+            self.logger.exception(f"Database Bulk Insertion Error: {str(e)}")
+            raise DatabaseError(f"Database Bulk Insertion Error: {str(e)}", inserted)
+
+    def get_all_messages(self, charger: Optional[str] = None, start: Optional[str] = None,
+                         end: Optional[str] = None) -> list:
+        """
+        Retrieves all messages matching the optional filters, projected to the fields served by the API.
+        Results from several partitions are merged in _id order.
+        :param charger: Only messages published under "charger/<charger>/".
+        :param start: Only messages with a timestamp at or after this timestamp or prefix, e.g. "2024-01".
+        :param end: Only messages with a timestamp before this timestamp or prefix.
         :return: A list of dictionaries where each dictionary is a message from the database.
         """
+        query = build_message_filter(charger, start, end)
         try:
-            return list(self.db.messages.find({}))
+            names = self._partitions_for(charger, start, end)
+            if len(names) == 1:
+                return list(self._collection(names[0]).find(query, MESSAGE_PROJECTION))
+            cursors = [self._collection(name).find(query, MESSAGE_PROJECTION).sort("_id", 1) for name in names]
+            return list(heapq.merge(*cursors, key=lambda message: message["_id"]))
         except Exception as e:
             # Handle query-related exceptions and log the error
             self.logger.exception(f"Database Query Error: {str(e)}")
             raise DatabaseError(f"Database Query Error: {str(e)}")
 
+    def get_messages_since(self, since: Optional[ObjectId], limit: int, before: Optional[ObjectId] = None,
+                           charger: Optional[str] = None, start: Optional[str] = None,
+                           end: Optional[str] = None) -> list:
+        """
+        Retrieves messages stored after a watermark, oldest first.
+        :param since: Only messages with an _id greater than this are returned, None for all.
+        :param limit: The maximum number of messages to return.
+        :param before: Only messages with an _id lower than this are returned, None for no upper bound.
+        :param charger: Only messages published under "charger/<charger>/".
+        :param start: Only messages with a timestamp at or after this timestamp or prefix.
+        :param end: Only messages with a timestamp before this timestamp or prefix.
+        :return: A list of dictionaries where each dictionary is a message from the database.
+        """
+        # Backfills store old months with new _ids, so the watermark can't be used to skip partitions
+        query = build_message_filter(charger, start, end)
+        id_filter = {}
+        if since is not None:
+            id_filter["$gt"] = since
+        if before is not None:
+            id_filter["$lt"] = before
+        if id_filter:
+            query["_id"] = id_filter
+        try:
+            cursors = [self._collection(name).find(query, MESSAGE_PROJECTION).sort("_id", 1).limit(limit)
+                       for name in self._partitions_for(charger, start, end)]
+            if len(cursors) == 1:
+                return list(cursors[0])
+            merged = heapq.merge(*cursors, key=lambda message: message["_id"])
+            return list(itertools.islice(merged, limit))
+        except Exception as e:
+            # Handle query-related exceptions and log the error
+            self.logger.exception(f"Database Query Error: {str(e)}")
+            raise DatabaseError(f"Database Query Error: {str(e)}")
+
+    def list_partitions(self) -> List[str]:
+        """
+        Lists the message partitions of the configured scheme, in name order, without the unpartitioned
+        'messages' collection.
+        :return: The partition collection names.
+        """
+        try:
+            if not self.partitions.enabled:
+                return []
+            return self.partitions.select(self.db.list_collection_names(), include_legacy=False)
+        except Exception as e:
+            self.logger.exception(f"Database Query Error: {str(e)}")
+            raise DatabaseError(f"Database Query Error: {str(e)}")
+
+    def drop_partitions_before(self, month: str) -> List[str]:
+        """
+        Drops every monthly partition older than the given month. Each partition is removed with a single
+        collection drop, regardless of how many messages it holds.
+        :param month: The first month to keep, as "YYYYMM" or "YYYY-MM".
+        :return: The names of the dropped partitions.
+        :raises ValueError: If the month is in neither format.
+        """
+        if not self.partitions.by_month:
+            raise DatabaseError("Partitions can only be dropped by month with a month based PARTITION_STRATEGY")
+        keep_from = parse_month(month)
+        try:
+            dropped = []
+            # Dropping removes messages, so cached ETags must not match anymore
+            with change_tracker.writing():
+                for name in self.list_partitions():
+                    if self.partitions.parse(name)[1] < keep_from:
+                        self.db.drop_collection(name)
+                        dropped.append(name)
+            if dropped:
+                self.logger.info(f"Dropped partitions {', '.join(dropped)}")
+            return dropped
+        except Exception as e:
+            self.logger.exception(f"Database Drop Error: {str(e)}")
+            raise DatabaseError(f"Database Drop Error: {str(e)}")
+
     def close_connection(self):
         """
         Closes the database connection when it's no longer needed.
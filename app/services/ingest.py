@@ -0,0 +1,268 @@
+import codecs
+import datetime
+import json
+import re
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+from ..config import Config
+from .database_client import DatabaseClient, DatabaseError
+from .session_deriver import SessionDerivationEngine
+from app.models.mqtt_model import LogEntry
+from app.models.batch_model import BatchIngestResponse, BatchItemError
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+# strptime alone also accepts unpadded fields such as "2024-1-5 1:2:3", which don't sort as strings
+_TIMESTAMP_PATTERN = re.compile(r"^[0-9]{4}-[0-9]{2}-[0-9]{2} [0-9]{2}:[0-9]{2}:[0-9]{2}$")
+JSON_WHITESPACE = " \t\r\n"
+
+# (index, item, error) triples produced by the body parsers, error is set when the item could not be decoded
+ParsedItem = Tuple[int, Any, Optional[str]]
+
+
+class MalformedBodyError(ValueError):
+    """Raised when a batch request body cannot be parsed any further."""
+    pass
+
+
+def build_log_entry(topic: str, payload_data: Any, timestamp: Optional[str] = None) -> LogEntry:
+    """
+    Validates a topic and payload into a LogEntry. This is the single validation step shared by
+    the MQTT and HTTP ingest paths.
+
+    Args:
+        topic (str): The topic the payload was published to.
+        payload_data (Any): The decoded payload, validated against the Payload model.
+        timestamp (Optional[str]): The receive timestamp, defaults to now.
+
+    Returns:
+        LogEntry: The validated log entry.
+
+    Raises:
+        ValidationError: If the topic, payload or timestamp don't match the models.
+    """
+    if timestamp is None:
+        timestamp = datetime.datetime.now().strftime(TIMESTAMP_FORMAT)
+    return LogEntry.model_validate({"timestamp": timestamp, "topic": topic, "payload": payload_data})
+
+
+def is_valid_timestamp(timestamp: Any) -> bool:
+    """
+    Checks that a client supplied timestamp is a real date and time in TIMESTAMP_FORMAT, the format the MQTT
+    path stores. Partition routing and the start/end filters compare timestamps as strings, so anything
+    else would land in the wrong month and fall outside range queries.
+    """
+    if not isinstance(timestamp, str) or not _TIMESTAMP_PATTERN.match(timestamp):
+        return False
+    try:
+        datetime.datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+    except ValueError:
+        return False
+    return True
+
+
+def format_validation_error(error: ValidationError) -> str:
+    """
+    Flattens a pydantic ValidationError into a single line such as "payload.session_id: Field required".
+    """
+    return "; ".join(
+        f"{'.'.join(str(part) for part in detail['loc'])}: {detail['msg']}" for detail in error.errors())
+
+
+async def iter_ndjson_items(chunks: AsyncIterator[bytes], max_item_bytes: int) -> AsyncIterator[ParsedItem]:
+    """
+    Incrementally splits an NDJSON body into items. Blank lines are skipped and a malformed line only
+    rejects that line.
+
+    Raises:
+        MalformedBodyError: If a single line exceeds max_item_bytes.
+    """
+    buffer = b""
+    index = 0
+    async for chunk in chunks:
+        buffer += chunk
+        lines = buffer.split(b"\n")
+        buffer = lines.pop()
+        if len(buffer) > max_item_bytes:
+            raise MalformedBodyError(f"Item {index + len(lines)} exceeds {max_item_bytes} bytes")
+        for line in lines:
+            if line.strip():
+                if len(line) > max_item_bytes:
+                    raise MalformedBodyError(f"Item {index} exceeds {max_item_bytes} bytes")
+                yield _decode_line(index, line)
+                index += 1
+    if buffer.strip():
+        yield _decode_line(index, buffer)
+
+
+def _decode_line(index: int, line: bytes) -> ParsedItem:
+    try:
+        return index, json.loads(line), None
+    except ValueError as e:
+        return index, None, f"Invalid JSON: {str(e)}"
+
+
+async def iter_json_array_items(chunks: AsyncIterator[bytes], max_item_bytes: int) -> AsyncIterator[ParsedItem]:
+    """
+    Incrementally decodes the elements of a JSON array body without holding the whole body in memory.
+
+    Raises:
+        MalformedBodyError: If the body is not a well-formed JSON array or an element exceeds max_item_bytes.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    chunk_iterator = chunks.__aiter__()
+    buffer = ""
+    position = 0
+    at_eof = False
+    index = 0
+    state = "start"  # start -> first -> (separator -> value)* -> done
+
+    def decode_text(chunk: bytes, final: bool = False) -> str:
+        try:
+            return text_decoder.decode(chunk, final=final)
+        except UnicodeDecodeError as e:
+            raise MalformedBodyError(f"Request body is not valid UTF-8: {str(e)}")
+
+    async def read_more() -> None:
+        nonlocal buffer, position, at_eof
+        if at_eof:
+            raise MalformedBodyError("Unexpected end of body, expected a complete JSON array")
+        # Drop consumed text before reading more so the buffer only ever holds the current item
+        buffer = buffer[position:]
+        position = 0
+        try:
+            chunk = await chunk_iterator.__anext__()
+        except StopAsyncIteration:
+            buffer += decode_text(b"", final=True)
+            at_eof = True
+            return
+        buffer += decode_text(chunk)
+
+    while state != "done":
+        while position < len(buffer) and buffer[position] in JSON_WHITESPACE:
+            position += 1
+        if position == len(buffer):
+            await read_more()
+            continue
+
+        char = buffer[position]
+        if state == "start":
+            if char != "[":
+                raise MalformedBodyError("Request body must be a JSON array or NDJSON")
+            position += 1
+            state = "first"
+        elif state == "separator":
+            if char not in ",]":
+                raise MalformedBodyError(f"Expected ',' or ']' after item {index - 1}")
+            position += 1
+            state = "value" if char == "," else "done"
+        elif state == "first" and char == "]":
+            position += 1
+            state = "done"
+        else:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except ValueError as e:
+                if at_eof:
+                    raise MalformedBodyError(f"Item {index} is not valid JSON: {str(e)}")
+                if len(buffer) - position > max_item_bytes:
+                    raise MalformedBodyError(f"Item {index} is malformed or exceeds {max_item_bytes} bytes")
+                await read_more()
+                continue
+            if end == len(buffer) and not at_eof:
+                # A value ending exactly at the buffer end may be a truncated number or literal
+                await read_more()
+                continue
+            yield index, item, None
+            index += 1
+            position = end
+            state = "separator"
+
+    trailing = buffer[position:]
+    async for chunk in chunk_iterator:
+        trailing += decode_text(chunk)
+        if trailing.strip(JSON_WHITESPACE):
+            break
+        trailing = ""
+    if trailing.strip(JSON_WHITESPACE):
+        raise MalformedBodyError("Unexpected data after the end of the JSON array")
+
+
+class BatchIngestor:
+    """
+    Validates a stream of batch items against the same models as the MQTT ingest path and stores them with
+    bulk writes. Only one write buffer of `write_size` documents is held at a time, so memory use does not
+    grow with the size of the request. Derived session fields are computed per request, items are expected
+    to be ordered within each session up to the configured reorder window.
+    """
+
+    def __init__(self, db_client: DatabaseClient, write_size: int = Config.BATCH_WRITE_SIZE,
+                 max_reported_errors: int = Config.BATCH_MAX_REPORTED_ERRORS) -> None:
+        self.db_client = db_client
+        self.write_size = write_size
+        self.max_reported_errors = max_reported_errors
+        self.stored = 0
+        self.deriver = SessionDerivationEngine()
+
+    async def ingest(self, items: AsyncIterator[ParsedItem]) -> BatchIngestResponse:
+        """
+        Validates and stores every item, returning the per-item outcome.
+
+        Args:
+            items (AsyncIterator[ParsedItem]): Items produced by one of the body parsers.
+
+        Returns:
+            BatchIngestResponse: Counts of received, accepted and rejected items plus per-item errors.
+
+        Raises:
+            MalformedBodyError: If the body becomes unparseable. Items before that point are already stored.
+            DatabaseError: If a bulk write fails.
+        """
+        result = BatchIngestResponse()
+        pending: List[Dict] = []
+
+        async for index, item, error in items:
+            result.received += 1
+            if error is None:
+                error = self._validate_into(item, pending)
+            if error is not None:
+                self._reject(result, index, error)
+                continue
+            if len(pending) >= self.write_size:
+                result.accepted += await self._flush(pending)
+                pending = []
+
+        pending.extend(self.deriver.flush())
+        if pending:
+            result.accepted += await self._flush(pending)
+        return result
+
+    def _validate_into(self, item: Any, pending: List[Dict]) -> Optional[str]:
+        if not isinstance(item, dict):
+            return "Item must be a JSON object with 'topic' and 'payload'"
+        if item.get("timestamp") is not None and not is_valid_timestamp(item["timestamp"]):
+            return "timestamp: Expected a date and time formatted as YYYY-MM-DD HH:MM:SS"
+        try:
+            log_entry = build_log_entry(item.get("topic"), item.get("payload"), item.get("timestamp"))
+        except ValidationError as e:
+            return format_validation_error(e)
+        pending.extend(self.deriver.push(log_entry.model_dump(exclude_none=True)))
+        return None
+
+    def _reject(self, result: BatchIngestResponse, index: int, error: str) -> None:
+        result.rejected += 1
+        if len(result.errors) < self.max_reported_errors:
+            result.errors.append(BatchItemError(index=index, error=error))
+        else:
+            result.errors_truncated = True
+
+    async def _flush(self, pending: List[Dict]) -> int:
+        # pymongo is blocking, keep the bulk write off the event loop
+        try:
+            inserted = await run_in_threadpool(self.db_client.save_messages, pending)
+        except DatabaseError as e:
+            self.stored += e.inserted
+            raise
+        self.stored += inserted
+        return inserted
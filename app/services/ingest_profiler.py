@@ -0,0 +1,259 @@
+import collections
+import datetime
+import itertools
+import sys
+import threading
+import time
+from time import perf_counter_ns
+from typing import Deque, Dict, List, Optional
+from ..config import Config
+
+# Ingest stages in the order they are marked by MQTTClient.on_message
+STAGES = ("decode", "json", "validate", "dump", "derive", "insert", "log")
+
+# Histogram layout: exact buckets below 4ns, then 4 sub-buckets per power of two up to ~17s
+_SUB_BUCKETS = 4
+_BUCKET_COUNT = 34 * _SUB_BUCKETS
+
+
+def _bucket_index(ns: int) -> int:
+    if ns < _SUB_BUCKETS:
+        return max(ns, 0)
+    exponent = ns.bit_length() - 1
+    index = (exponent - 1) * _SUB_BUCKETS + ((ns >> (exponent - 2)) & (_SUB_BUCKETS - 1))
+    return min(index, _BUCKET_COUNT - 1)
+
+
+def _bucket_upper_bound(index: int) -> int:
+    if index < _SUB_BUCKETS:
+        return index
+    exponent = index // _SUB_BUCKETS + 1
+    return ((_SUB_BUCKETS + 1 + index % _SUB_BUCKETS) << (exponent - 2)) - 1
+
+
+class StageHistogram:
+    """
+    A fixed-size latency histogram with log-linear buckets.
+
+    There is no lock: each histogram has a single writer (the thread running the MQTT callbacks), and readers
+    only copy the counters, so a snapshot taken mid-update is at most one sample behind.
+    """
+
+    def __init__(self) -> None:
+        self.counts: List[int] = [0] * _BUCKET_COUNT
+        self.total_ns: int = 0
+        self.max_ns: int = 0
+
+    def record(self, ns: int) -> None:
+        # Same as _bucket_index, inlined because this runs several times per message
+        if ns < _SUB_BUCKETS:
+            index = ns if ns > 0 else 0
+        else:
+            exponent = ns.bit_length() - 1
+            index = ((exponent - 1) << 2) | ((ns >> (exponent - 2)) & 3)
+            if index >= _BUCKET_COUNT:
+                index = _BUCKET_COUNT - 1
+        self.counts[index] += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def snapshot(self) -> Dict[str, float]:
+        """
+        Returns count, mean, p50, p90, p99 and max in microseconds.
+        """
+        counts = list(self.counts)
+        count = sum(counts)
+        percentiles = {}
+        for name, quantile in (("p50_us", 0.5), ("p90_us", 0.9), ("p99_us", 0.99)):
+            target = quantile * count
+            seen = 0
+            value = 0
+            for index, bucket_count in enumerate(counts):
+                seen += bucket_count
+                if bucket_count and seen >= target:
+                    value = _bucket_upper_bound(index)
+                    break
+            percentiles[name] = round(min(value, self.max_ns) / 1000, 1)
+        return {
+            "count": count,
+            "mean_us": round(self.total_ns / count / 1000, 1) if count else 0.0,
+            **percentiles,
+            "max_us": round(self.max_ns / 1000, 1),
+        }
+
+
+class StageTimer:
+    """
+    Collects timestamps for one message as it moves through the ingest stages.
+    """
+    __slots__ = ("profiler", "topic", "marks")
+
+    def __init__(self, profiler: "IngestProfiler", topic: str) -> None:
+        self.profiler = profiler
+        self.topic = topic
+        self.marks: List[int] = [perf_counter_ns()]
+
+    def mark(self) -> None:
+        """
+        Marks the end of the next stage in STAGES.
+        """
+        self.marks.append(perf_counter_ns())
+
+    def finish(self) -> None:
+        """
+        Records the marked stages. Messages that stopped early (e.g. failed validation) record only the
+        stages they completed.
+        """
+        self.profiler.record(self.topic, self.marks)
+
+
+class _NullTimer:
+    """
+    Timer used when profiling is disabled, so the ingest path doesn't need to check.
+    """
+    __slots__ = ()
+
+    def mark(self) -> None:
+        pass
+
+    def finish(self) -> None:
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+class SamplingCpuProfiler:
+    """
+    A sampling CPU profiler that periodically captures the stacks of all other threads for a bounded window.
+    Stacks are aggregated in collapsed form so they can be fed to flame graph tools.
+    """
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.started_at: Optional[str] = None
+        self.seconds: float = 0
+        self.samples: int = 0
+        self.stacks: Dict[str, int] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float) -> bool:
+        """
+        Starts a new profile, discarding the previous one.
+
+        :param seconds: How long to sample for.
+        :return: False if a profile is already running.
+        """
+        with self._lock:
+            if self.running:
+                return False
+            self._stop.clear()
+            self.started_at = datetime.datetime.now().isoformat(timespec="seconds")
+            self.seconds = seconds
+            self.samples = 0
+            self.stacks = {}
+            self._thread = threading.Thread(
+                target=self._run, args=(time.monotonic() + seconds,), name="cpu-profiler", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self) -> None:
+        """
+        Stops the running profile early, keeping the samples collected so far.
+        """
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def _run(self, deadline: float) -> None:
+        own_id = threading.get_ident()
+        while time.monotonic() < deadline and not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                key = ";".join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+                self.samples += 1
+
+    def snapshot(self, top: int = 50) -> Dict:
+        stacks = sorted(self.stacks.items(), key=lambda item: item[1], reverse=True)[:top]
+        return {
+            "running": self.running,
+            "started_at": self.started_at,
+            "seconds": self.seconds,
+            "samples": self.samples,
+            "stacks": [{"stack": stack, "samples": samples} for stack, samples in stacks],
+        }
+
+
+class IngestProfiler:
+    """
+    Per-stage timing for the MQTT ingest path, with a flight recorder ring buffer of recent slow messages.
+    """
+
+    def __init__(self, enabled: bool = Config.PROFILER_ENABLED,
+                 slow_threshold_ms: float = Config.PROFILER_SLOW_THRESHOLD_MS,
+                 flight_recorder_size: int = Config.PROFILER_FLIGHT_RECORDER_SIZE,
+                 cpu_interval_ms: float = Config.PROFILER_CPU_INTERVAL_MS) -> None:
+        self.enabled = enabled
+        self.slow_threshold_ns = int(slow_threshold_ms * 1_000_000)
+        self.histograms: Dict[str, StageHistogram] = {stage: StageHistogram() for stage in STAGES + ("total",)}
+        self._stage_histograms: List[StageHistogram] = [self.histograms[stage] for stage in STAGES]
+        self.flight_recorder: Deque[Dict] = collections.deque(maxlen=flight_recorder_size)
+        self.cpu_profiler = SamplingCpuProfiler(cpu_interval_ms / 1000)
+
+    def start(self, topic: str):
+        """
+        Starts timing a message.
+
+        :param topic: The topic of the message, kept for the flight recorder.
+        :return: A StageTimer, or a no-op timer when profiling is disabled.
+        """
+        if not self.enabled:
+            return NULL_TIMER
+        return StageTimer(self, topic)
+
+    def record(self, topic: str, marks: List[int]) -> None:
+        previous = marks[0]
+        for histogram, mark in zip(self._stage_histograms, itertools.islice(marks, 1, None)):
+            histogram.record(mark - previous)
+            previous = mark
+        total = previous - marks[0]
+        self.histograms["total"].record(total)
+        if total >= self.slow_threshold_ns:
+            durations = [end - start for start, end in zip(marks, marks[1:])]
+            # deque.append is atomic, the ring buffer needs no lock
+            self.flight_recorder.append({
+                "topic": topic,
+                "received_at": datetime.datetime.now().isoformat(timespec="milliseconds"),
+                "total_us": round(total / 1000, 1),
+                "stages": {stage: round(duration / 1000, 1) for stage, duration in zip(STAGES, durations)},
+            })
+
+    def snapshot(self) -> Dict:
+        """
+        Returns the stage statistics, the flight recorder (slowest first) and the CPU profile.
+        """
+        return {
+            "enabled": self.enabled,
+            "stages": {stage: histogram.snapshot() for stage, histogram in self.histograms.items()},
+            "slowest": sorted(self.flight_recorder, key=lambda entry: entry["total_us"], reverse=True),
+            "cpu_profile": self.cpu_profiler.snapshot(),
+        }
+
+
+# Shared by the MQTT clients, which record into it, and the debug API, which reads it
+ingest_profiler = IngestProfiler()
@@ -1,13 +1,20 @@
 import paho.mqtt.client as mqtt
-import time
 import json
 import threading
-import datetime
 import logging
-from typing import Any, Dict
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from ..config import Config
+from .connectivity import (OfflinePublishQueue, ReconnectBackoff, connectivity_metrics,
+                           parse_brokers)
 from .database_client import DatabaseClient
-from app.models.mqtt_model import LogEntry, Payload
-from helpers.energy_session_simulator import EnergySessionSimulator
+from app.logging_config import MESSAGE_LOGGER_NAME, message_log_enabled
+from .ingest import build_log_entry
+from .ingest_profiler import NULL_TIMER, ingest_profiler
+from app.models.mqtt_model import LogEntry
+from .session_deriver import SessionDerivationEngine
+from .simulator_scheduler import build_simulator_scheduler
+from .traffic_capture import TrafficRecorder
 from pydantic import ValidationError
 
 
@@ -15,6 +22,10 @@ class MQTTClient:
     """
     A client class for connecting to an MQTT broker and handling messages.
 
+    The connection is managed by the client's own network thread: it fails over between the primary and
+    MQTT_FAILOVER_BROKERS with jittered exponential backoff, resubscribes on every connect, and buffers
+    publishes made while disconnected until the next connect.
+
     Attributes:
         broker (str): The address of the MQTT broker.
         port (int): The port number of the MQTT broker.
@@ -31,16 +42,34 @@ class MQTTClient:
             topic (str): The MQTT topic to subscribe to.
         """
         self.logger = logging.getLogger(__name__)
+        self.message_logger = logging.getLogger(MESSAGE_LOGGER_NAME)
         self.client = mqtt.Client()
         self.broker: str = broker
         self.port: int = port
         self.topic: str = topic
         self.running: bool = False
         self.db_client = DatabaseClient()
+        self.profiler = ingest_profiler
+        self.deriver = SessionDerivationEngine()
+        self.recorder: Optional[TrafficRecorder] = None
+        self.scheduler = None
+        self._stop_event = threading.Event()
+
+        # Connection management
+        self.brokers: List[Tuple[str, int]] = parse_brokers(broker, port)
+        self.connectivity = connectivity_metrics
+        self.backoff = ReconnectBackoff()
+        self.offline_queue = OfflinePublishQueue(self.connectivity)
+        self._broker_index: int = 0
+        self._acknowledged: bool = False
+        self._publish_lock = threading.Lock()
+        self._network_thread: Optional[threading.Thread] = None
 
         # Set up callbacks
         self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
         self.client.on_message = self.on_message
+        self.client.on_socket_register_write = self.on_socket_register_write
 
     def on_connect(self, client: mqtt.Client, userdata: Any, flags: Dict, rc: int) -> None:
         """
@@ -54,10 +83,38 @@ class MQTTClient:
         """
         if rc == 0:
             self.logger.info(f"Connected with result code {rc}")
+            # Subscriptions don't survive a clean session, so subscribe on every connect
             client.subscribe(self.topic)
+            self._acknowledged = True
+            self.backoff.reset()
+            host, port = self.brokers[self._broker_index]
+            self.connectivity.mark_connected(f"{host}:{port}")
+            self.flush_offline_queue()
         else:
             self.logger.error(f"Connection failed with result code {rc}")
 
+    def on_disconnect(self, client: mqtt.Client, userdata: Any, rc: int) -> None:
+        """
+        Callback for when the connection to the broker is closed. The network loop reconnects unless the
+        client is stopping.
+
+        Args:
+            client (mqtt.Client): The client instance for this callback.
+            userdata (Any): The private user data as set in Client() or user_data_set().
+            rc (int): The disconnection reason, 0 if disconnect() was called.
+        """
+        self.connectivity.mark_disconnected()
+        if rc != 0:
+            self.logger.warning(f"Unexpectedly disconnected from the broker with result code {rc}")
+
+    def on_socket_register_write(self, client: mqtt.Client, userdata: Any, sock: Any) -> None:
+        """
+        Callback for when paho has outgoing data queued. Does nothing: with this callback set, a publish from
+        another thread only queues the packet and wakes the network loop, so the network thread is the only
+        one writing to the socket. Without it paho writes from the publishing thread itself.
+        """
+        pass
+
     def on_message(self, client: mqtt.Client, userdata: Any, message: mqtt.MQTTMessage) -> None:
         """
         Callback for when a PUBLISH message is received from the broker.
@@ -67,61 +124,268 @@ class MQTTClient:
             userdata (Any): The private user data as set in Client() or user_data_set().
             message (mqtt.MQTTMessage): An instance of MQTTMessage. This is a class with members topic, payload, qos, retain.
         """
+        if self.recorder is not None:
+            self.record_message(message)
+        timer = self.profiler.start(message.topic)
         try:
-            timestamp: datetime.datetime = datetime.datetime.now()
-            payload: str = message.payload.decode("utf-8")
-            payload_data: Dict = json.loads(payload)
-
-            # Validate the payload data against the Payload model to ensure that model and the payload response matches
-            try:
-                validated_payload = Payload(**payload_data)
-            except ValidationError as e:
-                self.logger.error(f"Payload validation error: {e.json()}")
+            log_entry = self.parse_message(message, timer)
+            if log_entry is None:
                 return  # Exit the function if validation fails
 
-            # Create a LogEntry instance
-            log_entry = LogEntry(
-                timestamp=timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                topic=message.topic,
-                payload=validated_payload.model_dump()
-            )
-
-            # Save the log entry to the database
-            self.db_client.save_message(
-                log_entry.model_dump(exclude_none=True))
-            self.logger.info(
-                f"Received message: {log_entry.model_dump_json(exclude_none=True)}")
+            # Derive the per-session fields, which may release held back messages instead of this one
+            document = log_entry.model_dump(exclude_none=True)
+            timer.mark()
+            documents = self.deriver.push(document)
+            timer.mark()
+            # Save the released log entries to the database
+            self.store_documents(documents)
+            timer.mark()
+            for document in documents:
+                self.log_received(document)
+            timer.mark()
         except Exception as e:
             # Handle any exceptions that might occur during message processing
             self.logger.exception(f"Error processing message: {str(e)}")
+        finally:
+            timer.finish()
+
+    def store_documents(self, documents: List[Dict]) -> None:
+        """
+        Saves documents released by the derivation engine, with a bulk write when there are several.
+
+        Args:
+            documents (List[Dict]): The documents to be saved.
+        """
+        if len(documents) == 1:
+            self.db_client.save_message(documents[0])
+        elif documents:
+            self.db_client.save_messages(documents)
+
+    def release_expired_messages(self) -> None:
+        """
+        Stores the messages the derivation engine has held back for DERIVATION_MAX_DELAY_SECONDS, which
+        would otherwise wait for the next message to arrive. Runs on the network thread, like on_message.
+        """
+        try:
+            documents = self.deriver.release_expired()
+            self.store_documents(documents)
+            for document in documents:
+                self.log_received(document)
+        except Exception as e:
+            self.logger.exception(f"Error storing held back messages: {str(e)}")
+
+    def log_received(self, document: Dict) -> None:
+        """
+        Logs a stored message on the per-message logger. Sampling and rate limiting are decided before the
+        record is created, and the document is only serialized on the logging thread.
+
+        Args:
+            document (Dict): The document that was saved to the database.
+        """
+        if message_log_enabled():
+            self.message_logger.info("Received message on %s", document["topic"], extra={"entry": document})
+
+    def parse_message(self, message: mqtt.MQTTMessage, timer=NULL_TIMER) -> Optional[LogEntry]:
+        """
+        Decodes and validates an incoming MQTT message into a LogEntry.
+
+        Args:
+            message (mqtt.MQTTMessage): The received MQTT message.
+            timer (StageTimer): Timer marked after the decode, json and validate stages.
+
+        Returns:
+            Optional[LogEntry]: The validated log entry, or None if the payload failed validation.
+        """
+        payload: str = message.payload.decode("utf-8")
+        timer.mark()
+        payload_data: Dict = json.loads(payload)
+        timer.mark()
+
+        # Validate the payload against the Payload and LogEntry models, shared with the HTTP batch ingest path
+        try:
+            log_entry = build_log_entry(message.topic, payload_data)
+            timer.mark()
+            return log_entry
+        except ValidationError as e:
+            self.logger.error(f"Payload validation error: {e.json()}")
+            return None
+
+    def open_recorder(self) -> None:
+        """
+        Starts recording received messages to CAPTURE_PATH, if set. A capture that can't be opened is logged
+        and ingest runs without recording.
+        """
+        if Config.CAPTURE_PATH and self.recorder is None:
+            try:
+                self.recorder = TrafficRecorder(Config.CAPTURE_PATH)
+                self.logger.info(f"Recording received messages to {Config.CAPTURE_PATH}")
+            except Exception as e:
+                self.logger.exception(f"Recording to {Config.CAPTURE_PATH} could not be started: {str(e)}")
+
+    def record_message(self, message: mqtt.MQTTMessage) -> None:
+        """
+        Appends a received message to the capture. Recording is turned off if the capture file fails, e.g.
+        when the disk is full, rather than letting the error reach paho and stop the network loop.
+
+        Args:
+            message (mqtt.MQTTMessage): The received MQTT message.
+        """
+        try:
+            self.recorder.record(message)
+        except Exception as e:
+            self.logger.exception(f"Recording to {self.recorder.path} failed, recording stopped: {str(e)}")
+            self.close_recorder()
+
+    def close_recorder(self) -> None:
+        """
+        Stops recording and flushes the capture file.
+        """
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            try:
+                recorder.close()
+            except Exception as e:
+                self.logger.exception(f"Closing the capture {recorder.path} failed: {str(e)}")
 
     def start(self) -> None:
         """
-        Starts the MQTT client and connects it to the broker. Also starts a thread for publishing messages periodically.
+        Starts the MQTT client's network thread, which connects to the broker and keeps reconnecting until
+        the client is stopped. Also starts a thread that publishes the simulated sessions, unless the
+        simulator is disabled.
         """
         try:
             self.running = True
-            self.simulator = EnergySessionSimulator()
-            self.client.connect(self.broker, self.port, 60)
-            self.client.loop_start()
-            threading.Thread(target=self.publish_message_periodically).start()
+            self._stop_event.clear()
+            self.open_recorder()
+            self._network_thread = threading.Thread(target=self.run_network_loop, name="mqtt-network", daemon=True)
+            self._network_thread.start()
         except Exception as e:
             # Handle connection-related exceptions and log the error
             self.logger.exception(f"MQTT Client Error: {str(e)}")
+            return
+        try:
+            # A misconfigured simulator must not keep the client from ingesting
+            self.scheduler = build_simulator_scheduler(self.topic)
+            if self.scheduler is not None:
+                threading.Thread(target=self.publish_message_periodically).start()
+        except Exception as e:
+            self.logger.exception(f"Simulator Error: {str(e)}")
 
-    def publish_message_periodically(self) -> None:
+    def connect_broker(self) -> bool:
+        """
+        Opens a connection to the current broker. The CONNACK is handled by the network loop.
+
+        Returns:
+            bool: False if the broker could not be reached, after moving on to the next broker.
+        """
+        host, port = self.brokers[self._broker_index]
+        self._acknowledged = False
+        try:
+            self.client.connect(host, port, 60)
+            return True
+        except Exception as e:
+            self.connectivity.mark_connect_failure()
+            self.logger.warning(f"Connecting to MQTT broker {host}:{port} failed: {str(e)}")
+            self.next_broker()
+            return False
+
+    def next_broker(self) -> None:
+        """
+        Moves on to the next broker in the failover list.
+        """
+        self._broker_index = (self._broker_index + 1) % len(self.brokers)
+
+    def run_network_loop(self) -> None:
         """
-        Publishes messages to the MQTT topic periodically every 60 seconds.
+        Runs paho's network loop until the client is stopped, reconnecting with backoff whenever the
+        connection is lost. A broker that can't be reached or refuses the connection is skipped for the next
+        one in the list; after losing an established connection the same broker is retried first.
+
+        Messages held back for reordering are released at least once a second, connected or not. An
+        unexpected error, from paho or from a callback it runs, is logged and counted as a connection failure,
+        and the loop reconnects after the backoff instead of ending the thread.
         """
-        while self.running:
+        while not self._stop_event.is_set():
             try:
-                message = json.dumps(
-                    self.simulator.simulate_energy_session_payload())
-                self.client.publish(self.topic, message)
-                time.sleep(60)
+                if self.connect_broker():
+                    rc = mqtt.MQTT_ERR_SUCCESS
+                    while rc == mqtt.MQTT_ERR_SUCCESS and not self._stop_event.is_set():
+                        rc = self.client.loop(timeout=1.0)
+                        self.release_expired_messages()
+                    self.connectivity.mark_disconnected()
+                    if not self._acknowledged:
+                        self.next_broker()
             except Exception as e:
-                # Handle publishing-related exceptions and log the error
-                self.logger.exception(f"MQTT Publish Error: {str(e)}")
+                # connect() closes the old socket before opening a new one, so just retry
+                self.connectivity.mark_disconnected()
+                self.connectivity.mark_connect_failure()
+                self.logger.exception(f"MQTT network loop error: {str(e)}")
+            # Backoff was reset by the last CONNACK, so the first retry after a drop comes quickly
+            self.wait_releasing_messages(self.backoff.next_delay())
+
+    def wait_releasing_messages(self, seconds: float) -> None:
+        """
+        Waits until the client is stopped or `seconds` have passed, storing expired held back messages
+        once a second meanwhile.
+        """
+        deadline = time.monotonic() + seconds
+        while not self._stop_event.wait(min(1.0, max(deadline - time.monotonic(), 0.0))):
+            self.release_expired_messages()
+            if time.monotonic() >= deadline:
+                return
+
+    def publish(self, topic: str, payload: str, qos: int = 0, retain: bool = False) -> None:
+        """
+        Publishes a message, or buffers it in the offline queue while the broker is unreachable.
+        QoS 1 and 2 messages that paho accepted are retried by paho itself after a reconnect.
+
+        Args:
+            topic (str): The MQTT topic to publish to.
+            payload (str): The message payload.
+            qos (int): The quality of service level.
+            retain (bool): Whether the broker should retain the message.
+        """
+        with self._publish_lock:
+            if self.client.is_connected():
+                info = self.client.publish(topic, payload, qos, retain)
+                if info.rc == mqtt.MQTT_ERR_SUCCESS or qos > 0:
+                    return
+            self.offline_queue.append((topic, payload, qos, retain))
+
+    def flush_offline_queue(self) -> None:
+        """
+        Publishes everything buffered while disconnected, in order. Paho queues the packets and the network
+        loop writes them out together.
+        """
+        flushed = 0
+        with self._publish_lock:
+            pending = self.offline_queue.drain()
+            for topic, payload, qos, retain in pending:
+                info = self.client.publish(topic, payload, qos, retain)
+                if info.rc != mqtt.MQTT_ERR_SUCCESS and qos == 0:
+                    # Lost the connection again, keep the rest for the next connect
+                    self.offline_queue.requeue(pending[flushed:])
+                    break
+                flushed += 1
+            self.connectivity.offline_flushed += flushed
+        if pending:
+            self.logger.info(f"Flushed {flushed} of {len(pending)} publishes buffered while disconnected")
+
+    def publish_simulated_payload(self, topic: str, payload: Dict[str, Any]) -> None:
+        """
+        Publishes a simulated session payload.
+
+        Args:
+            topic (str): The MQTT topic to publish to.
+            payload (Dict[str, Any]): The simulated session payload.
+        """
+        self.publish(topic, json.dumps(payload))
+
+    def publish_message_periodically(self) -> None:
+        """
+        Publishes the simulated sessions on their configured schedule until the client is stopped.
+        """
+        self.scheduler.run_blocking(self.publish_simulated_payload, self._stop_event)
 
     def stop(self) -> None:
         """
@@ -129,8 +393,19 @@ class MQTTClient:
         """
         try:
             self.running = False
-            self.client.loop_stop()
+            self._stop_event.set()
             self.client.disconnect()
+            if self._network_thread is not None:
+                self._network_thread.join(timeout=5)
+                if self._network_thread.is_alive():
+                    # Still inside a callback, e.g. a slow insert; the derivation engine isn't thread safe
+                    self.logger.warning("MQTT network thread did not stop within 5 seconds, "
+                                        "messages held back for reordering are not stored")
+                    return
+                self._network_thread = None
+            # No more messages arrive once the network loop has stopped, store the ones still held back
+            self.store_documents(self.deriver.flush())
+            self.close_recorder()
         except Exception as e:
             # Handle disconnection-related exceptions and log the error
             self.logger.exception(f"MQTT Disconnect Error: {str(e)}")
@@ -0,0 +1,148 @@
+import datetime
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+from ..config import Config
+
+PARTITION_STRATEGIES = ("none", "charger", "month", "charger_month")
+BASE_COLLECTION = "messages"
+
+_CHARGER_TOPIC = re.compile(r"^charger/([^/]+)")
+_TIMESTAMP_MONTH = re.compile(r"^(\d{4})-(\d{2})")
+_MONTH = re.compile(r"^(\d{4})-?(\d{2})$")
+_UNSAFE_CHARGER_CHARS = re.compile(r"[^A-Za-z0-9-]")
+_PARTITION_NAME = re.compile(
+    rf"^{BASE_COLLECTION}(?:_c(?P<charger>[A-Za-z0-9-]+))?(?:_(?P<month>\d{{6}}))?$")
+
+
+def charger_from_topic(topic: str) -> str:
+    """
+    Extracts the charger id from a topic such as "charger/1/connector/1/session/1", made safe for use in a
+    collection name. Topics without a charger are grouped under "unknown".
+    """
+    match = _CHARGER_TOPIC.match(topic)
+    return _UNSAFE_CHARGER_CHARS.sub("-", match.group(1)) if match else "unknown"
+
+
+def month_from_timestamp(timestamp: Optional[str]) -> Optional[str]:
+    """
+    Returns the YYYYMM month of a "YYYY-MM..." timestamp or timestamp prefix, or None if it has no month.
+    """
+    match = _TIMESTAMP_MONTH.match(timestamp or "")
+    return match.group(1) + match.group(2) if match else None
+
+
+def parse_month(month: str) -> str:
+    """
+    Normalizes a "YYYY-MM" or "YYYYMM" month to "YYYYMM".
+
+    :raises ValueError: If the month is not in either format.
+    """
+    match = _MONTH.match(month)
+    if match is None or not 1 <= int(match.group(2)) <= 12:
+        raise ValueError(f"Invalid month {month!r}, expected YYYY-MM or YYYYMM")
+    return match.group(1) + match.group(2)
+
+
+def build_message_filter(charger: Optional[str] = None, start: Optional[str] = None,
+                         end: Optional[str] = None) -> Dict:
+    """
+    Builds the query filter for the optional message filters.
+
+    :param charger: Only messages published under "charger/<charger>/".
+    :param start: Only messages with a timestamp at or after this timestamp or prefix, e.g. "2024-01".
+    :param end: Only messages with a timestamp before this timestamp or prefix.
+    :return: A MongoDB filter, empty when no filter is set.
+    """
+    query: Dict = {}
+    if charger is not None:
+        query["topic"] = {"$regex": f"^charger/{re.escape(charger)}/"}
+    timestamp_filter = {}
+    if start is not None:
+        timestamp_filter["$gte"] = start
+    if end is not None:
+        timestamp_filter["$lt"] = end
+    if timestamp_filter:
+        query["timestamp"] = timestamp_filter
+    return query
+
+
+class PartitionScheme:
+    """
+    Maps messages to collections partitioned by charger and/or month, e.g. "messages_c1_202401".
+
+    With the "none" strategy everything stays in the single "messages" collection. Time partitions are
+    based on the stored `timestamp`, so a backfilled message lands in the month it was recorded in, and
+    dropping a month is a single collection drop instead of a large delete. Messages stored in "messages"
+    before partitioning was enabled are still read, from that collection, but are never dropped by month.
+    """
+
+    def __init__(self, strategy: str = Config.PARTITION_STRATEGY) -> None:
+        if strategy not in PARTITION_STRATEGIES:
+            raise ValueError(f"Unknown partition strategy {strategy!r}, expected one of {PARTITION_STRATEGIES}")
+        self.strategy = strategy
+        self.by_charger = strategy in ("charger", "charger_month")
+        self.by_month = strategy in ("month", "charger_month")
+
+    @property
+    def enabled(self) -> bool:
+        return self.strategy != "none"
+
+    def collection_for(self, document: Dict) -> str:
+        """
+        Returns the name of the collection a message document is written to.
+        """
+        name = BASE_COLLECTION
+        if self.by_charger:
+            name += f"_c{charger_from_topic(document['topic'])}"
+        if self.by_month:
+            month = month_from_timestamp(document.get("timestamp")) or datetime.datetime.now().strftime("%Y%m")
+            name += f"_{month}"
+        return name
+
+    def parse(self, name: str) -> Optional[Tuple[Optional[str], Optional[str]]]:
+        """
+        Parses a collection name into its (charger, month), or returns None if it is not a partition of
+        this scheme.
+        """
+        match = _PARTITION_NAME.match(name)
+        if match is None:
+            return None
+        charger, month = match.group("charger"), match.group("month")
+        if (charger is not None) != self.by_charger or (month is not None) != self.by_month:
+            return None
+        return charger, month
+
+    def select(self, names: Iterable[str], charger: Optional[str] = None, start: Optional[str] = None,
+               end: Optional[str] = None, include_legacy: bool = True) -> List[str]:
+        """
+        Selects the partitions that can hold messages matching the filters, in name order.
+
+        :param names: The existing collection names.
+        :param charger: The charger filter, if any.
+        :param start: The inclusive timestamp lower bound, if any.
+        :param end: The exclusive timestamp upper bound, if any.
+        :param include_legacy: Whether to include the unpartitioned "messages" collection if it exists, which
+            can hold messages of any charger and month.
+        :return: The matching partition names.
+        """
+        if not self.enabled:
+            return [BASE_COLLECTION]
+        wanted_charger = _UNSAFE_CHARGER_CHARS.sub("-", charger) if charger is not None else None
+        first_month = month_from_timestamp(start)
+        last_month = month_from_timestamp(end)
+        selected = []
+        for name in sorted(names):
+            if name == BASE_COLLECTION:
+                if include_legacy:
+                    selected.append(name)
+                continue
+            partition = self.parse(name)
+            if partition is None:
+                continue
+            partition_charger, month = partition
+            if wanted_charger is not None and self.by_charger and partition_charger != wanted_charger:
+                continue
+            if month is not None and ((first_month and month < first_month) or (last_month and month > last_month)):
+                continue
+            selected.append(name)
+        return selected
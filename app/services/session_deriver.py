@@ -0,0 +1,217 @@
+import collections
+import heapq
+import itertools
+import math
+import time
+from typing import Callable, Deque, List, Optional, OrderedDict, Set, Tuple
+from ..config import Config
+
+SessionKey = Tuple[str, int]
+
+
+class _SessionState:
+    """
+    Compact per-session state: the last emitted counters, the reorder buffer and running power statistics.
+    """
+    __slots__ = ("duration", "energy", "cost", "interval", "reset_candidate", "max_seen_duration", "pending",
+                 "pending_seqs", "last_seen", "samples", "mean_kw", "m2_kw", "max_kw")
+
+    def __init__(self) -> None:
+        self.duration: Optional[int] = None
+        self.energy: float = 0.0
+        self.cost: int = 0
+        self.interval: Optional[int] = None
+        # Counters of the last late message, a restart if the next message continues from it
+        self.reset_candidate: Optional[Tuple[int, float, int]] = None
+        self.max_seen_duration: Optional[int] = None
+        self.pending: List[Tuple[int, int, dict, bool]] = []
+        self.pending_seqs: Set[int] = set()
+        self.last_seen: float = 0.0
+        self.reset_statistics()
+
+    def reset_statistics(self) -> None:
+        self.samples: int = 0
+        self.mean_kw: float = 0.0
+        self.m2_kw: float = 0.0
+        self.max_kw: Optional[float] = None
+
+
+class SessionDerivationEngine:
+    """
+    Derives interval deltas, instantaneous power and running statistics from the cumulative counters
+    (energy_delivered_in_kWh, duration_in_seconds, session_cost_in_cents) of each charging session.
+
+    Sessions are keyed by topic and session_id. Messages are ordered by duration_in_seconds, which only
+    grows within a session: up to `reorder_window` messages per session are held back and released in
+    order, and a held message is released once it has waited `max_delay` seconds, by the next `push()` or
+    by the owner calling `release_expired()` periodically. Every message costs O(log reorder_window) and the
+    per-session state is a fixed handful of numbers.
+
+    Each released document gets a `derived` field. Flags mark a counter reset, a regression (energy or cost
+    fell while duration did not), a late message (older than one already released, stored without deltas
+    and without touching the session state) and a reordered message (arrived after a newer one). A drop in
+    duration is a counter reset when the counters restarted from zero or when the next message continues
+    from the dropped one; any other single message further back, however far, is only late.
+
+    Not thread safe; each ingest path owns its own engine.
+    """
+
+    def __init__(self, reorder_window: int = Config.DERIVATION_REORDER_WINDOW,
+                 max_delay: float = Config.DERIVATION_MAX_DELAY_SECONDS,
+                 session_ttl: float = Config.DERIVATION_SESSION_TTL_SECONDS,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.reorder_window = reorder_window
+        self.max_delay = max_delay
+        self.session_ttl = session_ttl
+        self.clock = clock
+        # Least recently seen first, so idle sessions can be evicted from the front
+        self._sessions: OrderedDict[SessionKey, _SessionState] = collections.OrderedDict()
+        # Held messages in arrival order, for releasing them once they have waited max_delay
+        self._arrivals: Deque[Tuple[float, SessionKey, int]] = collections.deque()
+        self._sequence = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def push(self, document: dict) -> List[dict]:
+        """
+        Adds a validated log entry document.
+
+        :param document: The document to be stored, with `topic` and `payload`.
+        :return: The documents that are ready to be stored, with their `derived` field set.
+        """
+        now = self.clock()
+        payload = document["payload"]
+        key = (document["topic"], payload["session_id"])
+        state = self._sessions.get(key)
+        if state is None:
+            state = self._sessions[key] = _SessionState()
+        else:
+            self._sessions.move_to_end(key)
+        state.last_seen = now
+
+        duration = payload["duration_in_seconds"]
+        reordered = state.max_seen_duration is not None and duration < state.max_seen_duration
+        if state.max_seen_duration is None or duration > state.max_seen_duration:
+            state.max_seen_duration = duration
+
+        ready = self.release_expired(now)
+        if self.reorder_window <= 0:
+            ready.append(self._derive(state, document, reordered))
+        else:
+            sequence = next(self._sequence)
+            heapq.heappush(state.pending, (duration, sequence, document, reordered))
+            state.pending_seqs.add(sequence)
+            self._arrivals.append((now, key, sequence))
+            while len(state.pending) > self.reorder_window:
+                ready.append(self._release_next(state))
+        self._evict_idle(now)
+        return ready
+
+    def release_expired(self, now: Optional[float] = None) -> List[dict]:
+        """
+        Releases held messages that have waited at least max_delay seconds, along with any older
+        messages of the same session that must be released before them.
+
+        :return: The released documents.
+        """
+        now = self.clock() if now is None else now
+        ready: List[dict] = []
+        while self._arrivals and self._arrivals[0][0] <= now - self.max_delay:
+            _, key, sequence = self._arrivals.popleft()
+            state = self._sessions.get(key)
+            while state is not None and sequence in state.pending_seqs:
+                ready.append(self._release_next(state))
+        return ready
+
+    def flush(self) -> List[dict]:
+        """
+        Releases every held message, e.g. on shutdown or at the end of a batch.
+
+        :return: The released documents.
+        """
+        ready: List[dict] = []
+        for state in self._sessions.values():
+            while state.pending:
+                ready.append(self._release_next(state))
+        self._arrivals.clear()
+        return ready
+
+    def _release_next(self, state: _SessionState) -> dict:
+        _, sequence, document, reordered = heapq.heappop(state.pending)
+        state.pending_seqs.discard(sequence)
+        return self._derive(state, document, reordered)
+
+    def _evict_idle(self, now: float) -> None:
+        while self._sessions:
+            key, state = next(iter(self._sessions.items()))
+            if state.last_seen > now - self.session_ttl or state.pending:
+                break
+            del self._sessions[key]
+
+    def _derive(self, state: _SessionState, document: dict, reordered: bool) -> dict:
+        payload = document["payload"]
+        duration = payload["duration_in_seconds"]
+        energy = payload["energy_delivered_in_kWh"]
+        cost = payload["session_cost_in_cents"]
+        derived = {"counter_reset": False, "regression": False, "late": False, "reordered": reordered}
+        document["derived"] = derived
+
+        if state.duration is None:
+            # First message of the session seen by this engine, there is nothing to diff against
+            self._update_counters(state, duration, energy, cost)
+            return document
+
+        candidate, state.reset_candidate = state.reset_candidate, None
+        if duration < state.duration:
+            if duration == 0 and energy == 0 and cost == 0:
+                # The counters restarted from zero
+                previous_duration, previous_energy, previous_cost = 0, 0.0, 0
+            elif candidate is not None and candidate[0] < duration and candidate[1] <= energy and candidate[2] <= cost:
+                # The previous late message was the start of a new segment and this one continues from it
+                previous_duration, previous_energy, previous_cost = candidate
+            else:
+                # Older than a message that was already released, keep the session state untouched
+                state.reset_candidate = (duration, energy, cost)
+                derived["late"] = True
+                return document
+            derived["counter_reset"] = True
+            state.reset_statistics()
+        else:
+            previous_duration, previous_energy, previous_cost = state.duration, state.energy, state.cost
+
+        interval = duration - previous_duration
+        interval_energy = energy - previous_energy
+        interval_cost = cost - previous_cost
+        derived["interval_seconds"] = interval
+        derived["interval_energy_kWh"] = round(interval_energy, 6)
+        derived["interval_cost_in_cents"] = interval_cost
+
+        if interval_energy < 0 or interval_cost < 0:
+            derived["regression"] = True
+        elif interval > 0:
+            power = interval_energy * 3600 / interval
+            derived["power_kW"] = round(power, 6)
+            # Welford's online mean and variance
+            state.samples += 1
+            delta = power - state.mean_kw
+            state.mean_kw += delta / state.samples
+            state.m2_kw += delta * (power - state.mean_kw)
+            state.max_kw = power if state.max_kw is None else max(state.max_kw, power)
+
+        if state.samples:
+            derived["samples"] = state.samples
+            derived["mean_power_kW"] = round(state.mean_kw, 6)
+            derived["stddev_power_kW"] = round(math.sqrt(state.m2_kw / state.samples), 6)
+            derived["max_power_kW"] = round(state.max_kw, 6)
+
+        self._update_counters(state, duration, energy, cost)
+        return document
+
+    @staticmethod
+    def _update_counters(state: _SessionState, duration: int, energy: float, cost: int) -> None:
+        if state.duration is not None and duration > state.duration:
+            state.interval = duration - state.duration
+        state.duration = duration
+        state.energy = energy
+        state.cost = cost
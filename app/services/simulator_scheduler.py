@@ -0,0 +1,191 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from ..config import Config
+from helpers.energy_session_simulator import EnergySessionSimulator
+
+PublishCallback = Callable[[str, Dict[str, Any]], None]
+
+
+class SimulatedSession:
+    """
+    A single simulated device tracked by the scheduler.
+
+    Attributes:
+        simulator (EnergySessionSimulator): The simulator producing payloads for this session.
+        topic (str): The MQTT topic the session publishes to.
+        interval (float): Nominal seconds between publishes.
+        jitter (float): Maximum random offset in seconds applied to each publish.
+        nominal_due (float): The next publish time on the session's fixed interval grid.
+    """
+
+    def __init__(self, simulator: EnergySessionSimulator, topic: str, interval: float, jitter: float,
+                 nominal_due: float) -> None:
+        self.simulator = simulator
+        self.topic = topic
+        self.interval = interval
+        self.jitter = jitter
+        self.nominal_due = nominal_due
+
+
+class SimulatorScheduler:
+    """
+    Drives any number of simulated sessions from a single thread or task using a heap of due times.
+
+    Each session publishes on a fixed grid of `interval` seconds. Jitter is applied to each individual publish
+    but never accumulates, because the next publish is always scheduled from the previous nominal time rather
+    than from when the publish actually happened. After a stall, up to `max_catch_up` missed publishes are
+    replayed per session and any older missed ticks are skipped so the session realigns with its grid.
+    """
+
+    def __init__(self, max_catch_up: int = 1, clock: Callable[[], float] = time.monotonic,
+                 rng: Optional[random.Random] = None) -> None:
+        """
+        Args:
+            max_catch_up (int): Missed publishes replayed per session after a stall.
+            clock (Callable[[], float]): Monotonic clock returning seconds.
+            rng (Optional[random.Random]): Random source used for jitter.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.max_catch_up: int = max_catch_up
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self._heap: List[Tuple[float, int, SimulatedSession]] = []
+        self._sequence = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def add(self, simulator: EnergySessionSimulator, topic: str, interval: float, jitter: float = 0.0,
+            start_at: Optional[float] = None) -> SimulatedSession:
+        """
+        Adds a simulated session to the schedule.
+
+        Args:
+            simulator (EnergySessionSimulator): The simulator producing payloads.
+            topic (str): The MQTT topic to publish to.
+            interval (float): Nominal seconds between publishes.
+            jitter (float): Maximum random offset in seconds applied to each publish.
+            start_at (Optional[float]): Clock time of the first publish, defaults to now.
+
+        Returns:
+            SimulatedSession: The scheduled session.
+        """
+        if interval <= 0:
+            raise ValueError("Simulator interval must be positive")
+        nominal_due = self.clock() if start_at is None else start_at
+        session = SimulatedSession(simulator, topic, interval, jitter, nominal_due)
+        self._push(session)
+        return session
+
+    def _push(self, session: SimulatedSession) -> None:
+        # Jitter is bounded by half the interval so consecutive publishes can never swap order
+        jitter = min(session.jitter, session.interval / 2)
+        offset = self.rng.uniform(-jitter, jitter) if jitter else 0.0
+        heapq.heappush(self._heap, (session.nominal_due + offset, next(self._sequence), session))
+
+    def seconds_until_next(self, now: Optional[float] = None) -> Optional[float]:
+        """
+        Returns how long to wait before the next publish is due, or None if nothing is scheduled.
+        """
+        if not self._heap:
+            return None
+        now = self.clock() if now is None else now
+        return max(0.0, self._heap[0][0] - now)
+
+    def run_due(self, now: Optional[float] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Produces the payloads for every session that is due and reschedules those sessions.
+
+        Args:
+            now (Optional[float]): Current clock time, defaults to the scheduler's clock.
+
+        Returns:
+            List[Tuple[str, Dict[str, Any]]]: The (topic, payload) pairs to publish, in due order.
+        """
+        now = self.clock() if now is None else now
+        due: List[Tuple[str, Dict[str, Any]]] = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, session = heapq.heappop(self._heap)
+            fired = 0
+            while session.nominal_due <= now and fired <= self.max_catch_up:
+                due.append((session.topic, session.simulator.simulate_energy_session_payload()))
+                session.nominal_due += session.interval
+                fired += 1
+            if session.nominal_due <= now:
+                # Still behind after catching up, skip the remaining ticks but stay on the interval grid
+                skipped = int((now - session.nominal_due) // session.interval) + 1
+                session.nominal_due += skipped * session.interval
+                self.logger.warning(
+                    f"Simulator for {session.topic} fell behind, skipped {skipped} publishes")
+            elif fired == 0:
+                # Popped early because of negative jitter, publish for the current tick
+                due.append((session.topic, session.simulator.simulate_energy_session_payload()))
+                session.nominal_due += session.interval
+            self._push(session)
+        return due
+
+    def _publish_all(self, publish: PublishCallback, now: Optional[float] = None) -> None:
+        for topic, payload in self.run_due(now):
+            try:
+                publish(topic, payload)
+            except Exception as e:
+                # Handle publishing-related exceptions and log the error
+                self.logger.exception(f"MQTT Publish Error: {str(e)}")
+
+    def run_blocking(self, publish: PublishCallback, stop_event: threading.Event) -> None:
+        """
+        Runs the schedule on the calling thread until `stop_event` is set. Setting the event stops it immediately.
+        """
+        while not stop_event.is_set():
+            wait = self.seconds_until_next()
+            if wait is None or stop_event.wait(wait):
+                break
+            self._publish_all(publish)
+
+    async def run_async(self, publish: PublishCallback) -> None:
+        """
+        Runs the schedule as an asyncio task until cancelled.
+        """
+        while True:
+            wait = self.seconds_until_next()
+            if wait is None:
+                return
+            await asyncio.sleep(wait)
+            self._publish_all(publish)
+
+
+def build_simulator_scheduler(default_topic: str) -> Optional[SimulatorScheduler]:
+    """
+    Builds a scheduler for the simulated sessions configured in Config.
+
+    Sessions are staggered evenly across one interval so they don't all publish at the same moment.
+
+    Args:
+        default_topic (str): Topic used when SIMULATOR_TOPIC_TEMPLATE is not set.
+
+    Returns:
+        Optional[SimulatorScheduler]: The scheduler, or None when the simulator is disabled.
+    """
+    if not Config.SIMULATOR_ENABLED or Config.SIMULATOR_SESSIONS < 1:
+        return None
+
+    scheduler = SimulatorScheduler(max_catch_up=Config.SIMULATOR_MAX_CATCH_UP)
+    topic_template = Config.SIMULATOR_TOPIC_TEMPLATE or default_topic
+    interval = Config.SIMULATOR_INTERVAL_SECONDS
+    now = scheduler.clock()
+    for index in range(Config.SIMULATOR_SESSIONS):
+        session_id = index + 1
+        scheduler.add(
+            EnergySessionSimulator(session_id=session_id),
+            topic_template.format(session_id=session_id),
+            interval,
+            jitter=Config.SIMULATOR_JITTER_SECONDS,
+            start_at=now + interval * index / Config.SIMULATOR_SESSIONS,
+        )
+    return scheduler
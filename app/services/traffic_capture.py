@@ -0,0 +1,236 @@
+import logging
+import struct
+import threading
+import time
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, NamedTuple, Optional
+from paho.mqtt.client import MQTTMessage
+from ..config import Config
+from .ingest_profiler import StageHistogram
+
+# File header, the trailing digit is the format version
+CAPTURE_MAGIC = b"MQTTCAP1"
+# Per message: receive time (epoch seconds), topic length, flags (QoS in bits 0-1, retain in bit 2),
+# payload length. The topic and payload bytes follow.
+RECORD_HEADER = struct.Struct("<dHBI")
+_RETAIN_FLAG = 0x04
+
+logger = logging.getLogger(__name__)
+
+
+class CaptureFormatError(ValueError):
+    """Raised when a file is not a traffic capture."""
+    pass
+
+
+class CapturedMessage(NamedTuple):
+    received_at: float
+    topic: bytes
+    payload: bytes
+    qos: int
+    retain: bool
+
+
+class TrafficRecorder:
+    """
+    Appends received MQTT messages to a compact binary capture file for later replay.
+
+    Records are written through a buffered file, so recording costs a struct pack and a memory copy per
+    message. Recording stops with a warning once the file reaches `max_bytes`. Reopening an existing capture
+    appends to it, after cutting off a record left incomplete by a crash.
+
+    :raises CaptureFormatError: If the file exists and is not a traffic capture.
+    """
+
+    def __init__(self, path: str, max_bytes: int = Config.CAPTURE_MAX_BYTES, buffer_size: int = 256 * 1024) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.recorded = 0
+        self._lock = threading.Lock()
+        self._file: Optional[BinaryIO] = open(path, "ab", buffering=buffer_size)
+        try:
+            size = self._file.tell()
+            self._size = _complete_length(path, size) if size else 0
+            if self._size < size:
+                logger.warning(f"Incomplete record at the end of {path}, truncated to {self._size} bytes")
+                self._file.truncate(self._size)
+            if self._size == 0:
+                self._file.write(CAPTURE_MAGIC)
+                self._size = len(CAPTURE_MAGIC)
+        except Exception:
+            self._file.close()
+            raise
+
+    def record(self, message: MQTTMessage, received_at: Optional[float] = None) -> None:
+        """
+        Appends a message as it was received.
+
+        :param message: The received message.
+        :param received_at: The receive time in epoch seconds, defaults to now.
+        """
+        topic = message.topic.encode("utf-8")
+        payload = message.payload
+        flags = (message.qos & 0x03) | (_RETAIN_FLAG if message.retain else 0)
+        header = RECORD_HEADER.pack(time.time() if received_at is None else received_at, len(topic), flags,
+                                    len(payload))
+        with self._lock:
+            if self._file is None:
+                return
+            size = self._size + len(header) + len(topic) + len(payload)
+            if self.max_bytes and size > self.max_bytes:
+                logger.warning(f"Traffic capture {self.path} reached {self.max_bytes} bytes, recording stopped")
+                self._close()
+                return
+            self._file.write(header)
+            self._file.write(topic)
+            self._file.write(payload)
+            self._size = size
+            self.recorded += 1
+
+    def close(self) -> None:
+        """
+        Flushes and closes the capture file.
+        """
+        with self._lock:
+            self._close()
+
+    def _close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _complete_length(path: str, size: int) -> int:
+    """
+    Returns the length of an existing capture up to the end of its last complete record, 0 if even the header
+    is incomplete. Only the record headers are read.
+
+    :raises CaptureFormatError: If the file is not a traffic capture.
+    """
+    with open(path, "rb") as capture:
+        magic = capture.read(len(CAPTURE_MAGIC))
+        if magic != CAPTURE_MAGIC:
+            if len(magic) < len(CAPTURE_MAGIC) and CAPTURE_MAGIC.startswith(magic):
+                return 0
+            raise CaptureFormatError(f"{path} is not a traffic capture")
+        end = len(CAPTURE_MAGIC)
+        while True:
+            header = capture.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return end
+            _, topic_length, _, payload_length = RECORD_HEADER.unpack(header)
+            record_end = end + RECORD_HEADER.size + topic_length + payload_length
+            if record_end > size:
+                return end
+            end = record_end
+            capture.seek(end)
+
+
+def read_capture(path: str) -> Iterator[CapturedMessage]:
+    """
+    Reads the messages of a capture file in recorded order. A record cut short at the end of the file,
+    e.g. by a crash while recording, is skipped with a warning.
+
+    :param path: The capture file.
+    :return: An iterator over the captured messages.
+    :raises CaptureFormatError: If the file is not a traffic capture.
+    """
+    with open(path, "rb") as capture:
+        if capture.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise CaptureFormatError(f"{path} is not a traffic capture")
+        while True:
+            header = capture.read(RECORD_HEADER.size)
+            if not header:
+                return
+            if len(header) == RECORD_HEADER.size:
+                received_at, topic_length, flags, payload_length = RECORD_HEADER.unpack(header)
+                topic = capture.read(topic_length)
+                payload = capture.read(payload_length)
+                if len(topic) == topic_length and len(payload) == payload_length:
+                    yield CapturedMessage(received_at, topic, payload, flags & 0x03, bool(flags & _RETAIN_FLAG))
+                    continue
+            logger.warning(f"Truncated record at the end of {path}, skipped")
+            return
+
+
+def to_mqtt_message(captured: CapturedMessage) -> MQTTMessage:
+    """
+    Rebuilds the paho message for a captured message, for feeding it straight into MQTTClient.on_message.
+    """
+    message = MQTTMessage(topic=captured.topic)
+    message.payload = captured.payload
+    message.qos = captured.qos
+    message.retain = captured.retain
+    return message
+
+
+class ReplayReport(NamedTuple):
+    messages: int
+    seconds: float
+    capture_seconds: float
+    throughput: float
+    latency: Dict[str, float]
+    lag: Optional[Dict[str, float]]
+    # End-to-end latency measured by the caller, e.g. from publishing to receiving the message back
+    round_trip: Optional[Dict[str, float]] = None
+
+    def format(self) -> str:
+        lines = [f"Replayed {self.messages} messages ({self.capture_seconds:.1f}s of traffic) in "
+                 f"{self.seconds:.2f}s: {self.throughput:.0f} msg/s"]
+        round_trip_title = None
+        if self.round_trip is not None:
+            round_trip_title = f"Broker round trip, {self.round_trip['count']} of {self.messages} received"
+        for title, stats in (("Delivery latency", self.latency), ("Lag behind schedule", self.lag),
+                             (round_trip_title, self.round_trip)):
+            if stats is not None:
+                lines.append(f"{title} (us): " + ", ".join(
+                    f"{name[:-3]} {value:.1f}" for name, value in stats.items() if name.endswith("_us")))
+        return "\n".join(lines)
+
+
+def replay(messages: Iterable[CapturedMessage], deliver: Callable[[CapturedMessage], None],
+           speed: Optional[float] = 1.0, clock: Callable[[], float] = time.perf_counter,
+           sleep: Callable[[float], None] = time.sleep) -> ReplayReport:
+    """
+    Delivers captured messages with their original spacing divided by `speed`, or back to back when speed
+    is None.
+
+    Latency is the time spent in `deliver` for each message, e.g. the whole ingest path. Lag is measured
+    from the time a message was due to the time `deliver` returned, so it also shows the replay falling
+    behind the schedule; it is not reported at maximum speed.
+
+    :param messages: The captured messages, in recorded order.
+    :param deliver: Called with each message, e.g. to publish it or to pass it to on_message.
+    :param speed: The replay speed factor, None for as fast as possible.
+    :return: The achieved throughput, latency and lag distributions.
+    """
+    latency = StageHistogram()
+    lag = StageHistogram() if speed else None
+    count = 0
+    first_received = last_received = None
+    start = clock()
+    for message in messages:
+        if first_received is None:
+            first_received = message.received_at
+        last_received = message.received_at
+        due = None
+        if lag is not None:
+            due = start + (message.received_at - first_received) / speed
+            delay = due - clock()
+            if delay > 0:
+                sleep(delay)
+        sent = clock()
+        deliver(message)
+        done = clock()
+        latency.record(int((done - sent) * 1e9))
+        if due is not None:
+            lag.record(max(int((done - due) * 1e9), 0))
+        count += 1
+    seconds = clock() - start
+    return ReplayReport(
+        messages=count,
+        seconds=seconds,
+        capture_seconds=(last_received - first_received) if count else 0.0,
+        throughput=count / seconds if seconds > 0 else 0.0,
+        latency=latency.snapshot(),
+        lag=lag.snapshot() if lag is not None else None,
+    )
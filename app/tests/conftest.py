@@ -0,0 +1,4 @@
+import os
+
+# Write logs synchronously during tests, so they are captured with the test that produced them
+os.environ.setdefault("LOG_QUEUE_SIZE", "0")
@@ -1,9 +1,12 @@
+import json
 import pytest
 from typing import Any, Dict
 from fastapi.testclient import TestClient
 from unittest.mock import patch
 from app.main import app
 from bson import ObjectId
+from app.services.change_tracker import change_tracker
+from app.services.database_client import DatabaseError
 
 
 @pytest.fixture
@@ -22,6 +25,20 @@ def test_get_all_messages_success(client):
         assert response.json() == test_data
 
 
+def test_get_all_messages_converts_object_ids(client):
+    object_id = ObjectId()
+    test_data = [{'_id': object_id, 'timestamp': '2023-12-18 18:38:31', 'topic': 'charger/1/connector/1/session/1',
+                  'payload': {'session_id': 1, 'energy_delivered_in_kWh': 30.5, 'duration_in_seconds': 45, 'session_cost_in_cents': 70}}]
+
+    with patch('app.services.database_client.DatabaseClient.get_all_messages', return_value=test_data):
+        response = client.get("/api/v1/messages")
+
+        assert response.status_code == 200
+        assert response.headers['content-type'] == 'application/json'
+        assert response.json()[0]['_id'] == str(object_id)
+        assert response.json()[0]['payload']['energy_delivered_in_kWh'] == 30.5
+
+
 def test_get_all_messages_failure(client):
     with patch('app.services.database_client.DatabaseClient.get_all_messages', side_effect=Exception("Database error")):
         response = client.get("/api/v1/messages")
@@ -29,3 +46,165 @@ def test_get_all_messages_failure(client):
         assert response.status_code == 500
         assert response.json() == {
             "detail": "Internal Server Error. Please try again later."}
+
+
+VALID_ITEM = {'topic': 'charger/1/connector/1/session/1',
+              'payload': {'session_id': 1, 'energy_delivered_in_kWh': 30.0, 'duration_in_seconds': 45, 'session_cost_in_cents': 70}}
+
+
+def test_ingest_batch_json_array(client):
+    items = [VALID_ITEM, {**VALID_ITEM, 'payload': {**VALID_ITEM['payload'], 'session_id': 'x'}}, VALID_ITEM]
+
+    with patch('app.services.database_client.DatabaseClient.save_messages', side_effect=len) as mock_save:
+        response = client.post("/api/v1/messages/batch", json=items)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert (body['received'], body['accepted'], body['rejected']) == (3, 2, 1)
+    assert body['errors'][0]['index'] == 1
+    assert body['errors'][0]['error'].startswith('payload.session_id')
+    saved = mock_save.call_args[0][0]
+    assert [doc['topic'] for doc in saved] == [VALID_ITEM['topic']] * 2
+
+
+def test_ingest_batch_ndjson(client):
+    body = "\n".join([json.dumps(VALID_ITEM), "{not json", "", json.dumps({**VALID_ITEM, 'timestamp': '2023-12-18 18:38:31'})])
+
+    with patch('app.services.database_client.DatabaseClient.save_messages', side_effect=len) as mock_save:
+        response = client.post("/api/v1/messages/batch", content=body,
+                               headers={"content-type": "application/x-ndjson"})
+
+    assert response.status_code == 200
+    assert response.json()['accepted'] == 2
+    assert response.json()['errors'][0]['index'] == 1
+    assert mock_save.call_args[0][0][1]['timestamp'] == '2023-12-18 18:38:31'
+
+
+def test_ingest_batch_malformed_body(client):
+    with patch('app.services.database_client.DatabaseClient.save_messages', side_effect=len):
+        response = client.post("/api/v1/messages/batch", content='{"topic": "a"}',
+                               headers={"content-type": "application/json"})
+
+    assert response.status_code == 400
+
+
+def test_ingest_batch_invalid_utf8(client):
+    with patch('app.services.database_client.DatabaseClient.save_messages', side_effect=len):
+        response = client.post("/api/v1/messages/batch", content=b'[{"topic":"charger/1","payload":{"x":"\xff"}}]',
+                               headers={"content-type": "application/json"})
+
+    assert response.status_code == 400
+
+
+def test_ingest_batch_database_failure(client):
+    with patch('app.services.database_client.DatabaseClient.save_messages', side_effect=Exception("Database error")):
+        response = client.post("/api/v1/messages/batch", json=[VALID_ITEM])
+
+    assert response.status_code == 500
+    assert response.json() == {
+        "detail": "Internal Server Error. Please try again later."}
+
+
+def test_ingest_batch_partial_database_failure(client):
+    with patch('app.services.database_client.DatabaseClient.save_messages',
+               side_effect=DatabaseError("Database Bulk Insertion Error: duplicate key", 1)):
+        response = client.post("/api/v1/messages/batch", json=[VALID_ITEM, VALID_ITEM])
+
+    assert response.status_code == 500
+    assert response.json() == {
+        "detail": "Database write failed after 1 stored items. Please try again later."}
+
+
+def test_get_all_messages_not_modified(client):
+    """
+    Test that a poll with a current ETag gets 304 without querying the database,
+    and that a stored message invalidates the ETag.
+    """
+    with patch('app.services.database_client.DatabaseClient.get_all_messages', return_value=[]) as mock_get:
+        etag = client.get("/api/v1/messages").headers['etag']
+
+        response = client.get("/api/v1/messages", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.headers['etag'] == etag
+        assert mock_get.call_count == 1
+
+        with change_tracker.writing():
+            pass
+        response = client.get("/api/v1/messages", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers['etag'] != etag
+
+
+def test_get_message_changes(client):
+    object_ids = [ObjectId(), ObjectId()]
+    entries = [{'_id': object_id, 'timestamp': '2023-12-18 18:38:31', 'topic': 'charger/1/connector/1/session/1',
+                'payload': VALID_ITEM['payload']} for object_id in object_ids]
+
+    with patch('app.services.database_client.DatabaseClient.get_messages_since', return_value=entries) as mock_since:
+        response = client.get("/api/v1/messages/changes", params={"since": str(object_ids[0]), "limit": 2})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [entry['_id'] for entry in body['entries']] == [str(object_id) for object_id in object_ids]
+    assert body['watermark'] == str(object_ids[1])
+    assert body['has_more'] is True
+    assert mock_since.call_args[0][:2] == (object_ids[0], 2)
+    assert 'etag' in response.headers
+
+
+def test_get_message_changes_keeps_watermark_when_empty(client):
+    since = str(ObjectId())
+    with patch('app.services.database_client.DatabaseClient.get_messages_since', return_value=[]):
+        response = client.get("/api/v1/messages/changes", params={"since": since})
+
+    assert response.json() == {"entries": [], "watermark": since, "has_more": False}
+
+
+def test_get_message_changes_not_modified(client):
+    with patch('app.services.database_client.DatabaseClient.get_messages_since', return_value=[]) as mock_since:
+        etag = client.get("/api/v1/messages/changes").headers['etag']
+        response = client.get("/api/v1/messages/changes", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert mock_since.call_count == 1
+
+
+def test_get_message_changes_next_page_is_not_cached(client):
+    """
+    Test that asking for the next page of a has_more response with the previous ETag returns the page,
+    and that an ETag from one endpoint or filter doesn't validate another.
+    """
+    object_ids = [ObjectId(), ObjectId(), ObjectId()]
+    entries = [{'_id': object_id, 'timestamp': '2023-12-18 18:38:31', 'topic': 'charger/1/connector/1/session/1',
+                'payload': VALID_ITEM['payload']} for object_id in object_ids]
+
+    with patch('app.services.database_client.DatabaseClient.get_messages_since',
+               side_effect=[entries[:2], entries[2:]]):
+        first = client.get("/api/v1/messages/changes", params={"limit": 2})
+        assert first.json()['has_more'] is True
+        second = client.get("/api/v1/messages/changes", params={"limit": 2, "since": first.json()['watermark']},
+                            headers={"If-None-Match": first.headers['etag']})
+
+    assert second.status_code == 200
+    assert [entry['_id'] for entry in second.json()['entries']] == [str(object_ids[2])]
+
+    with patch('app.services.database_client.DatabaseClient.get_all_messages', return_value=[]):
+        assert client.get("/api/v1/messages", params={"charger": "2"},
+                          headers={"If-None-Match": first.headers['etag']}).status_code == 200
+        etag = client.get("/api/v1/messages", params={"charger": "1"}).headers['etag']
+        assert client.get("/api/v1/messages", params={"charger": "2"},
+                          headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_get_message_changes_invalid_watermark(client):
+    response = client.get("/api/v1/messages/changes", params={"since": "not-an-id"})
+    assert response.status_code == 400
+
+
+def test_get_all_messages_filters(client):
+    with patch('app.services.database_client.DatabaseClient.get_all_messages', return_value=[]) as mock_get:
+        response = client.get("/api/v1/messages", params={"charger": "1", "start": "2024-01", "end": "2024-02-15"})
+
+    assert response.status_code == 200
+    mock_get.assert_called_once_with(charger="1", start="2024-01", end="2024-02-15")
+    assert client.get("/api/v1/messages", params={"start": "January"}).status_code == 422
@@ -0,0 +1,208 @@
+import json
+import time
+import socket
+import asyncio
+import pytest
+from unittest.mock import Mock, patch
+from app.services.async_mqtt_client import AsyncMQTTClient
+from app.services.session_deriver import SessionDerivationEngine
+from paho.mqtt.client import MQTTMessage
+
+
+@pytest.fixture
+def mock_mqtt_client():
+    """
+    A fixture to mock the paho.mqtt.client.Client.
+    """
+    with patch('paho.mqtt.client.Client') as MockClient:
+        yield MockClient()
+
+
+@pytest.fixture
+def mock_db_client():
+    """
+    A fixture to mock the DatabaseClient.
+    """
+    with patch('app.services.database_client.DatabaseClient') as MockDBClient:
+        mock_db_client = MockDBClient()
+        mock_db_client.save_message = Mock()
+        yield mock_db_client
+
+
+def make_message(payload: dict) -> MQTTMessage:
+    message = MQTTMessage()
+    message.payload = json.dumps(payload).encode()
+    message.topic = b'test/topic'
+    return message
+
+
+VALID_PAYLOAD = {
+    "session_id": 1,
+    "energy_delivered_in_kWh": 30.0,
+    "duration_in_seconds": 45,
+    "session_cost_in_cents": 70
+}
+
+
+def test_messages_iterator_receives_validated_entries(mock_mqtt_client, mock_db_client):
+    """
+    Test that messages received on the event loop are delivered through the async iterator
+    and that invalid payloads are not delivered.
+    """
+    async def scenario():
+        mqtt_client = AsyncMQTTClient("broker.test", 1883, "test/topic")
+        mqtt_client.loop = asyncio.get_running_loop()
+        iterator = mqtt_client.messages().__aiter__()
+        pending = asyncio.ensure_future(iterator.__anext__())
+        await asyncio.sleep(0)  # Let the consumer register its queue
+
+        mqtt_client.on_message(mock_mqtt_client, None, make_message(
+            {**VALID_PAYLOAD, "energy_delivered_in_kWh": "invalid"}))
+        mqtt_client.on_message(mock_mqtt_client, None, make_message(VALID_PAYLOAD))
+
+        entry = await asyncio.wait_for(pending, 1)
+        assert entry.topic == 'test/topic'
+        assert entry.payload.session_id == 1
+        await iterator.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_stop_ends_a_full_consumer_without_dropping_messages(mock_mqtt_client, mock_db_client):
+    """
+    Test that stop() ends the iterator of a consumer whose queue is full only after it has received every
+    buffered message.
+    """
+    async def scenario():
+        mqtt_client = AsyncMQTTClient("broker.test", 1883, "test/topic", queue_size=2)
+        mqtt_client.client = mock_mqtt_client
+        mqtt_client.db_client = mock_db_client
+        mqtt_client.loop = asyncio.get_running_loop()
+        iterator = mqtt_client.messages().__aiter__()
+        pending = asyncio.ensure_future(iterator.__anext__())
+        await asyncio.sleep(0)  # Let the consumer register its queue
+
+        for duration in (45, 60, 75):
+            mqtt_client.on_message(mock_mqtt_client, None, make_message(
+                {**VALID_PAYLOAD, "duration_in_seconds": duration}))
+            await asyncio.sleep(0)
+        first = await asyncio.wait_for(pending, 1)
+        await asyncio.wait_for(mqtt_client.stop(), 1)
+        rest = [entry async for entry in iterator]
+
+        assert [entry.payload.duration_in_seconds for entry in [first, *rest]] == [45, 60, 75]
+
+    asyncio.run(scenario())
+
+
+def test_start_persists_messages_and_stop_cancels_promptly(mock_mqtt_client, mock_db_client):
+    """
+    Test that start() wires persistence and publishing tasks into the loop and that stop()
+    cancels the publisher without waiting for its 60 second sleep.
+    """
+    async def scenario():
+        mqtt_client = AsyncMQTTClient("broker.test", 1883, "test/topic")
+        mqtt_client.client = mock_mqtt_client
+        mqtt_client.db_client = mock_db_client
+
+        await mqtt_client.start()
+        await asyncio.sleep(0.05)
+        mock_mqtt_client.connect.assert_called_with("broker.test", 1883, 60)
+        assert mock_mqtt_client.publish.called, "Publisher task should publish immediately"
+
+        mqtt_client.on_message(mock_mqtt_client, None, make_message(VALID_PAYLOAD))
+        await asyncio.sleep(0.05)
+        assert mock_db_client.save_message.called, "Message should be persisted"
+
+        await asyncio.wait_for(mqtt_client.stop(), 1)
+        assert not mqtt_client.running
+        assert not mqtt_client._tasks, "All background tasks should be finished"
+        mock_mqtt_client.disconnect.assert_called_once()
+
+    asyncio.run(scenario())
+
+
+def test_start_survives_a_misconfigured_simulator(mock_mqtt_client, mock_db_client):
+    """
+    Test that the connection and persistence tasks still run when the simulator scheduler can't be built.
+    """
+    async def scenario():
+        mqtt_client = AsyncMQTTClient("broker.test", 1883, "test/topic")
+        mqtt_client.client = mock_mqtt_client
+        mqtt_client.db_client = mock_db_client
+
+        with patch('app.services.async_mqtt_client.build_simulator_scheduler',
+                   side_effect=ValueError("Simulator interval must be positive")):
+            await mqtt_client.start()
+        await asyncio.sleep(0.05)
+        mock_mqtt_client.connect.assert_called_with("broker.test", 1883, 60)
+        assert not mock_mqtt_client.publish.called
+
+        mqtt_client.on_message(mock_mqtt_client, None, make_message(VALID_PAYLOAD))
+        await asyncio.wait_for(mqtt_client.stop(), 1)
+        assert mock_db_client.save_message.called, "Message should be persisted"
+
+    asyncio.run(scenario())
+
+
+def test_slow_database_pauses_reads_and_loses_nothing(mock_mqtt_client, mock_db_client):
+    """
+    Test that persistence never drops messages when the database is slower than the broker: reads from the
+    broker socket pause while too many messages wait, and stop() stores everything still queued.
+    """
+    async def scenario():
+        mqtt_client = AsyncMQTTClient("broker.test", 1883, "test/topic", queue_size=10)
+        mqtt_client.client = mock_mqtt_client
+        mqtt_client.db_client = mock_db_client
+        mqtt_client.scheduler = None
+        mock_db_client.save_message.side_effect = lambda document: time.sleep(0.01)
+        broker_side, client_side = socket.socketpair()
+        mock_mqtt_client.socket.return_value = client_side
+        try:
+            await mqtt_client.start()
+            mqtt_client.loop.add_reader(client_side, mock_mqtt_client.loop_read)
+            for session_id in range(100):
+                message = make_message({**VALID_PAYLOAD, "session_id": session_id})
+                mqtt_client.on_message(mock_mqtt_client, None, message)
+            assert mqtt_client._reading_paused
+
+            for _ in range(100):
+                await asyncio.sleep(0.05)
+                if not mqtt_client._reading_paused:
+                    break
+            assert not mqtt_client._reading_paused, "Reads should resume once the backlog is halved"
+            assert mqtt_client._persist_queue.qsize() <= 5
+            mqtt_client.on_message(mock_mqtt_client, None, make_message({**VALID_PAYLOAD, "session_id": 100}))
+
+            await asyncio.wait_for(mqtt_client.stop(), 5)
+            stored = [call.args[0]["payload"]["session_id"] for call in mock_db_client.save_message.call_args_list]
+            assert stored == list(range(101))
+        finally:
+            broker_side.close()
+            client_side.close()
+
+    with patch('app.services.async_mqtt_client.build_simulator_scheduler', return_value=None):
+        asyncio.run(scenario())
+
+
+def test_expired_held_messages_are_stored_without_new_traffic(mock_mqtt_client, mock_db_client):
+    """
+    Test that a message held back for reordering is stored once it expires, without another message arriving.
+    """
+    async def scenario():
+        mqtt_client = AsyncMQTTClient("broker.test", 1883, "test/topic")
+        mqtt_client.client = mock_mqtt_client
+        mqtt_client.db_client = mock_db_client
+        mqtt_client.deriver = SessionDerivationEngine(reorder_window=5, max_delay=0)
+
+        await mqtt_client.start()
+        mqtt_client.on_message(mock_mqtt_client, None, make_message(VALID_PAYLOAD))
+        await asyncio.sleep(0.1)
+        assert not mock_db_client.save_message.called, "The message should be held back"
+
+        await asyncio.sleep(1.1)
+        assert mock_db_client.save_message.called, "The expired message should be stored"
+        await asyncio.wait_for(mqtt_client.stop(), 1)
+
+    with patch('app.services.async_mqtt_client.build_simulator_scheduler', return_value=None):
+        asyncio.run(scenario())
@@ -0,0 +1,52 @@
+from bson import ObjectId
+from app.services.change_tracker import ChangeTracker, etag_matches
+
+
+def test_etag_changes_after_each_write():
+    tracker = ChangeTracker()
+    etag = tracker.etag()
+    with tracker.writing():
+        assert tracker.etag() == etag, "ETag only changes once the write completes"
+    assert tracker.etag() != etag
+
+
+def test_etag_changes_after_failed_write():
+    tracker = ChangeTracker()
+    etag = tracker.etag()
+    try:
+        with tracker.writing():
+            raise RuntimeError("Insertion failed")
+    except RuntimeError:
+        pass
+    assert tracker.etag() != etag
+
+
+def test_visible_before_covers_in_flight_writes():
+    """
+    Test that an _id generated during an in-flight write is never below the visibility bound.
+    """
+    tracker = ChangeTracker()
+    assert tracker.visible_before() is None
+    with tracker.writing():
+        written_id = ObjectId()
+        with tracker.writing():
+            assert tracker.visible_before() < written_id
+        assert tracker.visible_before() < written_id
+    assert tracker.visible_before() is None
+
+
+def test_etag_depends_on_query():
+    tracker = ChangeTracker()
+    assert tracker.etag("changes", None, 2) == tracker.etag("changes", None, 2)
+    assert tracker.etag("changes", None, 2) != tracker.etag("changes", "658091a7a1f31226d48a5c08", 2)
+    assert tracker.etag("messages", None, None, None) != tracker.etag("changes", None, None, None)
+
+
+def test_etag_matches():
+    etag = 'W/"abc-1"'
+    assert etag_matches('W/"abc-1"', etag)
+    assert etag_matches('"abc-1"', etag)
+    assert etag_matches('"other", W/"abc-1"', etag)
+    assert etag_matches('*', etag)
+    assert not etag_matches('W/"abc-2"', etag)
+    assert not etag_matches(None, etag)
@@ -0,0 +1,209 @@
+import random
+import socket
+import threading
+from unittest.mock import patch
+import paho.mqtt.client as mqtt
+from app.services.connectivity import ConnectivityMetrics, OfflinePublishQueue, ReconnectBackoff, parse_brokers
+from app.services.mqtt_client import MQTTClient
+
+
+class FakeClock:
+    def __init__(self, now: float = 0.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_client() -> MQTTClient:
+    with patch('app.services.mqtt_client.DatabaseClient'), patch('paho.mqtt.client.Client'):
+        mqtt_client = MQTTClient("primary", 1883, "test/topic")
+    mqtt_client.connectivity = ConnectivityMetrics()
+    mqtt_client.offline_queue = OfflinePublishQueue(mqtt_client.connectivity, max_size=3)
+    mqtt_client.brokers = [("primary", 1883), ("backup", 1884)]
+    return mqtt_client
+
+
+def test_parse_brokers():
+    assert parse_brokers("primary", 1883, "") == [("primary", 1883)]
+    assert parse_brokers("primary", 1883, "backup:1884, other") == [
+        ("primary", 1883), ("backup", 1884), ("other", 1883)]
+
+
+def test_backoff_grows_with_jitter_and_resets():
+    backoff = ReconnectBackoff(min_delay=0.5, max_delay=4, rng=random.Random(1))
+    delays = [backoff.next_delay() for _ in range(6)]
+    for delay, cap in zip(delays, (0.5, 1, 2, 4, 4, 4)):
+        assert cap / 2 <= delay <= cap
+    backoff.reset()
+    assert backoff.next_delay() <= 0.5
+
+
+def test_metrics_measure_reconnect_time():
+    clock = FakeClock()
+    metrics = ConnectivityMetrics(clock)
+    metrics.mark_connected("primary:1883")
+    clock.now = 10
+    metrics.mark_disconnected()
+    metrics.mark_disconnected()
+    clock.now = 12.5
+    assert metrics.snapshot()["disconnected_seconds"] == 2.5
+    metrics.mark_connected("backup:1884")
+
+    snapshot = metrics.snapshot()
+    assert (snapshot["connects"], snapshot["reconnects"], snapshot["disconnects"]) == (2, 1, 1)
+    assert snapshot["last_reconnect_seconds"] == 2.5
+    assert snapshot["broker"] == "backup:1884" and snapshot["disconnected_seconds"] is None
+
+
+def test_offline_queue_drops_oldest():
+    metrics = ConnectivityMetrics()
+    queue = OfflinePublishQueue(metrics, max_size=2)
+    for index in range(3):
+        queue.append((f"topic/{index}", "{}", 0, False))
+    assert [topic for topic, *_ in queue.drain()] == ["topic/1", "topic/2"]
+    assert (metrics.offline_dropped, metrics.offline_queued) == (1, 0)
+
+
+def test_publish_is_buffered_while_disconnected_and_flushed_on_connect():
+    """
+    Test that publishes made during an outage are queued and flushed in order on the next CONNACK,
+    after resubscribing.
+    """
+    mqtt_client = make_client()
+    mqtt_client.client.is_connected.return_value = False
+    for index in range(4):
+        mqtt_client.publish(f"topic/{index}", "{}")
+    mqtt_client.client.publish.assert_not_called()
+    assert mqtt_client.connectivity.offline_dropped == 1
+
+    mqtt_client.client.publish.return_value.rc = mqtt.MQTT_ERR_SUCCESS
+    mqtt_client.on_connect(mqtt_client.client, None, {}, 0)
+
+    mqtt_client.client.subscribe.assert_called_with("test/topic")
+    assert [call.args[0] for call in mqtt_client.client.publish.call_args_list] == ["topic/1", "topic/2", "topic/3"]
+    assert mqtt_client.connectivity.offline_flushed == 3 and len(mqtt_client.offline_queue) == 0
+    assert mqtt_client.connectivity.connected and mqtt_client.connectivity.broker == "primary:1883"
+
+
+def test_failed_qos0_publish_is_buffered():
+    mqtt_client = make_client()
+    mqtt_client.client.is_connected.return_value = True
+    mqtt_client.client.publish.return_value.rc = mqtt.MQTT_ERR_NO_CONN
+    mqtt_client.publish("topic", "{}")
+    assert len(mqtt_client.offline_queue) == 1
+
+    # Losing the connection again during the flush keeps the unsent publishes
+    mqtt_client.on_connect(mqtt_client.client, None, {}, 0)
+    assert len(mqtt_client.offline_queue) == 1
+
+
+def test_network_loop_fails_over_and_reconnects():
+    """
+    Test that an unreachable broker is skipped for the next one, and that a dropped connection is retried
+    on the same broker.
+    """
+    mqtt_client = make_client()
+    mqtt_client.backoff = ReconnectBackoff(min_delay=0.001, max_delay=0.002)
+    connects = []
+    loops = iter([mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_CONN_LOST, mqtt.MQTT_ERR_SUCCESS])
+
+    def connect(host, port, keepalive):
+        connects.append(host)
+        if len(connects) == 1:
+            raise ConnectionRefusedError("refused")
+        mqtt_client.on_connect(mqtt_client.client, None, {}, 0)
+
+    def loop(timeout):
+        rc = next(loops, None)
+        if rc is None:
+            mqtt_client._stop_event.set()
+            return mqtt.MQTT_ERR_SUCCESS
+        return rc
+
+    mqtt_client.client.connect.side_effect = connect
+    mqtt_client.client.loop.side_effect = loop
+    thread = threading.Thread(target=mqtt_client.run_network_loop)
+    thread.start()
+    thread.join(5)
+
+    assert not thread.is_alive()
+    assert connects == ["primary", "backup", "backup"]
+    snapshot = mqtt_client.connectivity.snapshot()
+    assert (snapshot["connect_failures"], snapshot["reconnects"], snapshot["broker"]) == (1, 1, "backup:1884")
+
+
+def test_refused_connack_fails_over():
+    mqtt_client = make_client()
+    mqtt_client.backoff = ReconnectBackoff(min_delay=0.001, max_delay=0.002)
+    connects = []
+
+    def connect(host, port, keepalive):
+        connects.append(host)
+        if len(connects) == 2:
+            mqtt_client._stop_event.set()
+
+    mqtt_client.client.connect.side_effect = connect
+    mqtt_client.client.loop.return_value = mqtt.MQTT_ERR_CONN_REFUSED
+    mqtt_client.run_network_loop()
+
+    assert connects == ["primary", "backup"]
+
+
+def test_network_loop_survives_errors():
+    """
+    Test that an exception from paho or a callback it runs is counted and followed by a reconnect instead of
+    ending the network thread.
+    """
+    mqtt_client = make_client()
+    mqtt_client.backoff = ReconnectBackoff(min_delay=0.001, max_delay=0.002)
+    connects = []
+    loops = iter([RuntimeError("callback failed"), mqtt.MQTT_ERR_SUCCESS])
+
+    def connect(host, port, keepalive):
+        connects.append(host)
+        mqtt_client.on_connect(mqtt_client.client, None, {}, 0)
+
+    def loop(timeout):
+        result = next(loops, None)
+        if result is None:
+            mqtt_client._stop_event.set()
+            return mqtt.MQTT_ERR_SUCCESS
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    mqtt_client.client.connect.side_effect = connect
+    mqtt_client.client.loop.side_effect = loop
+    thread = threading.Thread(target=mqtt_client.run_network_loop)
+    thread.start()
+    thread.join(5)
+
+    assert not thread.is_alive()
+    assert connects == ["primary", "primary"]
+    snapshot = mqtt_client.connectivity.snapshot()
+    assert (snapshot["connect_failures"], snapshot["reconnects"]) == (1, 1)
+
+
+def test_publish_from_another_thread_leaves_writing_to_the_network_loop():
+    """
+    Test that a publish from the simulator thread only queues the packet instead of writing to the socket
+    concurrently with the network thread.
+    """
+    with patch('app.services.mqtt_client.DatabaseClient'):
+        mqtt_client = MQTTClient("primary", 1883, "test/topic")
+    client_side, broker_side = socket.socketpair()
+    try:
+        mqtt_client.client._sock = client_side
+        mqtt_client.client._state = mqtt.mqtt_cs_connected
+        with patch.object(mqtt_client.client, 'loop_write') as loop_write:
+            publisher = threading.Thread(target=mqtt_client.publish, args=("topic", "payload"))
+            publisher.start()
+            publisher.join(5)
+
+        loop_write.assert_not_called()
+        assert len(mqtt_client.client._out_packet) == 1
+    finally:
+        mqtt_client.client._sock = None
+        client_side.close()
+        broker_side.close()
@@ -1,6 +1,10 @@
 import pytest
 from unittest.mock import patch, MagicMock
-from app.services.database_client import DatabaseClient, DatabaseError
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from app.services.database_client import DatabaseClient, DatabaseError, MESSAGE_PROJECTION
+from app.services.change_tracker import change_tracker
+from app.services.partitioning import PartitionScheme
 
 
 def test_init_success():
@@ -94,6 +98,8 @@ def test_get_all_messages_success():
             "duration_in_seconds": 45,
             "session_cost_in_cents": 70
         }]
+        mock_mongo.return_value.get_default_database.return_value.messages.find.assert_called_with(
+            {}, MESSAGE_PROJECTION)
 
 
 def test_get_all_messages_failure():
@@ -118,3 +124,114 @@ def test_close_connection():
         client = DatabaseClient()
         client.close_connection()
         mock_mongo.return_value.close.assert_called_once()
+
+
+def test_save_messages_success():
+    """
+    Test that save_messages stores the batch with a single unordered insert_many call.
+    """
+    with patch('app.services.database_client.MongoClient') as mock_mongo:
+        collection = mock_mongo.return_value.get_default_database.return_value.messages
+        collection.insert_many.return_value.inserted_ids = [1, 2]
+        client = DatabaseClient()
+        assert client.save_messages([{"topic": "a"}, {"topic": "b"}]) == 2
+        collection.insert_many.assert_called_once_with([{"topic": "a"}, {"topic": "b"}], ordered=False)
+
+
+def test_save_messages_failure():
+    """
+    Test that a failing bulk write raises a DatabaseError.
+    """
+    with patch('app.services.database_client.MongoClient') as mock_mongo:
+        mock_mongo.return_value.get_default_database.return_value.messages.insert_many.side_effect = Exception(
+            "Insertion failed")
+        client = DatabaseClient()
+        with pytest.raises(DatabaseError):
+            client.save_messages([{"topic": "a"}])
+
+
+def test_save_messages_partial_failure_reports_inserted():
+    """
+    Test that a bulk write failing part way reports how many messages it still stored.
+    """
+    with patch('app.services.database_client.MongoClient') as mock_mongo:
+        mock_mongo.return_value.get_default_database.return_value.messages.insert_many.side_effect = BulkWriteError(
+            {"nInserted": 2, "writeErrors": [{"index": 1, "code": 11000, "errmsg": "duplicate key"}]})
+        client = DatabaseClient()
+        with pytest.raises(DatabaseError) as error:
+            client.save_messages([{"topic": "a"}, {"topic": "b"}, {"topic": "c"}])
+        assert error.value.inserted == 2
+
+
+def test_get_messages_since():
+    """
+    Test that the changes query filters by watermark and in-flight bound, sorted oldest first.
+    """
+    with patch('app.services.database_client.MongoClient') as mock_mongo:
+        collection = mock_mongo.return_value.get_default_database.return_value.messages
+        collection.find.return_value.sort.return_value.limit.return_value = [{"_id": 2}]
+        client = DatabaseClient()
+        since, before = ObjectId(), ObjectId()
+
+        assert client.get_messages_since(since, 10, before) == [{"_id": 2}]
+        collection.find.assert_called_with({"_id": {"$gt": since, "$lt": before}}, MESSAGE_PROJECTION)
+        collection.find.return_value.sort.assert_called_with("_id", 1)
+        collection.find.return_value.sort.return_value.limit.assert_called_with(10)
+
+        client.get_messages_since(None, 10)
+        collection.find.assert_called_with({}, MESSAGE_PROJECTION)
+
+
+def test_partitioned_writes_are_routed():
+    """
+    Test that writes go to the charger and month partition of each message, batched per partition.
+    """
+    with patch('app.services.database_client.MongoClient') as mock_mongo:
+        db = mock_mongo.return_value.get_default_database.return_value
+        db.messages_c1_202401.insert_many.return_value.inserted_ids = [1, 2]
+        db.messages_c2_202402.insert_many.return_value.inserted_ids = [3]
+        client = DatabaseClient(PartitionScheme("charger_month"))
+        first = {"topic": "charger/1/connector/1", "timestamp": "2024-01-01 00:00:00"}
+        second = {"topic": "charger/2/connector/1", "timestamp": "2024-02-01 00:00:00"}
+
+        client.save_message(first)
+        db.messages_c1_202401.insert_one.assert_called_once_with(first)
+        assert client.save_messages([first, second, first]) == 3
+        db.messages_c1_202401.insert_many.assert_called_once_with([first, first], ordered=False)
+
+
+def test_partitioned_reads_fan_out_and_merge():
+    """
+    Test that reads only query matching partitions and merge their results in _id order.
+    """
+    with patch('app.services.database_client.MongoClient') as mock_mongo:
+        db = mock_mongo.return_value.get_default_database.return_value
+        db.list_collection_names.return_value = ["messages_202312", "messages_202401", "messages_202402"]
+        ids = sorted(ObjectId() for _ in range(4))
+        db.messages_202401.find.return_value.sort.return_value.limit.return_value = [{"_id": ids[0]}, {"_id": ids[2]}]
+        db.messages_202402.find.return_value.sort.return_value.limit.return_value = [{"_id": ids[1]}, {"_id": ids[3]}]
+        client = DatabaseClient(PartitionScheme("month"))
+
+        result = client.get_messages_since(None, 3, start="2024-01")
+
+        assert [message["_id"] for message in result] == ids[:3]
+        db.messages_202312.find.assert_not_called()
+        db.messages_202401.find.assert_called_with({"timestamp": {"$gte": "2024-01"}}, MESSAGE_PROJECTION)
+
+
+def test_drop_partitions_before():
+    with patch('app.services.database_client.MongoClient') as mock_mongo:
+        db = mock_mongo.return_value.get_default_database.return_value
+        db.list_collection_names.return_value = ["messages", "messages_202311", "messages_202312", "messages_202401"]
+        client = DatabaseClient(PartitionScheme("month"))
+        etag = change_tracker.etag("messages")
+
+        assert client.drop_partitions_before("2024-01") == ["messages_202311", "messages_202312"]
+        assert db.drop_collection.call_count == 2
+        assert change_tracker.etag("messages") != etag
+        for month in ("abc", "Jan-2024"):
+            with pytest.raises(ValueError):
+                client.drop_partitions_before(month)
+        assert db.drop_collection.call_count == 2
+        with pytest.raises(DatabaseError):
+            DatabaseClient(PartitionScheme("charger")).drop_partitions_before("202401")
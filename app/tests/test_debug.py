@@ -0,0 +1,44 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.services.ingest_profiler import ingest_profiler
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+def test_get_ingest_profile(client):
+    """
+    Test the ingest profile endpoint returns stage statistics for every stage.
+    """
+    response = client.get("/api/v1/debug/ingest-profile")
+    assert response.status_code == 200
+    body = response.json()
+    assert set(body["stages"]) == {"decode", "json", "validate", "dump", "derive", "insert", "log", "total"}
+    assert body["cpu_profile"]["running"] is False
+    assert body["dropped_log_records"] == 0
+
+
+def test_cpu_profile_toggle(client):
+    """
+    Test starting, rejecting a second start, and stopping the CPU profiler.
+    """
+    response = client.post("/api/v1/debug/ingest-profile/cpu", params={"seconds": 30})
+    assert response.status_code == 202
+    assert response.json()["running"] is True
+
+    assert client.post("/api/v1/debug/ingest-profile/cpu").status_code == 409
+
+    response = client.delete("/api/v1/debug/ingest-profile/cpu")
+    assert response.status_code == 200
+    assert response.json()["running"] is False
+    assert not ingest_profiler.cpu_profiler.running
+
+
+def test_get_mqtt_connectivity(client):
+    response = client.get("/api/v1/debug/mqtt-connectivity")
+    assert response.status_code == 200
+    body = response.json()
+    assert {"connected", "reconnects", "last_reconnect_seconds", "offline_queued", "offline_dropped"} <= set(body)
@@ -0,0 +1,113 @@
+import asyncio
+import json
+import pytest
+from typing import List
+from unittest.mock import Mock
+from app.services.ingest import BatchIngestor, MalformedBodyError, iter_json_array_items, iter_ndjson_items
+
+ITEM = {"topic": "charger/1/connector/1/session/1",
+        "payload": {"session_id": 1, "energy_delivered_in_kWh": 1.5, "duration_in_seconds": 45, "session_cost_in_cents": 70}}
+
+
+async def chunked(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def collect(items) -> List:
+    async def run():
+        return [item async for item in items]
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_json_array_items_across_chunk_boundaries(chunk_size):
+    """
+    Test that array elements are decoded correctly regardless of where the chunks split them.
+    """
+    body = json.dumps([ITEM, 12345, "ünïcode", [1, 2], None]).encode()
+    items = collect(iter_json_array_items(chunked(body, chunk_size), 1024))
+    assert [item for _, item, _ in items] == [ITEM, 12345, "ünïcode", [1, 2], None]
+    assert [index for index, _, _ in items] == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.parametrize("body", [b"", b"[", b"[1,", b"[1 2]", b'{"a": 1}', b"[1] x", b"[1,]",
+                                  b'[{"topic": "charger/1", "payload": {"x": "\xff"}}]', b"[1]  \xff", b'["\xc3'])
+def test_json_array_items_malformed(body):
+    with pytest.raises(MalformedBodyError):
+        collect(iter_json_array_items(chunked(body, 2), 1024))
+
+
+def test_json_array_items_empty_array():
+    assert collect(iter_json_array_items(chunked(b" [ ] \n", 2), 1024)) == []
+
+
+def test_json_array_item_too_large():
+    body = b'[{"topic": "' + b"x" * 100
+    with pytest.raises(MalformedBodyError):
+        collect(iter_json_array_items(chunked(body, 10), 50))
+
+
+def test_ndjson_items_report_bad_lines():
+    body = b'{"a": 1}\n\nnot json\r\n{"b": 2}'
+    items = collect(iter_ndjson_items(chunked(body, 3), 1024))
+    assert items[0] == (0, {"a": 1}, None)
+    assert items[1][0] == 1 and items[1][2].startswith("Invalid JSON")
+    assert items[2] == (2, {"b": 2}, None)
+
+
+def test_ndjson_complete_line_too_large():
+    """
+    Test that the size limit applies to every line, not only to an unfinished one at the end of the buffer.
+    """
+    body = b'{"a": 1}\n{"b": "' + b"x" * 100 + b'"}\n{"c": 3}\n'
+    with pytest.raises(MalformedBodyError):
+        collect(iter_ndjson_items(chunked(body, 4096), 50))
+
+
+def test_batch_ingestor_flushes_in_bounded_writes():
+    """
+    Test that the ingestor never buffers more than write_size documents and caps reported errors.
+    """
+    db_client = Mock()
+    db_client.save_messages.side_effect = len
+    body = "\n".join([json.dumps(ITEM)] * 25 + ["[]"] * 5).encode()
+    ingestor = BatchIngestor(db_client, write_size=10, max_reported_errors=3)
+
+    result = asyncio.run(ingestor.ingest(iter_ndjson_items(chunked(body, 64), 1024)))
+
+    assert [len(call.args[0]) for call in db_client.save_messages.call_args_list] == [10, 10, 5]
+    assert (result.received, result.accepted, result.rejected) == (30, 25, 5)
+    assert len(result.errors) == 3 and result.errors_truncated
+
+
+def test_batch_ingestor_derives_session_fields():
+    db_client = Mock()
+    db_client.save_messages.side_effect = len
+    later = {"topic": ITEM["topic"], "payload": {**ITEM["payload"], "energy_delivered_in_kWh": 1.7,
+                                                  "duration_in_seconds": 105}}
+    body = json.dumps([ITEM, later]).encode()
+
+    asyncio.run(BatchIngestor(db_client).ingest(iter_json_array_items(chunked(body, 64), 1024)))
+
+    stored = db_client.save_messages.call_args[0][0]
+    assert stored[1]["derived"]["interval_seconds"] == 60
+    assert stored[1]["derived"]["power_kW"] == pytest.approx(12.0)
+
+
+def test_batch_ingestor_rejects_malformed_timestamps():
+    """
+    Test that client supplied timestamps must match the format the MQTT path stores, since partitions and
+    range queries compare them as strings.
+    """
+    db_client = Mock()
+    db_client.save_messages.side_effect = len
+    timestamps = ["2024-05-01 12:00:00", "05/01/2024", "2024-5-1 12:00:00", "2024-02-30 12:00:00", 1714564800]
+    body = json.dumps([{**ITEM, "timestamp": timestamp} for timestamp in timestamps]).encode()
+
+    result = asyncio.run(BatchIngestor(db_client).ingest(iter_json_array_items(chunked(body, 64), 1024)))
+
+    assert (result.accepted, result.rejected) == (1, 4)
+    assert [error.index for error in result.errors] == [1, 2, 3, 4]
+    assert result.errors[0].error.startswith("timestamp:")
+    assert db_client.save_messages.call_args[0][0][0]["timestamp"] == "2024-05-01 12:00:00"
@@ -0,0 +1,77 @@
+import json
+import time
+from unittest.mock import patch
+from paho.mqtt.client import MQTTMessage
+from app.services.ingest_profiler import (STAGES, IngestProfiler, StageHistogram, _bucket_index,
+                                          _bucket_upper_bound)
+from app.services.mqtt_client import MQTTClient
+
+
+def test_bucket_bounds_are_within_25_percent():
+    for ns in [0, 1, 3, 4, 5, 7, 8, 9, 1000, 123_456, 10**9]:
+        upper = _bucket_upper_bound(_bucket_index(ns))
+        assert ns <= upper <= max(ns * 1.25, ns + 1)
+
+
+def test_histogram_snapshot():
+    histogram = StageHistogram()
+    for us in range(1, 101):
+        histogram.record(us * 1000)
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 100
+    assert snapshot["mean_us"] == 50.5
+    assert 50 <= snapshot["p50_us"] <= 63
+    assert 99 <= snapshot["p99_us"] <= 100
+    assert snapshot["max_us"] == 100
+
+
+def test_flight_recorder_keeps_slow_messages_slowest_first():
+    profiler = IngestProfiler(enabled=True, slow_threshold_ms=1, flight_recorder_size=2)
+    profiler.record("fast", [0, 10, 20])
+    profiler.record("slow", [0, 2_000_000, 3_000_000])
+    profiler.record("slower", [0, 1_000_000, 5_000_000])
+    profiler.record("slowest", [0, 9_000_000])
+
+    snapshot = profiler.snapshot()
+    assert [entry["topic"] for entry in snapshot["slowest"]] == ["slowest", "slower"]
+    assert snapshot["slowest"][1]["stages"] == {"decode": 1000.0, "json": 4000.0}
+    assert snapshot["stages"]["total"]["count"] == 4
+    assert snapshot["stages"]["json"]["count"] == 3
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = IngestProfiler(enabled=False)
+    timer = profiler.start("topic")
+    timer.mark()
+    timer.finish()
+    assert profiler.snapshot()["stages"]["total"]["count"] == 0
+
+
+def test_on_message_records_every_stage():
+    """
+    Test that MQTTClient.on_message marks each ingest stage.
+    """
+    with patch('paho.mqtt.client.Client'), patch('app.services.mqtt_client.DatabaseClient'):
+        mqtt_client = MQTTClient("broker.test", 1883, "test/topic")
+    mqtt_client.profiler = IngestProfiler(enabled=True, slow_threshold_ms=0)
+
+    message = MQTTMessage()
+    message.payload = json.dumps({"session_id": 1, "energy_delivered_in_kWh": 30.0,
+                                  "duration_in_seconds": 45, "session_cost_in_cents": 70}).encode()
+    message.topic = b'test/topic'
+    mqtt_client.on_message(None, None, message)
+
+    snapshot = mqtt_client.profiler.snapshot()
+    assert all(snapshot["stages"][stage]["count"] == 1 for stage in STAGES)
+    assert set(snapshot["slowest"][0]["stages"]) == set(STAGES)
+
+
+def test_cpu_profiler_is_bounded():
+    profiler = IngestProfiler(cpu_interval_ms=1)
+    assert profiler.cpu_profiler.start(0.05)
+    assert not profiler.cpu_profiler.start(1), "Only one profile may run at a time"
+    time.sleep(0.2)
+    cpu_profile = profiler.snapshot()["cpu_profile"]
+    assert not cpu_profile["running"]
+    assert cpu_profile["samples"] > 0
+    assert cpu_profile["stacks"][0]["stack"]
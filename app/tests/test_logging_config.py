@@ -0,0 +1,131 @@
+import io
+import json
+import logging
+import queue
+import sys
+from unittest.mock import patch
+from app.config import Config
+from app.logging_config import (MESSAGE_LOGGER_NAME, DeferredQueueHandler, JsonFormatter, SamplingFilter,
+                                configure_logging, dropped_log_records, message_log_enabled, shutdown_logging)
+
+
+def make_record(msg: str = "Received message on %s", args=("topic",), **extra) -> logging.LogRecord:
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter_includes_extra_fields():
+    """
+    Test that fields passed through `extra` end up as structured JSON fields.
+    """
+    output = json.loads(JsonFormatter().format(make_record(entry={"topic": "topic", "payload": {"session_id": 1}})))
+    assert output["message"] == "Received message on topic"
+    assert output["level"] == "INFO"
+    assert output["entry"] == {"topic": "topic", "payload": {"session_id": 1}}
+
+
+def test_deferred_queue_handler_does_not_format():
+    """
+    Test that records are queued unformatted and dropped rather than blocking when the queue is full.
+    """
+    log_queue = queue.Queue(maxsize=1)
+    handler = DeferredQueueHandler(log_queue)
+    record = make_record()
+    handler.emit(record)
+    handler.emit(make_record())
+
+    queued = log_queue.get_nowait()
+    assert queued is record
+    assert queued.args == ("topic",) and not hasattr(queued, "message")
+    assert handler.dropped == 1
+
+
+def test_sampling_filter_rate():
+    assert not any(SamplingFilter(sample_rate=0.0).filter(make_record()) for _ in range(100))
+    assert all(SamplingFilter(sample_rate=1.0).filter(make_record()) for _ in range(100))
+
+
+def test_sampling_filter_rate_limit():
+    with patch('app.logging_config.time.monotonic', return_value=100.0):
+        rate_limited = SamplingFilter(max_per_second=5)
+        assert sum(rate_limited.filter(make_record()) for _ in range(50)) == 5
+    with patch('app.logging_config.time.monotonic', return_value=101.0):
+        assert sum(rate_limited.filter(make_record()) for _ in range(50)) == 5
+
+
+def test_configure_logging_writes_json_lines_from_listener():
+    """
+    Test the full pipeline: records go through the queue and are written as JSON by the listener,
+    and per-message logs respect the sampling configuration.
+    """
+    stream = io.StringIO()
+    try:
+        with patch.object(Config, 'LOG_FORMAT', 'json'), patch.object(Config, 'LOG_MESSAGE_SAMPLE_RATE', 0.0), \
+                patch.object(Config, 'LOG_QUEUE_SIZE', 100):
+            assert configure_logging(stream) is not None
+        logging.getLogger("app.test").warning("Something happened")
+        if message_log_enabled():
+            logging.getLogger(MESSAGE_LOGGER_NAME).info("Received message on %s", "topic")
+        shutdown_logging()
+
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        assert [line["message"] for line in lines] == ["Something happened"]
+        assert lines[0]["logger"] == "app.test"
+    finally:
+        configure_logging()
+
+
+def test_configure_logging_without_queue_writes_synchronously():
+    stream = io.StringIO()
+    try:
+        with patch.object(Config, 'LOG_FORMAT', 'text'), patch.object(Config, 'LOG_QUEUE_SIZE', 0):
+            assert configure_logging(stream) is None
+        logging.getLogger("app.test").warning("Something happened")
+        assert stream.getvalue() == "WARNING:app.test:Something happened\n"
+    finally:
+        configure_logging()
+
+
+def test_default_stream_is_original_stderr():
+    """
+    Test that logs go to the process's stderr even when sys.stderr has been replaced, e.g. by a test runner
+    that closes its replacement before the records flushed at exit are written.
+    """
+    try:
+        with patch.object(Config, 'LOG_QUEUE_SIZE', 0), patch('sys.stderr', io.StringIO()):
+            configure_logging()
+            streams = [getattr(handler, "stream", None) for handler in logging.getLogger().handlers]
+        assert sys.__stderr__ in streams
+    finally:
+        configure_logging()
+
+
+def test_message_log_enabled_respects_level():
+    try:
+        with patch.object(Config, 'LOG_MESSAGE_LEVEL', 'WARNING'):
+            configure_logging(io.StringIO())
+        assert not message_log_enabled()
+        configure_logging(io.StringIO())
+        assert message_log_enabled()
+    finally:
+        configure_logging()
+
+
+def test_listener_stops_with_full_queue():
+    """
+    Test that shutdown doesn't fail when the bounded queue is full.
+    """
+    stream = io.StringIO()
+    try:
+        with patch.object(Config, 'LOG_QUEUE_SIZE', 5):
+            listener = configure_logging(stream)
+        listener.flush_interval = 0.5  # Let the queue fill up while the listener sleeps
+        for index in range(50):
+            logging.getLogger("app.test").warning("Record %d", index)
+        dropped = dropped_log_records()
+        shutdown_logging()
+        assert dropped > 0
+        assert f"{dropped} log records were dropped" in stream.getvalue()
+    finally:
+        configure_logging()
@@ -3,6 +3,7 @@ import pytest
 import threading
 from unittest.mock import Mock, patch, MagicMock, call
 from app.services.mqtt_client import MQTTClient
+from app.services.session_deriver import SessionDerivationEngine
 from paho.mqtt.client import MQTTMessage
 
 
@@ -105,6 +106,20 @@ def test_start_publish_thread(mock_mqtt_client, mock_db_client, mock_thread):
     assert expected_call in mock_thread_calls, "Expected thread start call not found"
 
 
+def test_start_survives_a_misconfigured_simulator(mock_mqtt_client, mock_db_client, mock_thread):
+    """
+    Test that the network thread still starts when the simulator scheduler can't be built.
+    """
+    mqtt_client = MQTTClient("broker.test", 1883, "test/topic")
+    with patch('app.services.mqtt_client.build_simulator_scheduler',
+               side_effect=ValueError("Simulator interval must be positive")):
+        mqtt_client.start()
+
+    assert call(target=mqtt_client.run_network_loop, name="mqtt-network", daemon=True) in mock_thread.mock_calls
+    assert call(target=mqtt_client.publish_message_periodically) not in mock_thread.mock_calls
+    assert mqtt_client.running
+
+
 def test_stop_publish_thread(mock_mqtt_client, mock_db_client, mock_thread):
     """
     Test that the MQTTClient stops its publishing thread correctly.
@@ -186,3 +201,84 @@ def test_on_message_exception_handling(mock_mqtt_client, mock_db_client, caplog)
     mqtt_client.on_message(mock_mqtt_client, None, message)
 
     assert "Error processing message" in caplog.text, "Exception should be logged"
+
+
+def test_held_messages_are_stored_on_stop(mock_mqtt_client, mock_db_client):
+    """
+    Test that messages held back for reordering are derived and bulk saved when the client stops.
+    """
+    mqtt_client = MQTTClient("broker.test", 1883, "test/topic")
+    mqtt_client.db_client = mock_db_client
+    mqtt_client.deriver.reorder_window = 5
+
+    for duration, energy in ((120, 0.4), (60, 0.2)):
+        message = MQTTMessage()
+        message.payload = json.dumps({
+            "session_id": 1,
+            "energy_delivered_in_kWh": energy,
+            "duration_in_seconds": duration,
+            "session_cost_in_cents": 70
+        }).encode()
+        message.topic = b'test/topic'
+        mqtt_client.on_message(mock_mqtt_client, None, message)
+
+    assert not mock_db_client.save_message.called
+    mqtt_client.stop()
+
+    saved = mock_db_client.save_messages.call_args[0][0]
+    assert [doc['payload']['duration_in_seconds'] for doc in saved] == [60, 120]
+    assert saved[1]['derived']['power_kW'] == pytest.approx(12.0)
+
+
+def test_network_loop_stores_expired_held_messages(mock_mqtt_client, mock_db_client):
+    """
+    Test that a message held back for reordering is stored by the network loop once it expires, without
+    waiting for another message to arrive.
+    """
+    mqtt_client = MQTTClient("broker.test", 1883, "test/topic")
+    mqtt_client.client = mock_mqtt_client
+    mqtt_client.db_client = mock_db_client
+    now = [0.0]
+    mqtt_client.deriver = SessionDerivationEngine(reorder_window=5, max_delay=2, clock=lambda: now[0])
+
+    message = MQTTMessage()
+    message.payload = json.dumps({
+        "session_id": 1,
+        "energy_delivered_in_kWh": 0.4,
+        "duration_in_seconds": 120,
+        "session_cost_in_cents": 70
+    }).encode()
+    message.topic = b'test/topic'
+    mqtt_client.on_message(mock_mqtt_client, None, message)
+    assert not mock_db_client.save_message.called
+
+    def loop(timeout):
+        now[0] += 1
+        if now[0] >= 3:
+            mqtt_client._stop_event.set()
+        return 0
+
+    mock_mqtt_client.loop.side_effect = loop
+    mqtt_client.run_network_loop()
+
+    saved = mock_db_client.save_message.call_args[0][0]
+    assert saved['payload']['duration_in_seconds'] == 120
+
+
+def test_stop_skips_flush_while_network_thread_is_busy(mock_mqtt_client, mock_db_client, caplog):
+    """
+    Test that stop() doesn't touch the derivation engine or the recorder while the network thread is still
+    running a callback.
+    """
+    mqtt_client = MQTTClient("broker.test", 1883, "test/topic")
+    mqtt_client.deriver = Mock()
+    mqtt_client.recorder = Mock()
+    mqtt_client._network_thread = Mock()
+    mqtt_client._network_thread.is_alive.return_value = True
+
+    mqtt_client.stop()
+
+    mqtt_client._network_thread.join.assert_called_once_with(timeout=5)
+    mqtt_client.deriver.flush.assert_not_called()
+    mqtt_client.recorder.close.assert_not_called()
+    assert "did not stop" in caplog.text
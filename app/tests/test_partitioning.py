@@ -0,0 +1,67 @@
+import pytest
+from app.services.partitioning import (PartitionScheme, build_message_filter, charger_from_topic,
+                                       month_from_timestamp, parse_month)
+
+NAMES = ["messages", "messages_c1_202312", "messages_c1_202401", "messages_c2_202401", "messages_202401",
+         "messages_c3", "system.views", "other"]
+
+
+def make_document(topic: str = "charger/1/connector/1/session/1", timestamp: str = "2024-01-15 10:00:00") -> dict:
+    return {"topic": topic, "timestamp": timestamp, "payload": {}}
+
+
+@pytest.mark.parametrize("strategy,expected", [
+    ("none", "messages"),
+    ("charger", "messages_c1"),
+    ("month", "messages_202401"),
+    ("charger_month", "messages_c1_202401"),
+])
+def test_collection_for(strategy, expected):
+    assert PartitionScheme(strategy).collection_for(make_document()) == expected
+
+
+def test_charger_ids_are_sanitized():
+    assert charger_from_topic("charger/a.b_c/connector/1") == "a-b-c"
+    assert charger_from_topic("sensors/1") == "unknown"
+    assert month_from_timestamp("2024-02") == "202402"
+    assert month_from_timestamp("not a timestamp") is None
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        PartitionScheme("weekly")
+
+
+def test_select_prunes_by_charger_and_month():
+    scheme = PartitionScheme("charger_month")
+    assert scheme.select(NAMES, include_legacy=False) == [
+        "messages_c1_202312", "messages_c1_202401", "messages_c2_202401"]
+    assert scheme.select(NAMES, charger="1", include_legacy=False) == ["messages_c1_202312", "messages_c1_202401"]
+    assert scheme.select(NAMES, start="2024-01-10", include_legacy=False) == [
+        "messages_c1_202401", "messages_c2_202401"]
+    assert scheme.select(NAMES, charger="2", end="2023-12-31", include_legacy=False) == []
+    assert PartitionScheme("charger").select(NAMES, charger="3", include_legacy=False) == ["messages_c3"]
+    assert PartitionScheme("none").select(NAMES, charger="3") == ["messages"]
+
+
+def test_select_includes_the_unpartitioned_collection():
+    """
+    Test that messages stored before partitioning was enabled stay readable.
+    """
+    assert PartitionScheme("month").select(NAMES, start="2024-01") == ["messages", "messages_202401"]
+    assert PartitionScheme("month").select(NAMES[1:], start="2024-01") == ["messages_202401"]
+
+
+def test_parse_month():
+    assert parse_month("2024-01") == parse_month("202401") == "202401"
+    for month in ("abc", "Jan-2024", "2024-1", "2024-13", "", "2024-01-01"):
+        with pytest.raises(ValueError):
+            parse_month(month)
+
+
+def test_build_message_filter():
+    assert build_message_filter() == {}
+    assert build_message_filter(charger="1.5", start="2024-01", end="2024-02") == {
+        "topic": {"$regex": "^charger/1\\.5/"},
+        "timestamp": {"$gte": "2024-01", "$lt": "2024-02"},
+    }
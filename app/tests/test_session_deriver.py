@@ -0,0 +1,166 @@
+import pytest
+from app.services.session_deriver import SessionDerivationEngine
+
+
+class FakeClock:
+    """
+    A manually advanced clock for deterministic release timing.
+    """
+
+    def __init__(self, now: float = 0.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_document(duration: int, energy: float, cost: int, session_id: int = 1, topic: str = "topic") -> dict:
+    return {
+        "timestamp": "2023-12-18 18:38:31",
+        "topic": topic,
+        "payload": {
+            "session_id": session_id,
+            "energy_delivered_in_kWh": energy,
+            "duration_in_seconds": duration,
+            "session_cost_in_cents": cost,
+        },
+    }
+
+
+def test_interval_deltas_and_running_statistics():
+    """
+    Test that deltas, power and running statistics are derived from consecutive cumulative counters.
+    """
+    engine = SessionDerivationEngine(reorder_window=0)
+    first, = engine.push(make_document(0, 0.0, 0))
+    second, = engine.push(make_document(60, 0.2, 10))
+    third, = engine.push(make_document(120, 0.6, 30))
+
+    assert "interval_seconds" not in first["derived"]
+    assert second["derived"]["interval_seconds"] == 60
+    assert second["derived"]["interval_energy_kWh"] == pytest.approx(0.2)
+    assert second["derived"]["interval_cost_in_cents"] == 10
+    assert second["derived"]["power_kW"] == pytest.approx(12.0)
+    assert third["derived"]["power_kW"] == pytest.approx(24.0)
+    assert third["derived"]["samples"] == 2
+    assert third["derived"]["mean_power_kW"] == pytest.approx(18.0)
+    assert third["derived"]["stddev_power_kW"] == pytest.approx(6.0)
+    assert third["derived"]["max_power_kW"] == pytest.approx(24.0)
+    assert not any(third["derived"][flag] for flag in ("counter_reset", "regression", "late", "reordered"))
+
+
+def test_sessions_are_tracked_independently():
+    engine = SessionDerivationEngine(reorder_window=0)
+    engine.push(make_document(0, 0.0, 0, session_id=1))
+    engine.push(make_document(0, 5.0, 0, session_id=2))
+    engine.push(make_document(0, 9.0, 0, session_id=1, topic="other"))
+    released, = engine.push(make_document(60, 5.1, 3, session_id=2))
+
+    assert released["derived"]["interval_energy_kWh"] == pytest.approx(0.1)
+    assert len(engine) == 3
+
+
+def test_reorder_window_restores_order():
+    """
+    Test that messages swapped in transit are released in duration order with correct deltas.
+    """
+    engine = SessionDerivationEngine(reorder_window=2, clock=FakeClock())
+    released = []
+    for duration, energy in ((0, 0.0), (120, 0.4), (60, 0.2), (180, 0.6)):
+        released.extend(engine.push(make_document(duration, energy, 0)))
+    released.extend(engine.flush())
+
+    assert [doc["payload"]["duration_in_seconds"] for doc in released] == [0, 60, 120, 180]
+    assert [doc["derived"].get("power_kW") for doc in released[1:]] == [pytest.approx(12.0)] * 3
+    assert [doc["derived"]["reordered"] for doc in released] == [False, True, False, False]
+
+
+def test_held_messages_are_released_after_max_delay():
+    clock = FakeClock()
+    engine = SessionDerivationEngine(reorder_window=5, max_delay=2, clock=clock)
+    assert engine.push(make_document(0, 0.0, 0)) == []
+    clock.now = 1
+    assert engine.push(make_document(60, 0.2, 0, session_id=2)) == []
+
+    clock.now = 2
+    assert [doc["payload"]["session_id"] for doc in engine.release_expired()] == [1]
+    clock.now = 3
+    assert [doc["payload"]["session_id"] for doc in engine.release_expired()] == [2]
+    assert engine.flush() == []
+
+
+def test_late_message_does_not_corrupt_session_state():
+    """
+    Test that a message older than one already released is flagged and skipped for deltas.
+    """
+    engine = SessionDerivationEngine(reorder_window=0)
+    engine.push(make_document(0, 0.0, 0))
+    engine.push(make_document(120, 0.4, 20))
+    late, = engine.push(make_document(60, 0.2, 10))
+    following, = engine.push(make_document(180, 0.6, 30))
+
+    assert late["derived"]["late"] and late["derived"]["reordered"]
+    assert "interval_seconds" not in late["derived"]
+    assert following["derived"]["interval_seconds"] == 60
+    assert following["derived"]["interval_energy_kWh"] == pytest.approx(0.2)
+
+
+def test_counter_reset_and_regression_are_flagged():
+    engine = SessionDerivationEngine(reorder_window=0)
+    engine.push(make_document(0, 0.0, 0))
+    engine.push(make_document(3600, 10.0, 500))
+    regression, = engine.push(make_document(3660, 9.5, 505))
+    first, = engine.push(make_document(60, 0.3, 15))
+    reset, = engine.push(make_document(120, 0.6, 30))
+
+    assert regression["derived"]["regression"]
+    assert "power_kW" not in regression["derived"]
+    assert first["derived"]["late"] and not first["derived"]["counter_reset"]
+    assert reset["derived"]["counter_reset"]
+    assert reset["derived"]["interval_seconds"] == 60
+    assert reset["derived"]["power_kW"] == pytest.approx(18.0)
+    assert reset["derived"]["samples"] == 1
+
+
+def test_restart_shortly_after_start_is_a_counter_reset():
+    """
+    Test that a session restarting at zero is a counter reset at once, while a single straggler is still
+    flagged as late.
+    """
+    engine = SessionDerivationEngine(reorder_window=0)
+    for duration in range(0, 300, 60):
+        engine.push(make_document(duration, duration / 300, duration // 6))
+    straggler, = engine.push(make_document(180, 0.6, 30))
+    restarted = [engine.push(make_document(duration, duration / 300, duration // 6))[0] for duration in (0, 60, 120)]
+
+    assert straggler["derived"]["late"] and not straggler["derived"]["counter_reset"]
+    assert restarted[0]["derived"]["counter_reset"]
+    assert not any(doc["derived"]["late"] for doc in restarted)
+    assert [doc["derived"]["interval_seconds"] for doc in restarted] == [0, 60, 60]
+    assert restarted[2]["derived"]["power_kW"] == pytest.approx(12.0)
+
+
+def test_straggler_several_intervals_late_keeps_the_session_state():
+    engine = SessionDerivationEngine(reorder_window=0)
+    for duration in range(0, 300, 60):
+        engine.push(make_document(duration, duration / 300, duration // 6))
+    straggler, = engine.push(make_document(120, 0.4, 20))
+    following, = engine.push(make_document(300, 1.0, 50))
+
+    assert straggler["derived"]["late"] and not straggler["derived"]["counter_reset"]
+    assert not following["derived"]["counter_reset"]
+    assert following["derived"]["interval_seconds"] == 60
+    assert following["derived"]["power_kW"] == pytest.approx(12.0)
+    assert following["derived"]["samples"] == 5
+
+
+def test_idle_sessions_are_evicted():
+    clock = FakeClock()
+    engine = SessionDerivationEngine(reorder_window=0, session_ttl=10, clock=clock)
+    engine.push(make_document(0, 0.0, 0, session_id=1))
+    clock.now = 5
+    engine.push(make_document(0, 0.0, 0, session_id=2))
+    clock.now = 12
+    engine.push(make_document(0, 0.0, 0, session_id=3))
+
+    assert len(engine) == 2
@@ -0,0 +1,116 @@
+import random
+import threading
+import pytest
+from unittest.mock import Mock, patch
+from app.services.simulator_scheduler import SimulatorScheduler, build_simulator_scheduler
+from app.config import Config
+
+
+class FakeClock:
+    """
+    A manually advanced clock for deterministic scheduling tests.
+    """
+
+    def __init__(self, now: float = 0.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_simulator(session_id: int = 1) -> Mock:
+    simulator = Mock()
+    simulator.simulate_energy_session_payload.return_value = {"session_id": session_id}
+    return simulator
+
+
+def test_sessions_fire_on_their_own_intervals():
+    """
+    Test that several sessions with different intervals are interleaved on one scheduler.
+    """
+    clock = FakeClock()
+    scheduler = SimulatorScheduler(clock=clock)
+    scheduler.add(make_simulator(1), "topic/1", interval=10)
+    scheduler.add(make_simulator(2), "topic/2", interval=25)
+
+    fired = []
+    for now in range(0, 51, 5):
+        clock.now = now
+        fired.extend((now, topic) for topic, _ in scheduler.run_due())
+
+    assert fired == [(0, "topic/1"), (0, "topic/2"), (10, "topic/1"), (20, "topic/1"),
+                     (25, "topic/2"), (30, "topic/1"), (40, "topic/1"), (50, "topic/2"), (50, "topic/1")]
+
+
+def test_jitter_does_not_accumulate_drift():
+    """
+    Test that jittered publishes stay anchored to the nominal interval grid.
+    """
+    clock = FakeClock()
+    scheduler = SimulatorScheduler(clock=clock, rng=random.Random(42))
+    session = scheduler.add(make_simulator(), "topic", interval=10, jitter=3)
+
+    fire_times = []
+    while len(fire_times) < 100:
+        clock.now += scheduler.seconds_until_next()
+        fire_times.extend(clock.now for _ in scheduler.run_due())
+
+    assert all(abs(t - 10 * i) <= 3 for i, t in enumerate(fire_times))
+    assert session.nominal_due == 1000
+
+
+def test_catch_up_is_bounded_after_stall():
+    """
+    Test that a long stall only replays max_catch_up missed publishes and realigns to the grid.
+    """
+    clock = FakeClock()
+    scheduler = SimulatorScheduler(max_catch_up=2, clock=clock)
+    session = scheduler.add(make_simulator(), "topic", interval=10)
+    scheduler.run_due()
+
+    clock.now = 95  # Ticks at 10..90 were missed
+    assert len(scheduler.run_due()) == 3
+    assert session.nominal_due == 100
+    assert scheduler.seconds_until_next() == 5
+
+
+def test_invalid_interval():
+    scheduler = SimulatorScheduler()
+    with pytest.raises(ValueError):
+        scheduler.add(make_simulator(), "topic", interval=0)
+
+
+def test_run_blocking_stops_promptly():
+    """
+    Test that setting the stop event ends the blocking runner without waiting for the next interval.
+    """
+    scheduler = SimulatorScheduler()
+    scheduler.add(make_simulator(), "topic", interval=3600)
+    publish = Mock()
+    stop_event = threading.Event()
+
+    runner = threading.Thread(target=scheduler.run_blocking, args=(publish, stop_event))
+    runner.start()
+    stop_event.set()
+    runner.join(timeout=1)
+
+    assert not runner.is_alive()
+
+
+def test_build_scheduler_staggers_sessions():
+    with patch.object(Config, 'SIMULATOR_ENABLED', True), \
+            patch.object(Config, 'SIMULATOR_SESSIONS', 4), \
+            patch.object(Config, 'SIMULATOR_INTERVAL_SECONDS', 60.0), \
+            patch.object(Config, 'SIMULATOR_TOPIC_TEMPLATE', "charger/{session_id}/connector/1/session/1"):
+        scheduler = build_simulator_scheduler("default/topic")
+
+    assert len(scheduler) == 4
+    due = scheduler.run_due(scheduler.clock() + 59)
+    assert [topic for topic, _ in due] == ["charger/1/connector/1/session/1", "charger/2/connector/1/session/1",
+                                           "charger/3/connector/1/session/1", "charger/4/connector/1/session/1"]
+    assert [payload["session_id"] for _, payload in due] == [1, 2, 3, 4]
+
+
+def test_build_scheduler_disabled():
+    with patch.object(Config, 'SIMULATOR_ENABLED', False):
+        assert build_simulator_scheduler("default/topic") is None
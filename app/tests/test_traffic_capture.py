@@ -0,0 +1,186 @@
+import json
+import pytest
+from unittest.mock import Mock, patch
+from paho.mqtt.client import MQTTMessage
+from app.services.mqtt_client import MQTTClient
+from app.services.traffic_capture import (CAPTURE_MAGIC, CaptureFormatError, CapturedMessage, TrafficRecorder,
+                                          read_capture, replay, to_mqtt_message)
+
+
+class FakeClock:
+    """
+    A clock that only advances when the replay sleeps or a delivery takes time.
+    """
+
+    def __init__(self) -> None:
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+def make_message(topic: bytes = b"charger/1/connector/1/session/1", payload: bytes = b"{}", qos: int = 0,
+                 retain: bool = False) -> MQTTMessage:
+    message = MQTTMessage(topic=topic)
+    message.payload = payload
+    message.qos = qos
+    message.retain = retain
+    return message
+
+
+def test_record_and_read_round_trip(tmp_path):
+    path = str(tmp_path / "capture.bin")
+    recorder = TrafficRecorder(path)
+    recorder.record(make_message(payload=b'{"a": 1}', qos=1), received_at=10.5)
+    recorder.record(make_message(topic=b"other", payload=b"\xff\x00", qos=2, retain=True), received_at=11.0)
+    recorder.close()
+    # Reopening appends instead of writing a second header
+    recorder = TrafficRecorder(path)
+    recorder.record(make_message(), received_at=12.0)
+    recorder.close()
+
+    assert list(read_capture(path)) == [
+        CapturedMessage(10.5, b"charger/1/connector/1/session/1", b'{"a": 1}', 1, False),
+        CapturedMessage(11.0, b"other", b"\xff\x00", 2, True),
+        CapturedMessage(12.0, b"charger/1/connector/1/session/1", b"{}", 0, False),
+    ]
+    message = to_mqtt_message(CapturedMessage(11.0, b"other", b"\xff\x00", 2, True))
+    assert (message.topic, message.payload, message.qos, message.retain) == ("other", b"\xff\x00", 2, True)
+
+
+def test_truncated_record_is_skipped(tmp_path):
+    path = tmp_path / "capture.bin"
+    recorder = TrafficRecorder(str(path))
+    recorder.record(make_message(), received_at=1.0)
+    recorder.record(make_message(payload=b"x" * 100), received_at=2.0)
+    recorder.close()
+    path.write_bytes(path.read_bytes()[:-10])
+
+    assert [message.received_at for message in read_capture(str(path))] == [1.0]
+
+
+def test_not_a_capture(tmp_path):
+    path = tmp_path / "capture.bin"
+    path.write_bytes(b"something else")
+    with pytest.raises(CaptureFormatError):
+        list(read_capture(str(path)))
+
+
+def test_recording_stops_at_max_bytes(tmp_path):
+    path = tmp_path / "capture.bin"
+    recorder = TrafficRecorder(str(path), max_bytes=100)
+    for _ in range(10):
+        recorder.record(make_message(payload=b"x" * 20))
+    recorder.close()
+
+    assert recorder.recorded == 1
+    assert path.stat().st_size <= 100 and path.read_bytes().startswith(CAPTURE_MAGIC)
+
+
+def test_replay_paces_messages_and_measures_lag():
+    """
+    Test that messages are delivered at their original spacing divided by the speed, and that slow
+    deliveries show up as lag.
+    """
+    clock = FakeClock()
+    delivered = []
+
+    def deliver(message):
+        delivered.append((clock.now, message.payload))
+        clock.now += 0.5 if message.payload == b"slow" else 0.0
+
+    messages = [CapturedMessage(t, b"topic", payload, 0, False)
+                for t, payload in ((0.0, b"a"), (2.0, b"slow"), (2.2, b"b"), (6.0, b"c"))]
+    report = replay(messages, deliver, speed=2.0, clock=clock, sleep=clock.sleep)
+
+    assert delivered == [(100.0, b"a"), (101.0, b"slow"), (101.5, b"b"), (103.0, b"c")]
+    assert (report.messages, report.capture_seconds, report.seconds) == (4, 6.0, 3.0)
+    assert report.lag["count"] == 4 and report.lag["max_us"] == pytest.approx(500_000, rel=0.01)
+    assert report.latency["max_us"] == pytest.approx(500_000, rel=0.01)
+
+
+def test_replay_at_max_speed_does_not_sleep():
+    sleep = Mock()
+    messages = [CapturedMessage(t, b"topic", b"{}", 0, False) for t in (0.0, 60.0, 120.0)]
+    report = replay(messages, Mock(), speed=None, sleep=sleep)
+
+    sleep.assert_not_called()
+    assert report.messages == 3 and report.lag is None
+    assert "msg/s" in report.format()
+
+
+def test_on_message_records_before_validation(tmp_path):
+    """
+    Test that the client records every received message, including ones that fail validation.
+    """
+    path = str(tmp_path / "capture.bin")
+    with patch('app.services.mqtt_client.DatabaseClient'), \
+            patch('app.services.mqtt_client.Config.CAPTURE_PATH', path):
+        mqtt_client = MQTTClient("broker.test", 1883, "test/topic")
+        mqtt_client.open_recorder()
+        mqtt_client.on_message(mqtt_client.client, None, make_message(payload=b"not json"))
+        mqtt_client.on_message(mqtt_client.client, None, make_message(payload=json.dumps({
+            "session_id": 1, "energy_delivered_in_kWh": 1.0, "duration_in_seconds": 60, "session_cost_in_cents": 5
+        }).encode()))
+        mqtt_client.close_recorder()
+
+    assert [message.payload[:8] for message in read_capture(path)] == [b"not json", b'{"sessio']
+
+
+def test_reopening_after_a_crash_truncates_the_partial_record(tmp_path):
+    """
+    Test that new records are appended after the last complete record, not after a partial one.
+    """
+    path = tmp_path / "capture.bin"
+    recorder = TrafficRecorder(str(path))
+    recorder.record(make_message(payload=b"one"), received_at=1.0)
+    recorder.record(make_message(payload=b"two" * 10), received_at=2.0)
+    recorder.close()
+    path.write_bytes(path.read_bytes()[:-7])
+
+    recorder = TrafficRecorder(str(path))
+    for received_at, payload in ((3.0, b"three"), (4.0, b"four"), (5.0, b"five")):
+        recorder.record(make_message(payload=payload), received_at=received_at)
+    recorder.close()
+
+    assert [message.payload for message in read_capture(str(path))] == [b"one", b"three", b"four", b"five"]
+
+
+def test_reopening_a_partial_header_starts_over(tmp_path):
+    path = tmp_path / "capture.bin"
+    path.write_bytes(CAPTURE_MAGIC[:3])
+    recorder = TrafficRecorder(str(path))
+    recorder.record(make_message(), received_at=1.0)
+    recorder.close()
+
+    assert [message.received_at for message in read_capture(str(path))] == [1.0]
+
+
+def test_recorder_refuses_other_files(tmp_path):
+    path = tmp_path / "capture.bin"
+    path.write_bytes(b"something else")
+    with pytest.raises(CaptureFormatError):
+        TrafficRecorder(str(path))
+    assert path.read_bytes() == b"something else"
+
+
+def test_capture_failure_stops_recording_not_ingest(tmp_path, caplog):
+    """
+    Test that an error writing the capture, e.g. a full disk, turns recording off and the message is still
+    stored, instead of the error propagating into paho's network loop.
+    """
+    with patch('app.services.mqtt_client.DatabaseClient'), \
+            patch('app.services.mqtt_client.Config.CAPTURE_PATH', str(tmp_path / "capture.bin")):
+        mqtt_client = MQTTClient("broker.test", 1883, "test/topic")
+        mqtt_client.open_recorder()
+    mqtt_client.recorder.record = Mock(side_effect=OSError(28, "No space left on device"))
+    mqtt_client.on_message(mqtt_client.client, None, make_message(payload=json.dumps({
+        "session_id": 1, "energy_delivered_in_kWh": 1.0, "duration_in_seconds": 60, "session_cost_in_cents": 5
+    }).encode()))
+
+    assert mqtt_client.recorder is None
+    assert "recording stopped" in caplog.text
+    mqtt_client.db_client.save_message.assert_called_once()
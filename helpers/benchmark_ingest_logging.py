@@ -0,0 +1,124 @@
+"""
+Benchmark of MQTT ingest throughput with per-message logging on and off.
+
+Feeds synthetic messages straight into MQTTClient.on_message with a database stub that discards writes and compares:
+    off         per-message logger disabled
+    sync        the previous setup: the message serialized to a string on every message, synchronous StreamHandler
+    queued      queue-backed logging, every message logged
+    sampled     queue-backed logging with LOG_MESSAGE_SAMPLE_RATE=0.01
+Each mode runs twice: writing to os.devnull, and writing to a sink where every write blocks for
+--sink-latency-us microseconds, like a pipe to a busy container log driver.
+
+Usage:
+    python -m helpers.benchmark_ingest_logging --messages 50000 --sink-latency-us 50
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from unittest.mock import patch
+from paho.mqtt.client import MQTTMessage
+from app.config import Config
+from app.logging_config import configure_logging, shutdown_logging
+from app.services.mqtt_client import MQTTClient
+
+
+class SyncLoggingMQTTClient(MQTTClient):
+    """
+    MQTTClient with the per-message log line it had before queue-backed logging.
+    """
+
+    def log_received(self, document):
+        self.logger.info(f"Received message: {json.dumps(document, default=str)}")
+
+
+class NullDatabaseClient:
+    """
+    Stand-in for DatabaseClient that discards writes, so only ingest and logging are measured.
+    """
+
+    def save_message(self, message):
+        pass
+
+
+class SlowSink:
+    """
+    A stream whose writes block for a fixed time, releasing the GIL like a real blocking write would.
+    """
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+
+    def write(self, text: str) -> None:
+        time.sleep(self.latency)
+
+    def flush(self) -> None:
+        pass
+
+
+def make_messages(count: int):
+    messages = []
+    for index in range(count):
+        message = MQTTMessage(topic=b"charger/1/connector/1/session/1")
+        message.payload = json.dumps({
+            "session_id": 1,
+            "energy_delivered_in_kWh": index / 100,
+            "duration_in_seconds": index,
+            "session_cost_in_cents": index * 2
+        }).encode()
+        messages.append(message)
+    return messages
+
+
+def run(client_class, messages) -> float:
+    with patch("app.services.mqtt_client.DatabaseClient", NullDatabaseClient):
+        client = client_class("broker.test", 1883, Config.MQTT_TOPIC)
+    start = time.perf_counter()
+    for message in messages:
+        client.on_message(client.client, None, message)
+    elapsed = time.perf_counter() - start
+    return len(messages) / elapsed
+
+
+def run_modes(messages, stream) -> dict:
+    results = {}
+    with patch.object(Config, "LOG_MESSAGE_LEVEL", "WARNING"):
+        configure_logging(stream)
+        results["off"] = run(MQTTClient, messages)
+
+    shutdown_logging()
+    root = logging.getLogger()
+    queue_handlers = root.handlers
+    root.handlers = [logging.StreamHandler(stream)]
+    results["sync"] = run(SyncLoggingMQTTClient, messages)
+    root.handlers = queue_handlers
+
+    configure_logging(stream)
+    results["queued"] = run(MQTTClient, messages)
+
+    with patch.object(Config, "LOG_MESSAGE_SAMPLE_RATE", 0.01):
+        configure_logging(stream)
+        results["sampled"] = run(MQTTClient, messages)
+    shutdown_logging()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=50_000)
+    parser.add_argument("--sink-latency-us", type=float, default=50)
+    args = parser.parse_args()
+    messages = make_messages(args.messages)
+
+    with open(os.devnull, "w") as devnull:
+        fast = run_modes(messages, devnull)
+    slow = run_modes(messages, SlowSink(args.sink_latency_us / 1e6))
+
+    print(f"{'logging':>8} {'devnull msg/s':>14} {'slow sink msg/s':>16}")
+    for name in fast:
+        print(f"{name:>8} {fast[name]:>14.0f} {slow[name]:>16.0f}")
+
+
+if __name__ == "__main__":
+    main()
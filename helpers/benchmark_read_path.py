@@ -0,0 +1,76 @@
+"""
+Benchmark of the GET /api/v1/messages serialization path.
+
+Compares the previous path (LogEntry(**doc).model_dump(by_alias=True), then FastAPI's response_model validation
+and JSON rendering) against the trusted path (orjson.dumps straight from the Mongo documents). Documents are
+generated in memory so the numbers exclude database and network time.
+
+Usage:
+    python -m helpers.benchmark_read_path --sizes 10000 1000000
+"""
+import argparse
+import asyncio
+import gc
+import random
+import time
+from typing import Callable, Dict, List
+import orjson
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from app.models.mqtt_model import LogEntry
+
+response_field = create_response_field(name="Response_Get_All_Messages", type_=List[LogEntry])
+
+
+def generate_documents(count: int) -> List[Dict]:
+    """
+    Generates documents shaped like the ones stored by the ingest path.
+    """
+    rng = random.Random(0)
+    return [{
+        "_id": ObjectId(),
+        "timestamp": "2023-12-18 18:38:31",
+        "topic": f"charger/{rng.randint(1, 50)}/connector/1/session/1",
+        "payload": {
+            "session_id": rng.randint(1, 1000),
+            "energy_delivered_in_kWh": round(rng.random() * 50, 2),
+            "duration_in_seconds": rng.randint(0, 36000),
+            "session_cost_in_cents": rng.randint(0, 5000)
+        }
+    } for _ in range(count)]
+
+
+def previous_path(documents: List[Dict]) -> bytes:
+    content = [LogEntry(**document).model_dump(by_alias=True) for document in documents]
+    validated = asyncio.run(serialize_response(field=response_field, response_content=content, is_coroutine=False))
+    return JSONResponse(validated).body
+
+
+def trusted_path(documents: List[Dict]) -> bytes:
+    return orjson.dumps(documents, default=str)
+
+
+def measure(path: Callable[[List[Dict]], bytes], documents: List[Dict]) -> float:
+    gc.collect()
+    start = time.perf_counter()
+    path(documents)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'documents':>10} {'previous (s)':>13} {'trusted (s)':>12} {'speedup':>8}")
+    for size in args.sizes:
+        documents = generate_documents(size)
+        previous = measure(previous_path, documents)
+        trusted = measure(trusted_path, documents)
+        print(f"{size:>10} {previous:>13.3f} {trusted:>12.3f} {previous / trusted:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
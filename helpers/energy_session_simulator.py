@@ -4,8 +4,8 @@ from typing import Dict, Any
 
 
 class EnergySessionSimulator:
-    def __init__(self):
-        self.session_id = 1
+    def __init__(self, session_id: int = 1):
+        self.session_id = session_id
         self.start_time = time.time()
         self.cumulative_duration = 0
         self.cumulative_energy = 0
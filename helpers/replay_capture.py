@@ -0,0 +1,142 @@
+"""
+Replays a traffic capture recorded with CAPTURE_PATH, for reproducing incidents and load testing.
+
+Targets:
+    broker      publish every message to an MQTT broker, with its original topic, QoS and retain flag
+    ingest      feed every message straight into MQTTClient.on_message, without a broker
+With --discard the ingest target skips database writes, so only the ingest path itself is measured.
+
+--speed 1 replays with the original timing, --speed 10 ten times faster and --speed max back to back.
+The report shows the achieved throughput, how long each message took to deliver and, unless replaying at
+maximum speed, how far behind the original schedule each delivery completed. For the ingest target delivery
+is the whole ingest path. For the broker target it is only handing the message to paho, so the broker target
+also subscribes to "#" and reports the round trip from publishing each message to receiving it back.
+
+Usage:
+    python -m helpers.replay_capture capture.bin --target broker --broker localhost --port 1883 --speed 10
+    python -m helpers.replay_capture capture.bin --target ingest --speed max --discard
+"""
+import argparse
+import collections
+import threading
+import time
+import paho.mqtt.client as mqtt
+from app.config import Config
+from app.services.ingest_profiler import StageHistogram
+from app.services.mqtt_client import MQTTClient
+from app.services.traffic_capture import read_capture, replay, to_mqtt_message
+
+# How long to wait for the subscription and for the last replayed messages to come back
+ROUND_TRIP_TIMEOUT_SECONDS = 10
+
+
+class NullDatabaseClient:
+    """
+    Stand-in for DatabaseClient that discards writes, so only the ingest path is measured.
+    """
+
+    def save_message(self, message):
+        pass
+
+    def save_messages(self, messages):
+        return len(messages)
+
+
+class RoundTripTracker:
+    """
+    Matches messages received back from the broker to the publishes that sent them, by topic and payload.
+    Messages that weren't published by the replay, such as retained messages or other traffic, are ignored.
+    """
+
+    def __init__(self) -> None:
+        self.latency = StageHistogram()
+        self._lock = threading.Lock()
+        self._sent = collections.defaultdict(collections.deque)
+        self._outstanding = 0
+        self._done = threading.Condition(self._lock)
+
+    def sent(self, topic: str, payload: bytes) -> None:
+        with self._lock:
+            self._sent[(topic, payload)].append(time.perf_counter())
+            self._outstanding += 1
+
+    def received(self, client, userdata, message) -> None:
+        now = time.perf_counter()
+        with self._lock:
+            pending = self._sent.get((message.topic, message.payload))
+            if not pending:
+                return
+            self.latency.record(int((now - pending.popleft()) * 1e9))
+            self._outstanding -= 1
+            if not self._outstanding:
+                self._done.notify_all()
+
+    def wait(self, timeout: float) -> None:
+        with self._lock:
+            self._done.wait_for(lambda: not self._outstanding, timeout)
+
+
+def parse_speed(value: str):
+    if value == "max":
+        return None
+    speed = float(value)
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("speed must be positive or 'max'")
+    return speed
+
+
+def replay_to_broker(args):
+    tracker = RoundTripTracker()
+    subscribed = threading.Event()
+    client = mqtt.Client()
+    client.on_message = tracker.received
+    client.on_subscribe = lambda *_: subscribed.set()
+    client.on_connect = lambda *_: client.subscribe("#")
+    client.connect(args.broker, args.port, 60)
+    client.loop_start()
+
+    def publish(captured):
+        topic = captured.topic.decode("utf-8")
+        tracker.sent(topic, captured.payload)
+        client.publish(topic, captured.payload, captured.qos, captured.retain)
+
+    try:
+        if not subscribed.wait(ROUND_TRIP_TIMEOUT_SECONDS):
+            raise SystemExit(f"Subscribing to {args.broker}:{args.port} timed out")
+        report = replay(read_capture(args.capture), publish, args.speed)
+        tracker.wait(ROUND_TRIP_TIMEOUT_SECONDS)
+    finally:
+        client.disconnect()
+        client.loop_stop()
+    return report._replace(round_trip=tracker.latency.snapshot())
+
+
+def replay_to_ingest(args):
+    client = MQTTClient(Config.MQTT_BROKER_URL, Config.MQTT_BROKER_PORT, Config.MQTT_TOPIC)
+    if args.discard:
+        client.db_client = NullDatabaseClient()
+
+    def ingest(captured):
+        client.on_message(client.client, None, to_mqtt_message(captured))
+
+    report = replay(read_capture(args.capture), ingest, args.speed)
+    client.store_documents(client.deriver.flush())
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("capture")
+    parser.add_argument("--target", choices=("broker", "ingest"), default="broker")
+    parser.add_argument("--speed", type=parse_speed, default=1.0)
+    parser.add_argument("--broker", default=Config.MQTT_BROKER_URL)
+    parser.add_argument("--port", type=int, default=Config.MQTT_BROKER_PORT)
+    parser.add_argument("--discard", action="store_true")
+    args = parser.parse_args()
+
+    report = replay_to_broker(args) if args.target == "broker" else replay_to_ingest(args)
+    print(report.format())
+
+
+if __name__ == "__main__":
+    main()